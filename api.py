@@ -0,0 +1,258 @@
+# api.py - Veekstar Retail Intelligence (headless KPI API)
+# The dashboard's aggregates as JSON over HTTP, for BI tools and mobile clients:
+#   GET /api/health                   dataset version
+#   GET /api/kpis                     revenue, profit, margin, transactions, avg ticket, units,
+#                                     unique / active customers (HyperLogLog estimates)
+#   GET /api/revenue/<dim>            revenue / profit / margin by region, store, product_category or sales_channel
+#   GET /api/margins                  profit margin by product category
+#   GET /api/monthly                  monthly revenue / profit / transactions
+#   GET /api/forecasts/<name>         outputs/ forecasts: baseline, improvement, segments, yearly_summary
+# Aggregates come from the same rollup cube as the pages (one per dataset
+# version) and accept the sidebar filters as query parameters, e.g.
+#   /api/revenue/store?region=South-West&product_category=Electronics&from=2024-01&to=2024-06
+# Responses are cached per (dataset version, path, query): the body is
+# serialized and gzipped once, carries a version-derived ETag, and
+# If-None-Match requests are answered with 304 before anything is computed.
+# With VEEKSTAR_API_TOKEN set, requests need "Authorization: Bearer <token>".
+#
+# Run: python api.py [--host 0.0.0.0] [--port 8600]
+import os
+import gzip
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from flask import Flask, Response, abort, jsonify, request
+
+from data_store import OUT_DIR, load_master_dataset, load_output_csv, dataset_version, enable_copy_on_write
+from rollups import master_cube, rollup, totals, monthly as cube_monthly, has_dims
+from query_engine import FILTER_DIMS, filter_cube
+import sketches
+import instrumentation
+from instrumentation import cache_result
+
+DIMENSIONS = ['region', 'store', 'product_category', 'sales_channel']
+FORECASTS = {
+    'baseline': 'forecast_baseline.csv',
+    'improvement': 'forecast_improvement.csv',
+    'segments': 'forecast_segments.csv',
+    'yearly_summary': 'forecast_yearly_summary.csv',
+}
+MAX_AGE = 60           # seconds clients / proxies may reuse a response without revalidating
+GZIP_MIN_BYTES = 512
+MAX_RESPONSES = 512
+
+app = Flask(__name__)
+# request threads share the cached master frames (see data_store.enable_copy_on_write)
+enable_copy_on_write()
+
+# -------------------------
+# Response cache
+# -------------------------
+_LOCK = threading.Lock()
+_RESPONSES = OrderedDict()  # (version, path, query) -> (etag, body, gzipped body)
+
+def _etag(key):
+    return 'W/"' + hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:20] + '"'
+
+def _matches(etag):
+    header = request.headers.get("If-None-Match", "")
+    return header.strip() == "*" or etag in [t.strip() for t in header.split(",")]
+
+def cached_json(version, build):
+    """JSON response for this request, built once per (version, path, query).
+    `build()` returns a JSON-serializable payload (or a Response for errors)."""
+    key = (version, request.path, tuple(sorted(request.args.items(multi=True))))
+    etag = _etag(key)
+    if _matches(etag):
+        cache_result("api", True)
+        return _respond(etag, b"", None, status=304)
+    with _LOCK:
+        hit = _RESPONSES.get(key)
+        if hit is not None:
+            _RESPONSES.move_to_end(key)
+    cache_result("api", hit is not None)
+    if hit is None:
+        payload = build()
+        if isinstance(payload, Response):
+            return payload
+        body = json.dumps({"version": version, "data": payload}, separators=(",", ":"),
+                          default=_json_default).encode("utf-8")
+        hit = (etag, body, gzip.compress(body, 6) if len(body) >= GZIP_MIN_BYTES else None)
+        with _LOCK:
+            _RESPONSES[key] = hit
+            while len(_RESPONSES) > MAX_RESPONSES:
+                _RESPONSES.popitem(last=False)
+    return _respond(*hit)
+
+def _respond(etag, body, gzipped, status=200):
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={MAX_AGE}", "Vary": "Accept-Encoding"}
+    if status == 200 and gzipped is not None and "gzip" in request.headers.get("Accept-Encoding", ""):
+        body = gzipped
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, status=status, headers=headers, mimetype="application/json" if status == 200 else None)
+
+def _json_default(v):
+    if isinstance(v, (pd.Timestamp, np.datetime64)):
+        return pd.Timestamp(v).isoformat()
+    if isinstance(v, np.integer):
+        return int(v)
+    if isinstance(v, np.floating):
+        return None if np.isnan(v) else float(v)
+    if isinstance(v, np.bool_):
+        return bool(v)
+    return str(v)
+
+def records(df: pd.DataFrame):
+    """DataFrame -> list of dicts with NaN as null."""
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+def clear_cache():
+    with _LOCK:
+        _RESPONSES.clear()
+
+# -------------------------
+# Data
+# -------------------------
+def master_version():
+    _, p = load_master_dataset(columns=['date'])
+    return None if p is None else dataset_version(p)
+
+def request_filters():
+    """Sidebar-style filters from the query string: repeated or comma-separated dim
+    values, plus from/to months (YYYY-MM, inclusive) for the date range."""
+    filters = {}
+    for dim in FILTER_DIMS:
+        values = [v for arg in request.args.getlist(dim) for v in arg.split(",") if v]
+        if values:
+            filters[dim] = values
+    start, end = request.args.get("from"), request.args.get("to")
+    if start or end:
+        try:
+            filters['date'] = (pd.Timestamp(start) if start else None,
+                               pd.Timestamp(end) + pd.offsets.MonthBegin(1) if end else None)
+        except ValueError:
+            abort(400, description="from / to must be dates such as 2024-01")
+    return filters
+
+def filtered_cube():
+    cube = master_cube()
+    if cube is None:
+        abort(503, description="Master dataset not found")
+    return filter_cube(cube, request_filters())
+
+def with_margin(df: pd.DataFrame):
+    if 'profit' in df.columns:
+        df['margin_pct'] = (df['profit'] / df['revenue'].where(df['revenue'] != 0) * 100).round(2)
+    return df
+
+# -------------------------
+# Auth + errors
+# -------------------------
+@app.before_request
+def check_token():
+    token = os.environ.get("VEEKSTAR_API_TOKEN")
+    if token and request.path != "/api/health" and request.headers.get("Authorization") != f"Bearer {token}":
+        abort(401, description="Missing or invalid bearer token")
+
+@app.errorhandler(400)
+@app.errorhandler(401)
+@app.errorhandler(404)
+@app.errorhandler(503)
+def json_error(e):
+    return jsonify(error=e.name, detail=e.description), e.code
+
+# -------------------------
+# Routes
+# -------------------------
+@app.get("/api/health")
+def health():
+    return jsonify(status="ok", version=master_version())
+
+@app.get("/api/kpis")
+def kpis():
+    def build():
+        cube = filtered_cube()
+        if cube.empty:
+            return {"transactions": 0}
+        tot = totals(cube)
+        out = {"revenue": tot['revenue'], "transactions": int(tot['transactions']),
+               "avg_ticket": tot['revenue_mean']}
+        if 'profit' in tot:
+            out.update(profit=tot['profit'],
+                       margin_pct=round(tot['profit'] / tot['revenue'] * 100, 2) if tot['revenue'] else None)
+        if 'units_sold' in tot:
+            out["units_sold"] = int(tot['units_sold'])
+        if 'month' in cube.columns:
+            out.update(first_month=cube['month'].min(), last_month=cube['month'].max())
+        customers = sketches.customer_counts(sketches.master_sketches(), request_filters())
+        if customers is not None:
+            out.update(unique_customers=customers['unique'], active_customers=customers.get('active'))
+        return out
+    with instrumentation.span("api.kpis"):
+        return cached_json(master_version(), build)
+
+@app.get("/api/revenue/<dim>")
+def revenue_by(dim):
+    if dim not in DIMENSIONS:
+        abort(404, description=f"Unknown dimension; use one of {', '.join(DIMENSIONS)}")
+    def build():
+        cube = filtered_cube()
+        if not has_dims(cube, dim):
+            abort(404, description=f"'{dim}' is not in the dataset")
+        cols = [c for c in [dim, 'revenue', 'profit', 'units_sold', 'transactions'] if c in cube.columns]
+        out = rollup(cube, dim)[cols].sort_values('revenue', ascending=False)
+        return records(with_margin(out))
+    with instrumentation.span("api.revenue"):
+        return cached_json(master_version(), build)
+
+@app.get("/api/margins")
+def margins():
+    def build():
+        cube = filtered_cube()
+        if not has_dims(cube, 'product_category', 'profit'):
+            abort(404, description="Margins need 'product_category' and 'profit'")
+        out = rollup(cube, 'product_category')[['product_category', 'revenue', 'profit']]
+        return records(with_margin(out).sort_values('margin_pct', ascending=False))
+    with instrumentation.span("api.margins"):
+        return cached_json(master_version(), build)
+
+@app.get("/api/monthly")
+def monthly():
+    def build():
+        cube = filtered_cube()
+        if 'month' not in cube.columns or cube.empty:
+            return []
+        cols = [c for c in ['month', 'revenue', 'profit', 'units_sold', 'transactions'] if c in cube.columns]
+        return records(with_margin(cube_monthly(cube)[cols]))
+    with instrumentation.span("api.monthly"):
+        return cached_json(master_version(), build)
+
+@app.get("/api/forecasts/<name>")
+def forecasts(name):
+    if name not in FORECASTS:
+        abort(404, description=f"Unknown forecast; use one of {', '.join(FORECASTS)}")
+    path = OUT_DIR / FORECASTS[name]
+    if not path.exists():
+        abort(404, description=f"{FORECASTS[name]} has not been generated (run forecast_pipeline.py)")
+    def build():
+        df = load_output_csv(FORECASTS[name])
+        if df is None:
+            abort(503, description=f"{FORECASTS[name]} could not be parsed")
+        return records(df)
+    with instrumentation.span("api.forecasts"):
+        return cached_json(dataset_version(path), build)
+
+# -------------------------
+# CLI
+# -------------------------
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Veekstar KPI API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    args = parser.parse_args()
+    app.run(host=args.host, port=args.port, threaded=True)
@@ -5,7 +5,6 @@ from pathlib import Path
 import yaml
 from yaml.loader import SafeLoader
 import streamlit_authenticator as stauth
-import importlib.util
 # ---------------------------
 #  Paths
 # ---------------------------
@@ -27,17 +26,12 @@ st.set_page_config(page_title="Veekstar Retail Intelligence", page_icon="💫",
 # -----------------------------------------------
 # Login Page Styling + Background (Veekstar Gold Glow)
 # -----------------------------------------------
-import base64
-from pathlib import Path
-
-# Path to your background image
-BG_IMAGE = Path(__file__).resolve().parent / "assets" / "bg_retail.jpg"
+from asset_pipeline import background_url
 
-# Safely embed the background image in base64
-if BG_IMAGE.exists():
-    with open(BG_IMAGE, "rb") as img_file:
-        b64_img = base64.b64encode(img_file.read()).decode()
-    bg_css = f"background: linear-gradient(120deg, rgba(0,0,0,0.92), rgba(12,8,2,0.75)), url('data:image/jpeg;base64,{b64_img}');"
+# Background is a fingerprinted static file (built by asset_pipeline.py), not a per-rerun data URI
+bg_url = background_url()
+if bg_url:
+    bg_css = f"background: linear-gradient(120deg, rgba(0,0,0,0.92), rgba(12,8,2,0.75)), url('{bg_url}');"
 else:
     bg_css = "background: linear-gradient(120deg, rgba(0,0,0,0.92), rgba(12,8,2,0.75));"
 
@@ -179,18 +173,16 @@ if "mobile_logout" in st.session_state and st.session_state["mobile_logout"]:
 # ---------------------------
 if authentication_status:
     st.sidebar.success(f"Welcome, {name or username} 👑")
+    st.session_state["is_admin"] = username in (config.get("admins") or [])
     authenticator.logout("Logout", "sidebar")
 
-    dashboard_path = BASE / "dashboard_main.py"
-    if dashboard_path.exists():
-      spec = importlib.util.spec_from_file_location("dashboard_main", dashboard_path)
-      dashboard = importlib.util.module_from_spec(spec)
-# make authenticator available inside dashboard_main as a global variable
-      dashboard.authenticator = authenticator
-      spec.loader.exec_module(dashboard)
-
+    # Imported once per process (Python caches the module); each rerun only renders
+    try:
+        import dashboard_main
+    except ImportError as e:
+        st.error(f"❌ Dashboard module could not be loaded: {e}")
     else:
-        st.error("❌ Dashboard file not found (dashboard_main.py missing).")
+        dashboard_main.main()
 elif authentication_status is False:
     st.error("❌ Incorrect username or password.")
 else:
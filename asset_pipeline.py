@@ -0,0 +1,168 @@
+# asset_pipeline.py - Veekstar Retail Intelligence (static asset build)
+# Builds the front-end assets once instead of base64-encoding them on every rerun:
+#   assets/bg_retail.jpg -> resized, compressed WebP (desktop + mobile) and a
+#   progressive JPEG fallback with content-hash file names in static/
+# static/ is served by Streamlit (server.enableStaticServing in .streamlit/config.toml)
+# at app/static/<file>; URLs carry ?v=<hash>, so the browser caches them for good.
+#
+# Run: python asset_pipeline.py [--force]
+import re
+import json
+import base64
+import hashlib
+import argparse
+import threading
+from io import BytesIO
+from pathlib import Path
+
+try:
+    from PIL import Image, features
+except Exception:  # Pillow ships with streamlit; without it the source image is copied as-is
+    Image = features = None
+
+BASE = Path(__file__).resolve().parent
+ASSETS_DIR = BASE / "assets"
+STATIC_DIR = BASE / "static"
+MANIFEST_PATH = STATIC_DIR / "asset_manifest.json"
+STATIC_URL = "app/static"
+
+BACKGROUND = ASSETS_DIR / "bg_retail.jpg"
+# logical name -> (max width, format, quality)
+IMAGE_VARIANTS = {
+    "bg_retail.webp": (1200, "WEBP", 60),
+    "bg_retail_mobile.webp": (640, "WEBP", 55),
+    "bg_retail.jpg": (1200, "JPEG", 70),
+}
+
+# -------------------------
+# Minifier (conservative: comments + whitespace only)
+# -------------------------
+def minify_css(text):
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([{};,>])\s*", r"\1", text)
+    text = re.sub(r":\s+", ":", text)
+    return text.replace(";}", "}").strip()
+
+# -------------------------
+# Build
+# -------------------------
+def content_hash(data: bytes):
+    return hashlib.sha1(data).hexdigest()[:10]
+
+def fingerprint(name, data: bytes):
+    stem, ext = name.rsplit(".", 1)
+    return f"{stem}.{content_hash(data)}.{ext}"
+
+def static_url(fname):
+    # ?v= makes Tornado's static handler send a far-future Cache-Control
+    return f"{STATIC_URL}/{fname}?v={fname.rsplit('.', 2)[1]}"
+
+def encode_image(src: Path, max_width, fmt, quality):
+    """Resized + compressed image bytes; None when Pillow can't produce `fmt`."""
+    if Image is None or (fmt == "WEBP" and not features.check("webp")):
+        return None
+    with Image.open(src) as im:
+        im = im.convert("RGB")
+        if im.width > max_width:
+            im = im.resize((max_width, round(im.height * max_width / im.width)), Image.LANCZOS)
+        buf = BytesIO()
+        if fmt == "JPEG":
+            im.save(buf, fmt, quality=quality, optimize=True, progressive=True)
+        else:
+            im.save(buf, fmt, quality=quality, method=6)
+        return buf.getvalue()
+
+def source_hashes():
+    out = {BACKGROUND.relative_to(BASE).as_posix(): content_hash(BACKGROUND.read_bytes())} if BACKGROUND.exists() else {}
+    # variant settings are part of the input too
+    out["variants"] = content_hash(json.dumps(IMAGE_VARIANTS, sort_keys=True).encode())
+    return out
+
+def read_manifest(path: Path = MANIFEST_PATH):
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+
+def build(force=False, out_dir: Path = STATIC_DIR):
+    """Write the fingerprinted assets + manifest; skipped when the sources are unchanged."""
+    sources = source_hashes()
+    manifest_path = out_dir / MANIFEST_PATH.name
+    current = read_manifest(manifest_path)
+    if (not force and current and current.get("sources") == sources
+            and all((out_dir / f).exists() for f in current.get("files", {}).values())):
+        return current, False
+    out_dir.mkdir(parents=True, exist_ok=True)
+    files = {}
+    if BACKGROUND.exists():
+        for name, (width, fmt, quality) in IMAGE_VARIANTS.items():
+            data = encode_image(BACKGROUND, width, fmt, quality)
+            if data is None:
+                continue
+            files[name] = fingerprint(name, data)
+            (out_dir / files[name]).write_bytes(data)
+        if "bg_retail.jpg" not in files:
+            data = BACKGROUND.read_bytes()
+            files["bg_retail.jpg"] = fingerprint("bg_retail.jpg", data)
+            (out_dir / files["bg_retail.jpg"]).write_bytes(data)
+    # drop superseded fingerprinted files from earlier builds
+    if current:
+        for old in set(current.get("files", {}).values()) - set(files.values()):
+            (out_dir / old).unlink(missing_ok=True)
+    current = {"sources": sources, "files": files}
+    tmp = manifest_path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(current, indent=2), encoding="utf-8")
+    tmp.replace(manifest_path)
+    return current, True
+
+# -------------------------
+# Runtime lookup (once per process)
+# -------------------------
+_LOCK = threading.Lock()
+_STATE = {}
+
+def manifest():
+    """Current manifest, building the assets on first use if they are missing/stale."""
+    with _LOCK:
+        if "manifest" not in _STATE:
+            try:
+                _STATE["manifest"] = build()[0]
+            except Exception:
+                # read-only deploy: use whatever was shipped
+                _STATE["manifest"] = read_manifest() or {"files": {}}
+        return _STATE["manifest"]
+
+def asset_url(name):
+    """Cache-busted static URL for a logical asset name, None if it wasn't built."""
+    fname = manifest().get("files", {}).get(name)
+    if not fname:
+        return None
+    return static_url(fname)
+
+def background_url(mobile=False):
+    """Background image URL: static WebP variant, falling back to the JPEG and,
+    when static assets are unavailable, to a data URI (encoded once per process)."""
+    url = asset_url("bg_retail_mobile.webp" if mobile else "bg_retail.webp") or asset_url("bg_retail.jpg")
+    if url:
+        return url
+    with _LOCK:
+        if "data_uri" not in _STATE:
+            try:
+                _STATE["data_uri"] = "data:image/jpeg;base64," + base64.b64encode(BACKGROUND.read_bytes()).decode()
+            except Exception:
+                _STATE["data_uri"] = None
+        return _STATE["data_uri"]
+
+# -------------------------
+# CLI
+# -------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build fingerprinted static assets into static/")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the sources are unchanged")
+    args = parser.parse_args()
+    result, built = build(force=args.force)
+    if not built:
+        print("Assets up to date.")
+    for name, fname in result.get("files", {}).items():
+        print(f"{name:24s} -> static/{fname} ({(STATIC_DIR / fname).stat().st_size:,} bytes)")
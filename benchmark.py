@@ -0,0 +1,394 @@
+# benchmark.py - Veekstar Retail Intelligence (load + page aggregation benchmarks)
+# Generates synthetic datasets with the same columns as Veekstar_Retail_Cleaned.csv
+# and times the dataset load paths (CSV, Parquet snapshot, partitioned store,
+# cached hit) plus every aggregation the pages run: cube build, monthly trend,
+# category/region/channel rollups, margins, turnover, low stock, customer
+# sketches, top-K leaderboards, store rankings, RFM, repeat rate, cohorts, CLV, index + filters, drill-down pages and forecast loading.
+#
+# Each step is timed `--repeat` times (p50/p95/p99/mean/min/max in ms) and run
+# once more under tracemalloc for its peak Python/numpy allocation. Results go to
+# a JSON file stamped with the commit, so runs from two commits can be diffed.
+# Generated CSVs are kept in data/bench/ and reused (the generator is seeded).
+#
+# Run: python benchmark.py run [--sizes 10k,100k,1M,10M] [--repeat 5] [--out FILE]
+#      python benchmark.py compare OLD.json NEW.json [--threshold 1.2]
+import gc
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import resource
+import subprocess
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+import data_store
+import partition_store
+import rfm
+import retention
+import inventory
+import sketches
+import leaderboards
+import rankings
+from rollups import build_cube, rollup, monthly as cube_monthly
+from query_engine import DatasetIndex, apply_filters
+from drilldown import fetch_page
+
+BASE = Path(__file__).resolve().parent
+BENCH_DATA_DIR = data_store.DATA_DIR / "bench"
+RESULTS_DIR = BASE / "benchmarks"
+DEFAULT_SIZES = "10k,100k,1M,10M"
+
+# -------------------------
+# Synthetic data (Veekstar schema)
+# -------------------------
+STORES = {'Lagos': 'South-West', 'Ibadan': 'South-West', 'Abuja': 'North-Central', 'Kano': 'North-West',
+          'Enugu': 'South-East', 'Benin': 'South-South', 'Port Harcourt': 'South-South'}
+PRODUCTS = {
+    'Electronics': ['Refrigerator', 'Smartphone', 'Laptop', 'Generator', 'Smart TV', 'Tablet', 'Air Conditioner'],
+    'Fashion': ['Shirt', 'Suit', 'Dress', 'Sneakers', 'Jeans', 'Trousers', 'Jacket'],
+    'Groceries': ['Pasta', 'Beverage', 'Flour', 'Rice', 'Noodles', 'Cooking Oil', 'Sugar'],
+    'Sports': ['Football', 'Tennis Racket', 'Basketball', 'Running Shoes', 'Gym Mat'],
+    'Toys': ['Toy Car', 'Doll', 'Board Game', 'Puzzle', 'Action Figure'],
+}
+PRICE_RANGE = {'Electronics': (50_000, 1_700_000), 'Fashion': (5_000, 150_000), 'Groceries': (2_000, 40_000),
+               'Sports': (5_000, 120_000), 'Toys': (3_000, 60_000)}
+BRANDS = ['LG', 'Puma', 'Apple', 'Adidas', 'Lego', 'Indomie', 'Golden Penny', 'Nestle', 'Nike', 'Samsung',
+          'Dangote', 'Hasbro', 'Mattel', 'HP', 'Disney', 'Sony', 'Tecno']
+SUPPLIERS = ['MegaMart Supply', 'FashionBase Ltd', 'GameHub Africa', 'TechWorld Nigeria', 'FoodPro Distributors']
+FIRST_NAMES = ['Blessing', 'Emeka', 'Victor', 'Grace', 'Chioma', 'Sarah', 'John', 'Aisha', 'Tunde', 'Ngozi']
+LAST_NAMES = ['Okafor', 'Eze', 'Adeniyi', 'Aliyu', 'James', 'Ibrahim', 'Agina', 'Bello']
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September',
+          'October', 'November', 'December']
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+def parse_size(text):
+    text = text.strip().lower()
+    mult = {'k': 1_000, 'm': 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip('km')) * mult)
+
+def synthetic_dataset(n, seed=0):
+    """n transactions over 2023-2024 with the master CSV's columns and value ranges."""
+    rng = np.random.default_rng(seed)
+    pick = lambda values, size=n: np.asarray(values, dtype=object)[rng.integers(0, len(values), size)]
+    stores = np.array(list(STORES))
+    store = stores[rng.integers(0, len(stores), n)]
+    cats = np.array(list(PRODUCTS))
+    cat_idx = rng.integers(0, len(cats), n)
+    category = cats[cat_idx]
+    name = np.empty(n, dtype=object)
+    cost = np.empty(n)
+    for i, c in enumerate(cats):
+        rows = cat_idx == i
+        name[rows] = pick(PRODUCTS[c], rows.sum())
+        lo, hi = PRICE_RANGE[c]
+        cost[rows] = rng.uniform(lo, hi, rows.sum())
+    price = cost * rng.uniform(1.05, 1.45, n)
+    units = rng.integers(1, 25, n)
+    revenue = price * units
+    cost_of_sales = cost * units
+    date = pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 731, n), unit='D')
+    n_customers = max(1_000, n // 4)
+    first, last = pick(FIRST_NAMES), pick(LAST_NAMES)
+    df = pd.DataFrame({
+        'Transaction_ID': np.char.add('T', np.arange(1001, 1001 + n).astype(str)),
+        'Date': date.strftime('%Y-%m-%d'),
+        'Store': store,
+        'Branch_ID': pd.Series(store).str[:2].str.upper() + pd.Series(rng.integers(1, 11, n)).map('{:03d}'.format),
+        'Sales_Channel': pick(['In-store', 'Online']),
+        'Product_ID': np.char.add('P', rng.integers(1000, 10000, n).astype(str)),
+        'Product_Category': category,
+        'Product_Name': name,
+        'Brand': pick(BRANDS),
+        'Unit_Cost': cost,
+        'Unit_Price': price,
+        'Units_Sold': units,
+        'Revenue': revenue,
+        'Cost_of_Sales': cost_of_sales,
+        'Profit': revenue - cost_of_sales,
+        'Discount_Applied': rng.integers(0, 2, n),
+        'Payment_Method': pick(['POS', 'Transfer', 'Online', 'Cash']),
+        'Transaction_Time': pd.to_timedelta(rng.integers(8 * 3600, 22 * 3600, n), unit='s').astype(str).str[-8:],
+        'Customer_ID': np.char.add('C', rng.integers(1000, 1000 + n_customers, n).astype(str)),
+        'Customer_Name': first + ' ' + last,
+        'Gender': pick(['F', 'M']),
+        'Age': rng.integers(18, 61, n).astype(float),
+        'Marital_Status': pick(['Single', 'Married']),
+        'Occupation': pick(['Engineer', 'Student', 'Trader', 'Teacher', 'Lawyer', 'Designer', 'Banker',
+                            'Doctor', 'Civil Servant']),
+        'Income_Level': pick(['Low', 'Medium', 'High']),
+        'Customer_Segment': pick(['VIP', 'Occasional', 'Regular']),
+        'Loyalty_Score': rng.integers(40, 101, n).astype(float),
+        'Stock_Available': rng.integers(20, 301, n),
+        'Reorder_Level': rng.integers(30, 81, n),
+        'Supplier': pick(SUPPLIERS),
+        'Restock_Frequency': pick([7, 14, 30]),
+        'Promotion_Type': pick([None, 'Loyalty Offer', 'Discount', 'Flash Sale']),
+        'Campaign_Name': pick(['NaijaDeals', 'WeekendRush', 'SummerBlast', 'MegaSaver', 'CustomerLove',
+                               'FestiveBonanza']),
+        'Campaign_Spend': rng.integers(200_000, 1_000_000, n),
+        'Customer_Response': pick(['Yes', 'No']),
+        'Ad_Channel': pick(['Billboard', 'Social Media', 'Radio', 'Email', 'SMS']),
+        'Month': np.asarray(MONTHS, dtype=object)[date.month - 1],
+        'Year': date.year,
+        'Quarter': np.char.add('Q', date.quarter.astype(str)),
+        'Weekday': np.asarray(WEEKDAYS, dtype=object)[date.weekday],
+        'Holiday_Period': np.isin(date.month, (11, 12)) | (rng.random(n) < 0.05),
+        'Repeat_Purchase': rng.random(n) < 0.6,
+        'Satisfaction_Score': rng.integers(30, 51, n) / 10,
+        'Computed_Revenue': (revenue / 1000).round(2),
+    })
+    df['Region'] = df['Store'].map(STORES)
+    return df
+
+def dataset_csv(n, seed=0, folder: Path = BENCH_DATA_DIR):
+    """Path of the generated CSV for n rows (written once, reused afterwards)."""
+    path = folder / f"veekstar_synth_{n}_{seed}.csv"
+    if not path.exists():
+        folder.mkdir(parents=True, exist_ok=True)
+        df = synthetic_dataset(n, seed)
+        tmp = path.with_suffix(".tmp")
+        pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), tmp)
+        tmp.replace(path)
+    return path
+
+# -------------------------
+# Timing
+# -------------------------
+def percentiles(samples):
+    a = np.asarray(samples) * 1000
+    return {'p50_ms': float(np.percentile(a, 50)), 'p95_ms': float(np.percentile(a, 95)),
+            'p99_ms': float(np.percentile(a, 99)), 'mean_ms': float(a.mean()),
+            'min_ms': float(a.min()), 'max_ms': float(a.max()), 'runs': len(a)}
+
+def measure(fn, repeat):
+    """Time `fn` `repeat` times, then one traced run for its peak allocation."""
+    samples = []
+    for _ in range(repeat):
+        gc.collect()
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    out = percentiles(samples)
+    out['peak_mb'] = round(peak / 2**20, 2)
+    return out
+
+def max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+# -------------------------
+# Steps
+# -------------------------
+def load_steps(csv_path: Path, work: Path):
+    """Dataset load paths -> (steps, loaded frame). Each path is what load_master_dataset
+    runs for that source on a cold process cache; 'cached' is a warm hit."""
+    df = data_store._read_master(csv_path)
+    snapshot = data_store.write_parquet(df, work / "snapshot.parquet")
+    store = work / "partitions"
+    manifest = partition_store.new_manifest(df)
+    partition_store.append_rows(partition_store.conform(df[df['date'].notna()], manifest), manifest, store)
+    partition_store.write_manifest(manifest, store)
+
+    def load_store():
+        partition_store.clear_cache()
+        return partition_store.load_store(None, store)
+
+    data_store._cached(("bench", str(csv_path)), csv_path, data_store._read_master)
+    steps = {
+        'load.csv': lambda: data_store._read_master(csv_path),
+        'load.snapshot': lambda: data_store._read_snapshot_columns(snapshot),
+        'load.store': load_store,
+        'load.cached': lambda: data_store._cached(("bench", str(csv_path)), csv_path,
+                                                  data_store._read_master).copy(deep=False),
+    }
+    return steps, df
+
+def page_steps(df: pd.DataFrame):
+    """Every aggregation the pages run, on the full (unfiltered) frame."""
+    cube = build_cube(df)
+    index = DatasetIndex(df)
+    pairs = retention.customer_months(df)
+    region = index.values('region')[:2]
+
+    def margins():
+        m = rollup(cube, 'product_category')
+        return m['profit'] / m['revenue'] * 100
+
+    engine = inventory.engine_for(df)
+    sketch = sketches.sketch_state(df)
+    leaders = leaderboards.leader_state(df)
+    ranking = rankings.engine_for(df)
+
+    def turnover():
+        t = rollup(cube, 'product_category')
+        return t['units_sold'] / t['stock_available_mean'].where(t['stock_available_mean'] > 0)
+
+    return {
+        'cube.build': lambda: build_cube(df),
+        'overview.monthly_cube': lambda: cube_monthly(cube),
+        'overview.monthly_resample': lambda: df.set_index('date')['revenue'].resample('MS').sum(),
+        'sales.category': lambda: rollup(cube, 'product_category'),
+        'sales.region': lambda: rollup(cube, 'region'),
+        'performance.channel': lambda: rollup(cube, 'sales_channel'),
+        'performance.margins': margins,
+        'inventory.turnover': turnover,
+        'inventory.engine_build': lambda: inventory.engine_for(df),
+        'inventory.low_stock': lambda: engine.page(0, 25),
+        'overview.sketch_build': lambda: sketches.sketch_state(df),
+        'overview.unique_customers': lambda: sketches.customer_counts(sketch),
+        'overview.unique_customers_region': lambda: sketches.customer_counts(sketch, {'region': region}),
+        'overview.unique_customers_exact': lambda: df['customer_id'].nunique(),
+        'sales.leaders_build': lambda: leaderboards.leader_state(df),
+        'sales.top_products': lambda: leaderboards.top_k(leaders, df, index, {}, 'product', 'revenue'),
+        'sales.top_brands_region': lambda: leaderboards.top_k(leaders, df, index, {'region': region}, 'brand', 'revenue'),
+        'sales.top_products_exact': lambda: leaderboards.exact_top(df, None, 'product', 'revenue'),
+        'performance.rankings_build': lambda: rankings.engine_for(df),
+        'performance.rankings_page': lambda: ranking.page('branch', 'growth_pct', True, 2, 25),
+        'performance.rankings_region': lambda: ranking.slice({'region': region}).page('branch', 'revenue', True, 0, 25),
+        'customers.rfm': lambda: rfm.segment_summary(rfm.score(rfm.compute_state(df))),
+        'customers.repeat_rate': lambda: retention.monthly_repeat_rate(retention.customer_months(df)),
+        'customers.cohorts': lambda: retention.cohort_matrix(pairs, horizon=6),
+        'customers.clv': lambda: df.groupby('customer_id', observed=True)['revenue'].sum(),
+        'customers.loyalty': lambda: df.groupby('repeat_purchase', observed=False)['loyalty_score'].median(),
+        'filters.index_build': lambda: DatasetIndex(df),
+        'filters.region': lambda: apply_filters(df, DatasetIndex(df), {'region': region}),
+        'drilldown.first_page': lambda: fetch_page(df, index, {'region': region}, 'revenue', True, 0, 50),
+        'drilldown.deep_page': lambda: fetch_page(df, index, {'region': region}, 'revenue', True, 500, 50),
+    }
+
+def forecast_steps():
+    from segment_forecasts import SEGMENTS_FILE
+    from dashboard_main import robust_load_forecast
+    steps = {
+        'forecasts.baseline': lambda: robust_load_forecast("forecast_baseline.csv"),
+        'forecasts.improvement': lambda: robust_load_forecast("forecast_improvement.csv"),
+    }
+    segments = data_store.OUT_DIR / SEGMENTS_FILE
+    if segments.exists():
+        steps['forecasts.segments'] = lambda: data_store._read_output_csv(segments)
+    return steps
+
+def run_size(n, repeat, seed=0, log=print):
+    result = {'rows': n, 'steps': {}}
+    t = time.perf_counter()
+    csv_path = dataset_csv(n, seed)
+    result['csv_mb'] = round(csv_path.stat().st_size / 2**20, 1)
+    log(f"{n:>10,} rows: dataset ready ({result['csv_mb']} MB CSV, {time.perf_counter() - t:.1f}s)")
+    work = Path(tempfile.mkdtemp(prefix="veekstar_bench_"))
+    try:
+        steps, df = load_steps(csv_path, work)
+        steps.update(page_steps(df))
+        steps.update(forecast_steps())
+        result['frame_mb'] = round(df.memory_usage(deep=True).sum() / 2**20, 1)
+        for name, fn in steps.items():
+            try:
+                result['steps'][name] = measure(fn, repeat)
+            except MemoryError:
+                result['steps'][name] = {'error': 'MemoryError'}
+            except Exception as e:
+                result['steps'][name] = {'error': f"{type(e).__name__}: {e}"}
+            s = result['steps'][name]
+            log(f"    {name:28s} " + (f"p50 {s['p50_ms']:10.2f} ms  p95 {s['p95_ms']:10.2f} ms  peak {s['peak_mb']:8.1f} MB"
+                                     if 'error' not in s else s['error']))
+    except MemoryError:
+        result['error'] = 'MemoryError'
+        log(f"    out of memory at {n:,} rows")
+    finally:
+        partition_store.clear_cache()
+        data_store.clear_cache()
+        shutil.rmtree(work, ignore_errors=True)
+    result['max_rss_mb'] = max_rss_mb()
+    return result
+
+# -------------------------
+# Results
+# -------------------------
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+def run(sizes, repeat=5, out: Path = None, seed=0):
+    commit = git_commit()
+    results = {
+        'commit': commit,
+        'created': datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        'python': platform.python_version(), 'pandas': pd.__version__, 'pyarrow': pa.__version__,
+        'platform': platform.platform(), 'repeat': repeat, 'seed': seed,
+        'sizes': {},
+    }
+    for n in sizes:
+        results['sizes'][str(n)] = run_size(n, repeat, seed)
+    if out is None:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        out = RESULTS_DIR / f"bench_{commit or 'nocommit'}_{stamp}.json"
+    out = Path(out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=1), encoding="utf-8")
+    return out, results
+
+def compare(old, new, threshold=1.2):
+    """Rows (size, step, old p50, new p50, ratio, regressed) for steps present in both runs."""
+    rows = []
+    for size, new_size in new['sizes'].items():
+        old_steps = old['sizes'].get(size, {}).get('steps', {})
+        for step, s in new_size.get('steps', {}).items():
+            o = old_steps.get(step)
+            if not o or 'p50_ms' not in o or 'p50_ms' not in s:
+                continue
+            ratio = s['p50_ms'] / o['p50_ms'] if o['p50_ms'] > 0 else float('nan')
+            rows.append({'rows': int(size), 'step': step, 'old_p50_ms': round(o['p50_ms'], 2),
+                         'new_p50_ms': round(s['p50_ms'], 2), 'ratio': round(ratio, 2),
+                         'regressed': bool(ratio > threshold)})
+    return pd.DataFrame(rows)
+
+# -------------------------
+# CLI
+# -------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Veekstar load + aggregation benchmarks")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run", help="benchmark synthetic datasets and write a JSON result file")
+    r.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated row counts, e.g. 10k,100k,1M")
+    r.add_argument("--repeat", type=int, default=5)
+    r.add_argument("--seed", type=int, default=0)
+    r.add_argument("--out", type=Path, default=None)
+    c = sub.add_parser("compare", help="p50 ratios between two result files")
+    c.add_argument("old", type=Path)
+    c.add_argument("new", type=Path)
+    c.add_argument("--threshold", type=float, default=1.2, help="ratio above which a step counts as regressed")
+    args = parser.parse_args()
+    if args.cmd == "run":
+        path, _ = run([parse_size(s) for s in args.sizes.split(",")], args.repeat, args.out, args.seed)
+        print(f"Results written: {path}")
+    else:
+        table = compare(json.loads(args.old.read_text(encoding="utf-8")),
+                        json.loads(args.new.read_text(encoding="utf-8")), args.threshold)
+        if table.empty:
+            print("No common steps to compare.")
+        else:
+            print(table.to_string(index=False))
+            regressed = table[table['regressed']]
+            print(f"\n{len(regressed)} of {len(table)} steps slower than {args.threshold}x")
+            sys.exit(1 if len(regressed) else 0)
@@ -0,0 +1,186 @@
+# chart_data.py - Veekstar Retail Intelligence (payload-bounded chart data)
+# Charts over per-row data are reduced server-side before Plotly sees them:
+#   histograms  -> pre-binned counts (one bar per bin)
+#   box plots   -> per-group quartiles / whiskers / mean + a capped outlier sample
+#   time series -> LTTB downsampling to a point budget
+# so a figure's JSON size depends on the bins / groups / budget, not on the
+# number of transactions. cap_figure() is the last line of defence for any
+# figure about to be sent, and figures themselves are cached process-wide by
+# (page, filter state, dataset version, chart), so repeat views skip both the
+# aggregation and the figure construction.
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from instrumentation import cache_result
+
+MAX_POINTS_PER_TRACE = 2_000
+MAX_POINTS_PER_FIGURE = 10_000
+MAX_OUTLIERS_PER_GROUP = 50
+DEFAULT_BINS = 40
+
+# -------------------------
+# Histograms
+# -------------------------
+def hist_bins(values, nbins=DEFAULT_BINS):
+    """Bin counts for the finite values: DataFrame(left, right, mid, count)."""
+    v = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=float)
+    v = v[np.isfinite(v)]
+    if not len(v):
+        return pd.DataFrame(columns=['left', 'right', 'mid', 'count'])
+    counts, edges = np.histogram(v, bins=nbins)
+    return pd.DataFrame({'left': edges[:-1], 'right': edges[1:], 'mid': (edges[:-1] + edges[1:]) / 2,
+                         'count': counts})
+
+def histogram_figure(bins: pd.DataFrame, x_label, title, height=330):
+    fig = go.Figure(go.Bar(x=bins['mid'], y=bins['count'], width=(bins['right'] - bins['left']),
+                           customdata=np.stack([bins['left'], bins['right']], axis=-1) if len(bins) else None,
+                           hovertemplate="%{customdata[0]:,.0f} - %{customdata[1]:,.0f}<br>count %{y:,}<extra></extra>",
+                           name=x_label))
+    fig.update_layout(title=title, height=height, bargap=0, xaxis_title=x_label, yaxis_title="count")
+    return fig
+
+# -------------------------
+# Box statistics
+# -------------------------
+def box_stats(df: pd.DataFrame, y, by=None, max_outliers=MAX_OUTLIERS_PER_GROUP, seed=0):
+    """Tukey box statistics of `y` per `by` group (whiskers at the most extreme values
+    within 1.5 IQR) and a reproducible sample of at most `max_outliers` outliers per group.
+    Returns (stats frame indexed by group, outliers frame[group, y])."""
+    values = pd.to_numeric(df[y], errors='coerce')
+    keys = df[by].astype(object).where(df[by].notna(), 'n/a') if by else pd.Series('All', index=df.index)
+    data = pd.DataFrame({'group': keys.to_numpy(), 'v': values.to_numpy()}).dropna(subset=['v'])
+    if data.empty:
+        return pd.DataFrame(columns=['q1', 'median', 'q3', 'mean', 'lowerfence', 'upperfence', 'n']), \
+            pd.DataFrame(columns=['group', y])
+    g = data.groupby('group', sort=True)['v']
+    stats = g.quantile([0.25, 0.5, 0.75]).unstack()
+    stats.columns = ['q1', 'median', 'q3']
+    stats['mean'] = g.mean()
+    stats['n'] = g.size()
+    iqr = stats['q3'] - stats['q1']
+    lo = data['group'].map(stats['q1'] - 1.5 * iqr)
+    hi = data['group'].map(stats['q3'] + 1.5 * iqr)
+    inside = (data['v'] >= lo) & (data['v'] <= hi)
+    stats['lowerfence'] = data.loc[inside].groupby('group')['v'].min()
+    stats['upperfence'] = data.loc[inside].groupby('group')['v'].max()
+    out = data.loc[~inside]
+    if len(out):
+        order = np.random.default_rng(seed).random(len(out))
+        out = out.assign(_r=order).sort_values('_r').groupby('group', sort=False).head(max_outliers)
+    return stats, out[['group', 'v']].rename(columns={'v': y}).reset_index(drop=True)
+
+def box_figure(stats: pd.DataFrame, outliers: pd.DataFrame, y, x_label=None, title=None, height=360):
+    """Box plot from precomputed statistics (plus the outlier sample as markers)."""
+    groups = list(stats.index)
+    fig = go.Figure(go.Box(x=groups, q1=stats['q1'], median=stats['median'], q3=stats['q3'],
+                           mean=stats['mean'], lowerfence=stats['lowerfence'], upperfence=stats['upperfence'],
+                           boxpoints=False, name=y))
+    if len(outliers):
+        fig.add_trace(go.Scatter(x=outliers['group'], y=outliers[y], mode='markers', name='outliers (sample)',
+                                 marker=dict(size=5, opacity=0.7)))
+    fig.update_layout(title=title, height=height, xaxis_title=x_label, yaxis_title=y, showlegend=False)
+    return fig
+
+# -------------------------
+# Time series downsampling (Largest-Triangle-Three-Buckets)
+# -------------------------
+def _numeric(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(float)
+    if x.dtype == object:
+        try:
+            return pd.to_datetime(x).asi8.astype(float)
+        except Exception:
+            return np.arange(len(x), dtype=float)
+    return x.astype(float)
+
+def lttb_indices(x, y, threshold):
+    """Indices of the `threshold` points LTTB keeps (first and last always kept).
+    x must be sorted; both are numeric arrays."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        # average of the next bucket (the last point for the final bucket)
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        cx, cy = (x[nlo:nhi].mean(), y[nlo:nhi].mean()) if nhi > nlo else (x[-1], y[-1])
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+def downsample(x, y, max_points=MAX_POINTS_PER_TRACE):
+    """(x, y) reduced to at most max_points with LTTB (input assumed sorted by x)."""
+    if len(x) <= max_points:
+        return x, y
+    idx = lttb_indices(_numeric(x), y, max_points)
+    return np.asarray(x)[idx], np.asarray(y)[idx]
+
+def cap_figure(fig, max_points=MAX_POINTS_PER_FIGURE, max_per_trace=MAX_POINTS_PER_TRACE):
+    """Reduce oversized x/y traces in place: line traces by LTTB, marker traces by
+    an even stride, so no figure ships more than ~max_points points. Cached
+    figures were capped before they were cached and are returned untouched."""
+    if getattr(fig, '_cached', False):
+        return fig
+    traces = [t for t in fig.data if getattr(t, 'x', None) is not None and getattr(t, 'y', None) is not None]
+    total = sum(len(t.x) for t in traces)
+    if total <= max_points and all(len(t.x) <= max_per_trace for t in traces):
+        return fig
+    budget = max(3, min(max_per_trace, max_points // max(len(traces), 1)))
+    for t in traces:
+        if len(t.x) <= budget or t.type not in ('scatter', 'scattergl', 'bar'):
+            continue
+        if t.type != 'bar' and 'lines' in (t.mode or 'lines'):
+            t.x, t.y = downsample(t.x, t.y, budget)
+        else:
+            idx = np.linspace(0, len(t.x) - 1, budget).astype(int)
+            t.x, t.y = np.asarray(t.x)[idx], np.asarray(t.y)[idx]
+    return fig
+
+# -------------------------
+# Figure cache
+# -------------------------
+MAX_FIGURES = 256
+_FIG_LOCK = threading.Lock()
+_FIGURES = OrderedDict()  # (page, filter key, dataset version, chart) -> build() result
+
+def _seal(result):
+    # cap every figure of a build() result (a figure or a tuple holding some) once,
+    # before it is shared; cap_figure() leaves sealed figures alone afterwards
+    for fig in (result if isinstance(result, (tuple, list)) else (result,)):
+        if isinstance(fig, go.Figure):
+            cap_figure(fig)
+            fig._cached = True
+    return result
+
+def cached_figure(key, build):
+    """build() once per key (LRU, process-wide). Figures in the result are capped
+    to the point budget before they are cached; they are shared between
+    sessions, so callers must not modify what they get back."""
+    with _FIG_LOCK:
+        if key in _FIGURES:
+            _FIGURES.move_to_end(key)
+            cache_result("figure", True)
+            return _FIGURES[key]
+    cache_result("figure", False)
+    result = _seal(build())
+    with _FIG_LOCK:
+        _FIGURES[key] = result
+        while len(_FIGURES) > MAX_FIGURES:
+            _FIGURES.popitem(last=False)
+    return result
+
+def clear_cache():
+    with _FIG_LOCK:
+        _FIGURES.clear()
@@ -0,0 +1,189 @@
+# chunked.py - Veekstar Retail Intelligence (out-of-core aggregation)
+# Transaction files larger than a worker's memory are read in bounded chunks
+# through a generator pipeline:
+#   read_csv(chunksize) -> normalize_df_columns / coerce_master_types -> compact types
+# and every chunk is folded into mergeable partial states:
+#   cube       rollup cube cells (sums + non-null counts; the page aggregates:
+#              monthly revenue, category / region / channel sums, stock stats)
+#   inventory  per SKU/branch stock state (inventory.py)
+#   sketches   per cube cell HyperLogLog sketch of customer_ids (sketches.py)
+#   leaders    per (month, region, category) top product / brand summaries (leaderboards.py)
+#   branches   per branch / month cells behind the store rankings (rankings.py)
+# Partial states of disjoint chunks merge by sum / min / max, so peak memory is
+# one chunk plus the states (bounded by the number of cells and SKU/branches),
+# not the file size. `ingest.py init` uses the same pipeline to
+# build the partitioned store chunk by chunk and persists the folded states,
+# which the dashboard then reuses instead of re-aggregating the store. A master
+# CSV above VEEKSTAR_STREAM_MB is never read whole: the first load converts it
+# to the store this way (data_store.load_master_dataset).
+#
+# Run: python chunked.py [path/to/file.csv] [--chunk-rows 250000]
+import time
+import warnings
+from pathlib import Path
+
+import pandas as pd
+
+from data_store import (DATA_DIR, MASTER_CANDIDATES, find_file, normalize_df_columns, coerce_master_types,
+                        write_parquet, read_parquet_meta)
+from dataset_schema import optimize_types
+from rollups import CUBE_DIMS, build_cube
+import inventory
+import sketches
+import leaderboards
+import rankings
+
+CHUNK_ROWS = 250_000
+AGGREGATES_DIR = DATA_DIR / "aggregates"
+AGGREGATES_META_KEY = "veekstar_aggregates_source"
+STATES = ('cube', 'inventory', 'sketches', 'leaders', 'branches')
+
+# -------------------------
+# Chunk pipeline
+# -------------------------
+def read_chunks(path: Path, chunk_rows=CHUNK_ROWS):
+    """Raw CSV chunks; falls back to latin-1 like load_csv_any (restarting the
+    file if the first chunk isn't valid UTF-8)."""
+    for encoding in ("utf-8", "latin-1"):
+        try:
+            reader = pd.read_csv(path, chunksize=chunk_rows, encoding=encoding, low_memory=False)
+            first = next(reader, None)
+        except UnicodeDecodeError:
+            continue
+        if first is None:
+            return
+        yield first
+        yield from reader
+        return
+
+def normalized(chunks):
+    for chunk in chunks:
+        yield optimize_types(coerce_master_types(normalize_df_columns(chunk)))
+
+def iter_chunks(path: Path, chunk_rows=CHUNK_ROWS):
+    """Normalized, compactly typed chunks of the CSV at `path`."""
+    return normalized(read_chunks(path, chunk_rows))
+
+def iter_parquet_chunks(path: Path, chunk_rows=CHUNK_ROWS):
+    """Chunks of a Parquet snapshot, one record batch at a time."""
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+        yield optimize_types(coerce_master_types(batch.to_pandas()))
+
+# -------------------------
+# Partial states
+# -------------------------
+def merge_cubes(cubes):
+    """Merge cube cells of disjoint row sets (every cube column is additive)."""
+    cubes = [c for c in cubes if c is not None and len(c)]
+    if len(cubes) <= 1:
+        return cubes[0] if cubes else None
+    allc = pd.concat(cubes, ignore_index=True)
+    dims = [d for d in CUBE_DIMS if d in allc.columns]
+    if not dims:
+        return allc.sum().to_frame().T
+    return allc.groupby(dims, observed=True, dropna=False).sum().reset_index()
+
+class PartialAggregates:
+    """Mergeable aggregates of a set of transactions (of() one chunk, merge() two)."""
+    def __init__(self, cube=None, inventory_state=None, sketch=None, leaders=None, branches=None, rows=0):
+        self.cube = cube
+        self.inventory = inventory_state
+        self.sketches = sketch
+        self.leaders = leaders
+        self.branches = branches
+        self.rows = rows
+
+    @classmethod
+    def of(cls, df: pd.DataFrame):
+        inv = inventory.compute_state(df) if inventory.available(df) else None
+        return cls(build_cube(df), inv, sketches.sketch_state(df),
+                   leaderboards.leader_state(df), rankings.branch_cells(df), len(df))
+
+    def merge(self, other):
+        states = [s for s in (self.inventory, other.inventory) if s is not None]
+        return PartialAggregates(merge_cubes([self.cube, other.cube]),
+                                 inventory.merge_states(states) if states else None,
+                                 sketches.merge_sketches([self.sketches, other.sketches]),
+                                 leaderboards.merge_leaders([self.leaders, other.leaders]),
+                                 rankings.merge_cells([self.branches, other.branches]),
+                                 self.rows + other.rows)
+
+def aggregate_chunks(chunks, sink=None):
+    """Fold chunks into one PartialAggregates; `sink(chunk)` (if given) sees every
+    chunk first, e.g. to append it to the partitioned store in the same pass.
+    Partials are merged pairwise like a binary counter, so each row is merged
+    O(log chunks) times and at most log2(chunks) partials are held at once."""
+    stack = []  # (level, partial), levels strictly decreasing
+    for chunk in chunks:
+        if sink is not None:
+            sink(chunk)
+        level, part = 0, PartialAggregates.of(chunk)
+        del chunk
+        while stack and stack[-1][0] == level:
+            part = stack.pop()[1].merge(part)
+            level += 1
+        stack.append((level, part))
+    acc = PartialAggregates()
+    for _, part in stack:
+        acc = acc.merge(part)
+    return acc
+
+def aggregate_csv(path: Path, chunk_rows=CHUNK_ROWS):
+    return aggregate_chunks(iter_chunks(path, chunk_rows))
+
+# -------------------------
+# Persisted states (one set per dataset version)
+# -------------------------
+def save_aggregate(name, state, source_version, folder: Path = AGGREGATES_DIR):
+    write_parquet(state, folder / f"{name}.parquet", {AGGREGATES_META_KEY: source_version})
+
+def save_aggregates(agg: PartialAggregates, source_version, folder: Path = AGGREGATES_DIR):
+    for name in STATES:
+        state = getattr(agg, name)
+        if state is not None:
+            save_aggregate(name, state, source_version, folder)
+
+def load_aggregate(name, source_version, folder: Path = AGGREGATES_DIR):
+    """Persisted `name` state if it was folded from `source_version`, else None."""
+    path = folder / f"{name}.parquet"
+    try:
+        if not path.exists() or read_parquet_meta(path, AGGREGATES_META_KEY) != source_version:
+            return None
+        return pd.read_parquet(path)
+    except Exception as e:
+        warnings.warn(f"Aggregate {path.name} unreadable: {e}")
+        return None
+
+# -------------------------
+# CLI
+# -------------------------
+if __name__ == "__main__":
+    import argparse
+    import resource
+    from rollups import rollup, monthly
+    parser = argparse.ArgumentParser(description="Veekstar out-of-core aggregation")
+    parser.add_argument("path", nargs="?", type=Path, default=None, help="CSV file (default: the master dataset)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+    path = args.path or find_file(MASTER_CANDIDATES)
+    if path is None:
+        raise SystemExit("Master dataset not found in data/ or root")
+    t0 = time.perf_counter()
+    agg = aggregate_csv(path, args.chunk_rows)
+    elapsed = time.perf_counter() - t0
+    print(f"{agg.rows:,} rows from {Path(path).name} in {elapsed:.1f}s "
+          f"(chunks of {args.chunk_rows:,}; peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:,.0f} MB)")
+    if agg.cube is not None and len(agg.cube):
+        print(f"cube cells: {len(agg.cube):,}  revenue: {agg.cube['revenue'].sum():,.0f}")
+        if 'month' in agg.cube.columns:
+            print(monthly(agg.cube)[['month', 'revenue']].tail(6).to_string(index=False))
+        for dim in ('product_category', 'region', 'sales_channel'):
+            if dim in agg.cube.columns:
+                print(rollup(agg.cube, dim)[[dim, 'revenue']].sort_values('revenue', ascending=False)
+                      .to_string(index=False))
+    if agg.inventory is not None:
+        print(f"SKU/branches: {len(agg.inventory):,}")
+    if agg.sketches is not None:
+        counts = sketches.customer_counts(agg.sketches)
+        print(f"unique customers (est.): {counts['unique']:,}  sketch registers: {len(agg.sketches):,}")
@@ -1,5 +1,10 @@
-# dashboard_main.py (header + safe asset injection)
-# Veekstar Retail Intelligence — robust asset loading (do not duplicate)
+# dashboard_main.py - Veekstar Retail Intelligence (dashboard module)
+# Imported once per process by app.py; each Streamlit rerun only calls main(),
+# which builds the page context (navigation, dataset view, filters) and hands it
+# to render(page, ctx). Imports, Plotly config and the theme CSS are set up once
+# per process; page-specific engines (RFM, models, scenarios) are imported on
+# first use of their page.
+# Run standalone: streamlit run dashboard_main.py
 
 import streamlit as st
 import pandas as pd
@@ -7,48 +12,27 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from pathlib import Path
-from datetime import datetime
-import os
-import joblib
-import base64
+from functools import lru_cache
+from textwrap import dedent
 import warnings
 warnings.filterwarnings("ignore", message=".*deprecated and will be removed in a future release.*")
 import plotly.io as pio
 pio.renderers.default = "browser"
 pio.renderers["browser"].config = {"displayModeBar": False}
-def get_base64_image(image_path):
-    with open(image_path, "rb") as f:
-        encoded = base64.b64encode(f.read()).decode()
-    return f"data:image/jpeg;base64,{encoded}"
-import streamlit.runtime.scriptrunner as scriptrunner
-ctx = scriptrunner.get_script_run_ctx()
-if ctx is None:
-    st.stop()
-from streamlit_javascript import st_javascript
-
-# Detect device width (mobile vs desktop)
-if "is_mobile" not in st.session_state:
-    try:
-        width = st_javascript("window.innerWidth")
-        st.session_state.is_mobile = width < 800  # treat screens smaller than 800px as mobile
-    except:
-        st.session_state.is_mobile = False
 
-# ---------- DEVICE DETECTION (Mobile vs Desktop) ----------
-def detect_device():
-    try:
-        from streamlit_javascript import st_javascript
-        user_agent = st_javascript("navigator.userAgent")
-        if user_agent and ("Mobi" in user_agent or "Android" in user_agent or "iPhone" in user_agent):
-            return True
-        else:
-            return False
-    except Exception:
-        return False
+from data_store import find_file, load_csv_any, normalize_df_columns, load_master_dataset, dataset_version, enable_copy_on_write
+from rollups import build_cube, master_cube, rollup, totals, monthly as cube_monthly, has_dims
+from query_engine import DatasetIndex, master_index, apply_filters, filter_cube, is_unfiltered, filter_key
+from asset_pipeline import background_url, minify_css
+import instrumentation
+import inventory
+import sketches
+import leaderboards
+import rankings
+from chart_data import cached_figure, cap_figure
 
-if "is_mobile" not in st.session_state:
-    st.session_state.is_mobile = detect_device()
-# ---------------------------------------------------------
+# sessions share the cached master frames: copy-on-write keeps a session's in-place edits private
+enable_copy_on_write()
 
 # -------------------------
 # Base directories (robust)
@@ -59,64 +43,54 @@ OUT_DIR = BASE_DIR / "outputs"
 DATA_DIR = BASE_DIR / "data"
 MODELS_DIR = BASE_DIR / "models"
 
-# -------------------------
-# Streamlit page config
-# -------------------------
-#st.set_page_config(page_title="Veekstar Retail Intelligence",
-#                   layout="wide",
-#                   initial_sidebar_state="expanded")
-if "page_config_set" not in st.session_state:
-    st.session_state["page_config_set"] = True
+PAGES = ["Overview", "Sales", "Customers", "Inventory", "Performance", "Forecasts", "Business Insights"]
+# only shown to the usernames listed under `admins` in config.yaml (set by app.py)
+ADMIN_PAGE = "Admin"
+
+# Columns each page reads - with the Parquet snapshot only these are loaded
+PAGE_COLUMNS = {
+    "Overview": ['date', 'revenue', 'profit'],
+    "Sales": ['date', 'revenue'],
+    "Customers": ['date', 'revenue', 'customer_id', 'age', 'region', 'loyalty_score', 'repeat_purchase'],
+    "Inventory": ['transaction_id', 'date', 'store', 'branch_id', 'product_id', 'product_name',
+                  'product_category', 'units_sold', 'stock_available', 'reorder_level', 'restock_frequency'],
+    "Performance": ['date', 'revenue'],
+    "Forecasts": ['date', 'revenue'],
+    "Business Insights": ['date', 'revenue'],
+    ADMIN_PAGE: None,  # the memory report covers every column
+}
 
 # -------------------------
-
-# -----------------------------------------------------------------
+# Device detection (Mobile vs Desktop), once per session
 # -------------------------
+def detect_device():
+    from streamlit_javascript import st_javascript
+    try:
+        width = st_javascript("window.innerWidth")
+        return width < 800  # treat screens smaller than 800px as mobile
+    except Exception:
+        pass
+    try:
+        user_agent = st_javascript("navigator.userAgent")
+        return bool(user_agent and ("Mobi" in user_agent or "Android" in user_agent or "iPhone" in user_agent))
+    except Exception:
+        return False
+
 # -------------------------
-# Background + Asset Injection (safe base64 method)
+# Background + theme (built once per process per display mode)
 # - includes metric & sidebar styling + auto dim for bright screens
+# - the background is a fingerprinted static file (see asset_pipeline.py),
+#   so only its URL travels with each rerun
 # -------------------------
-import base64
-from textwrap import dedent
-
-def get_base64_image(image_path: Path):
-    try:
-        with open(image_path, "rb") as f:
-            encoded = base64.b64encode(f.read()).decode()
-        return f"data:image/jpeg;base64,{encoded}"
-    except Exception as e:
-        st.warning(f"⚠️ Could not embed background image: {e}")
-        return None
-
-# Display mode stored in session_state for later checks
-if "display_mode" not in st.session_state:
-    st.session_state["display_mode"] = "Auto"
-
-# Put a compact, professional Display Mode control in the sidebar (easy and standard)
-with st.sidebar.expander("Display Mode", expanded=False):
-    st.session_state["display_mode"] = st.radio(
-        label="Select background brightness:",
-        options=["Auto", "Bright", "Dim"],
-        index=0,
-        help="Auto adjusts to your system theme. Bright/Dim force the dashboard brightness."
-    )
-
-# Build embedded background if asset exists
-bg_path = ASSETS_DIR / "bg_retail.jpg"
-bg_url = get_base64_image(bg_path) if bg_path.exists() else None
+DIM_FILTERS = {
+    "Bright": "brightness(1.06) saturate(1.05)",
+    "Dim": "brightness(0.82) saturate(0.95)",
+    "Auto": "none",  # no forced change (system may decide)
+}
 
 # CSS: metric headers gold, metric values white, nav items gold, chart text white,
 # pulsing glow for hovered/active cards and nav items. Also adapt for Display Mode.
-display_mode = st.session_state.get("display_mode", "Auto")
-# brightness modifier based on toggle
-if display_mode == "Bright":
-    dim_filter = "brightness(1.06) saturate(1.05)"
-elif display_mode == "Dim":
-    dim_filter = "brightness(0.82) saturate(0.95)"
-else:  # Auto => no forced change (system may decide)
-    dim_filter = "none"
-
-css = f"""
+THEME_CSS = """
 /* Background & shimmer animation */
 [data-testid="stAppViewContainer"] {{
   background:
@@ -216,16 +190,24 @@ div[data-testid="stVerticalBlock"].veek-active,
 
 /* Small screens */
 @media (max-width: 768px) {{
-  [data-testid="stAppViewContainer"] {{ animation-duration: 28s !important; }}
+  [data-testid="stAppViewContainer"] {{
+    background:
+      linear-gradient(120deg, rgba(0,0,0,0.92), rgba(12,8,2,0.75)),
+      url('{bg_url_mobile}') center/cover no-repeat fixed;
+    animation-duration: 28s !important;
+  }}
   .stMetricValue {{ font-size:18px !important; }}
 }}
 """
 
-# inject CSS
-st.markdown(f"<style>{css}</style>", unsafe_allow_html=True)
+@lru_cache(maxsize=len(DIM_FILTERS))
+def theme_css(display_mode="Auto"):
+    css = THEME_CSS.format(bg_url=background_url(), bg_url_mobile=background_url(mobile=True),
+                           dim_filter=DIM_FILTERS.get(display_mode, "none"))
+    return minify_css(css)
 
 # Small JS to add/remove "veek-active" class for hover/focus to create pulsing glow on cards + nav
-js = dedent("""
+HOVER_JS = dedent("""
   const addHover = (el) => {
     el.addEventListener('mouseover', () => el.classList.add('veek-active'));
     el.addEventListener('mouseout', () => el.classList.remove('veek-active'));
@@ -242,123 +224,23 @@ js = dedent("""
     });
   } catch(e) { console.warn('veek js:', e); }
 """)
-# inject JS (non-blocking)
-st.components.v1.html(f"<script>{js}</script>", height=0)
-
-# If background image was missing, show gentle warning (but continue)
-if bg_url is None:
-    st.warning("⚠️ Background image not found in assets/bg_retail.jpg — using fallback dark glass background.")
-# -------------------------
-# End header - continue to Page config and rest of file
-
-
-# -------------------------
-# Page config
-# -------------------------
-#st.set_page_config(page_title="Veekstar Retail Intelligence",
-#                   layout="wide",
-#                  initial_sidebar_state="expanded")
-
-BASE = Path(__file__).resolve().parent
-
-# -------------------------
-# Inject CSS & JS safely
-# -------------------------
-
-def inject_asset_text(path: Path, tag="style"):
-    try:
-        txt = path.read_text(encoding="utf-8")
-        if tag == "style":
-            st.markdown(f"<style>{txt}</style>", unsafe_allow_html=True)
-        else:
-            st.markdown(f"<script>{txt}</script>", unsafe_allow_html=True)
-    except Exception as e:
-        st.warning(f"Asset not loaded: {path.name} ({e})")
-# -------------------------
-# Utilities: robust CSV loader & normalizer
-# -------------------------
-def find_file(candidates):
-    """Look for candidate filenames under common folders (data/, outputs/, root)"""
-    for c in candidates:
-        # search exact relative to dashboard folder
-        p = BASE / c
-        if p.exists(): 
-            return p
-        # try in outputs and data subfolders
-        p2 = BASE / "outputs" / c
-        if p2.exists():
-            return p2
-        p3 = BASE / "data" / c
-        if p3.exists():
-            return p3
-    return None
-
-def load_csv_any(path: Path):
-    try:
-        # read with utf-8 and fallback to latin-1 if necessary
-        try:
-            df = pd.read_csv(path, parse_dates=False, low_memory=False)
-        except Exception:
-            df = pd.read_csv(path, encoding="latin-1", parse_dates=False, low_memory=False)
-        return df
-    except Exception as e:
-        st.error(f"Failed to read CSV {path}: {e}")
-        return None
 
-def normalize_df_columns(df: pd.DataFrame):
-    # make a lowercase mapping to original
-    cols = {c: c.lower() for c in df.columns}
-    df = df.rename(columns=cols)
-    # Accept variants of date/revenue
-    # Rename first matching variant to 'date' and 'revenue'
-    # date variants
-    date_keys = ['date', 'ds', 'transaction_date', 'transaction_date', 'sale_date', 'datetime']
-    rev_keys = ['revenue','total_revenue','sales','amount','total']
-    # map for date
-    found_date = None
-    for k in date_keys:
-        if k in df.columns:
-            found_date = k
-            break
-    if found_date and found_date != 'date':
-        df = df.rename(columns={found_date: 'date'})
-    # map for revenue
-    found_rev = None
-    for k in rev_keys:
-        if k in df.columns:
-            found_rev = k
-            break
-    if found_rev and found_rev != 'revenue':
-        df = df.rename(columns={found_rev: 'revenue'})
-    return df
-
-# -------------------------
-# Load main cleaned dataset (Veekstar_Retail_Cleaned.csv preferred)
-# -------------------------
-def load_master_dataset():
-    # preferred files
-    candidates = [
-        "Veekstar_Retail_Cleaned.csv",
-        "veekstar_retail_data_final.csv",
-        "veekstar_retail_data.csv",
-        "Veekstar_Retail_Cleaned.CSV",
-        "sales_data.csv"
-    ]
-    p = find_file(candidates)
-    if not p:
-        st.warning("Main dataset not found in data/ or root. Using a small simulated sample so dashboard remains functional.")
-        return None, None
-    df = load_csv_any(p)
-    if df is None:
-        return None, p
-    df = normalize_df_columns(df)
-    # parse date column if present
-    if 'date' in df.columns:
-        df['date'] = pd.to_datetime(df['date'], errors='coerce')
-    # ensure numeric revenue
-    if 'revenue' in df.columns:
-        df['revenue'] = pd.to_numeric(df['revenue'], errors='coerce')
-    return df, p
+def apply_theme():
+    """Display Mode control + theme CSS/JS. The strings are built once per process;
+    Streamlit still needs them re-emitted on every rerun."""
+    with st.sidebar.expander("Display Mode", expanded=False):
+        st.session_state["display_mode"] = st.radio(
+            label="Select background brightness:",
+            options=["Auto", "Bright", "Dim"],
+            index=0,
+            help="Auto adjusts to your system theme. Bright/Dim force the dashboard brightness."
+        )
+    st.markdown(f"<style>{theme_css(st.session_state.get('display_mode', 'Auto'))}</style>", unsafe_allow_html=True)
+    # inject JS (non-blocking)
+    st.components.v1.html(f"<script>{HOVER_JS}</script>", height=0)
+    # If background image was missing, show gentle warning (but continue)
+    if background_url() is None:
+        st.warning("⚠️ Background image not found in assets/bg_retail.jpg — using fallback dark glass background.")
 
 # -------------------------
 # Forecast loader (baseline & improvement)
@@ -377,6 +259,32 @@ def load_forecast_csv(name):
         df['revenue'] = pd.to_numeric(df['revenue'], errors='coerce')
     return df
 
+# helper loader for forecast CSVs in outputs/
+def robust_load_forecast(filename):
+    p = OUT_DIR / filename
+    if not p.exists():
+        return None
+    df = pd.read_csv(p)
+    # normalize column names
+    df.columns = [c.lower().strip() for c in df.columns]
+    # try common column names
+    if 'date' not in df.columns:
+        for cand in ['ds','timestamp','month']:
+            if cand in df.columns:
+                df = df.rename(columns={cand: 'date'})
+                break
+    if 'revenue' not in df.columns:
+        for cand in ['y','value','sales','rev','total_revenue']:
+            if cand in df.columns:
+                df = df.rename(columns={cand: 'revenue'})
+                break
+    # coerce types
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    if 'revenue' in df.columns:
+        df['revenue'] = pd.to_numeric(df['revenue'], errors='coerce').fillna(0)
+    return df
+
 # -------------------------
 # Business insights markdown loader (encoding robust)
 # -------------------------
@@ -396,139 +304,27 @@ def load_markdown(path_candidates):
     return None, None
 
 # -------------------------
-# Prepare data and fallback
-# -------------------------
-df_master, master_path = load_master_dataset()
-
-# If df_master is None, create a small realistic sample so charts render (fallback)
-if df_master is None:
-    # small simulated sample for visuals only
-    rng = pd.date_range(start="2023-01-01", periods=24, freq='M')
-    df_master = pd.DataFrame({
-        "date": np.tile(rng, 1),
-        "region": np.random.choice(["South-West","South-South","North-Central","South-East","North-West"], size=len(rng)),
-        "product_category": np.random.choice(["Electronics","Fashion","Groceries","Sports","Toys"], size=len(rng)),
-        "units_sold": np.random.randint(10,500, size=len(rng)),
-        "unit_price": np.random.uniform(1000,20000,size=len(rng)),
-    })
-    df_master['revenue'] = (df_master['units_sold'] * df_master['unit_price']).round(2)
-    simulated = True
-else:
-    simulated = False
-
-# -------------------------
-# Sidebar navigation
+# Chart output (timed when instrumentation is on)
 # -------------------------
-# ---------- Unified Navigation with Embedded Welcome & Logout ----------
-if st.session_state.get("is_mobile", False):
-    # Mobile view — horizontal dropdown navigation
-    options = [
-        "👋 Welcome, " + st.session_state.get("name", "Demo Reviewer 👑"),
-        "Overview",
-        "Sales",
-        "Customers",
-        "Inventory",
-        "Performance",
-        "Forecasts",
-        "Business Insights",
-        "🚪 Logout"
-    ]
-    # Custom style for navigation background
-    st.markdown(
-    """
-    <style>
-    /* Apply background image + overlay to navigation bar */
-    section[data-testid="stHorizontalBlock"] {
-        background: linear-gradient(rgba(0,0,0,0.6), rgba(0,0,0,0.6)),
-                    url("https://raw.githubusercontent.com/veekstar-tech/veekstar_retail_insights/main/assets/bg_retail.jpg");
-        background-size: cover !important;
-        background-position: center !important;
-        border-radius: 10px;
-        padding: 8px 16px;
-    }
-
-    /* Adjust dropdown text color for contrast */
-    section[data-testid="stHorizontalBlock"] * {
-        color: #f8f9fa !important;
-    }
-
-    /* Optional: Add subtle glow to active item */
-    section[data-testid="stHorizontalBlock"] [aria-selected="true"] {
-        background-color: rgba(255,255,255,0.15) !important;
-        border-radius: 6px;
-    }
-    </style>
-    """,
-    unsafe_allow_html=True
-)
-
-    
-
-# --- END: NAV + SIDEBAR BACKGROUND IMAGE (robust) ---
-
-    menu = st.selectbox("Navigate", options)
-
-    # Handle selection
-    if menu == "🚪 Logout":
-        st.session_state.clear()
-        st.success("Logged out successfully!")
-        st.rerun()
-    elif menu.startswith("👋"):
-     st.info("You’re logged in as: " + st.session_state.get("name", "Demo Reviewer 👑"))
-     current_page = "Overview"  # fallback to Overview after showing welcome
-    else:
-     current_page = menu
-else:
-    # Desktop view — use the sidebar navigation as usual
-    st.sidebar.markdown(
-        f"<div style='font-weight:600;color:#ffd27a;'>👋 Welcome, {st.session_state.get('name', 'Demo Reviewer 👑')}</div>",
-        unsafe_allow_html=True
-    )
-    st.sidebar.markdown("---")
-
-    current_page = st.sidebar.radio("Navigate", [
-        "Overview",
-        "Sales",
-        "Customers",
-        "Inventory",
-        "Performance",
-        "Forecasts",
-        "Business Insights"
-    ])
-# Custom style for navigation background
-    t.markdown(
-    """
-    <style>
-    /* Apply background image + overlay to navigation bar */
-    div[data-testid="stHorizontalBlock"] {
-        background: linear-gradient(rgba(0,0,0,0.6), rgba(0,0,0,0.6)),
-                    url("https://raw.githubusercontent.com/veekstar-tech/veekstar_retail_insights/main/assets/bg_retail.jpg");
-        background-size: cover !important;
-        background-position: center !important;
-        border-radius: 10px;
-        padding: 8px 16px;
-    }
-
-    /* Adjust dropdown text color for contrast */
-    div[data-testid="stHorizontalBlock"] * {
-        color: #f8f9fa !important;
-    }
-
-    /* Optional: Add subtle glow to active item */
-    div[data-testid="stHorizontalBlock"] [aria-selected="true"] {
-        background-color: rgba(255,255,255,0.15) !important;
-        border-radius: 6px;
-    }
-    </style>
-    """,
-    unsafe_allow_html=True
-)
-
-    if st.sidebar.button("🚪 Logout"):
-        st.session_state.clear()
-        st.success("Logged out successfully!")
-        st.rerun()
-# ------------------------------------------------------------------------
+def plotly_chart(fig, *args, **kwargs):
+    """st.plotly_chart with the figure capped to the point budget (chart_data.py;
+    figures from cached_chart were capped before caching and are not modified);
+    with instrumentation on it also records the figure's JSON payload size and
+    the time Streamlit takes to serialize + send it, per page."""
+    cap_figure(fig)
+    if not instrumentation.enabled():
+        return st.plotly_chart(fig, *args, **kwargs)
+    name = f"{instrumentation.current() or 'page'}.chart"
+    instrumentation.observe(f"{name}_bytes", len(fig.to_json()))
+    with instrumentation.span(name):
+        return st.plotly_chart(fig, *args, **kwargs)
+
+def cached_chart(ctx, name, build):
+    """build() -> figure (or (figure, data for the insight text)), cached per page,
+    filter state and dataset version. The simulated sample is never cached."""
+    if ctx.get('version') is None:
+        return build()
+    return cached_figure((ctx['page'], filter_key(ctx['filters']), ctx['version'], name), build)
 
 # -------------------------
 # Helper: quick insight box
@@ -549,44 +345,373 @@ def quick_insight_html(title, text):
     </div>
     """
 
+# -------------------------
+# Unified Navigation with Embedded Welcome & Logout
+# -------------------------
+NAV_CSS = """
+<style>
+/* Apply background image + overlay to navigation bar */
+{selector} {{
+    background: linear-gradient(rgba(0,0,0,0.6), rgba(0,0,0,0.6)),
+                url("{bg_url}");
+    background-size: cover !important;
+    background-position: center !important;
+    border-radius: 10px;
+    padding: 8px 16px;
+}}
+
+/* Adjust dropdown text color for contrast */
+{selector} * {{
+    color: #f8f9fa !important;
+}}
+
+/* Optional: Add subtle glow to active item */
+{selector} [aria-selected="true"] {{
+    background-color: rgba(255,255,255,0.15) !important;
+    border-radius: 6px;
+}}
+</style>
+"""
+
+@lru_cache(maxsize=2)
+def nav_css(selector):
+    return NAV_CSS.format(selector=selector, bg_url=background_url(mobile=True))
+
+def is_admin():
+    return bool(st.session_state.get("is_admin", False))
+
+def navigation():
+    """Render the navigation for the current device and return the selected page."""
+    welcome = st.session_state.get("name", "Demo Reviewer 👑")
+    pages = PAGES + [ADMIN_PAGE] if is_admin() else PAGES
+    if st.session_state.get("is_mobile", False):
+        # Mobile view — horizontal dropdown navigation
+        st.markdown(nav_css('section[data-testid="stHorizontalBlock"]'), unsafe_allow_html=True)
+        menu = st.selectbox("Navigate", ["👋 Welcome, " + welcome] + pages + ["🚪 Logout"])
+        if menu == "🚪 Logout":
+            st.session_state.clear()
+            st.success("Logged out successfully!")
+            st.rerun()
+        if menu.startswith("👋"):
+            st.info("You’re logged in as: " + welcome)
+            return "Overview"  # fallback to Overview after showing welcome
+        return menu
+
+    # Desktop view — use the sidebar navigation as usual
+    st.sidebar.markdown(
+        f"<div style='font-weight:600;color:#ffd27a;'>👋 Welcome, {welcome}</div>",
+        unsafe_allow_html=True
+    )
+    st.sidebar.markdown("---")
+    page = st.sidebar.radio("Navigate", pages)
+    # Custom style for navigation background
+    st.markdown(nav_css('div[data-testid="stHorizontalBlock"]'), unsafe_allow_html=True)
+    if st.sidebar.button("🚪 Logout"):
+        st.session_state.clear()
+        st.success("Logged out successfully!")
+        st.rerun()
+    return page
+
+# -------------------------
+# Page context: dataset view, rollup cube, global filters
+# -------------------------
+def simulated_sample():
+    # small simulated sample for visuals only
+    rng = pd.date_range(start="2023-01-01", periods=24, freq='M')
+    df = pd.DataFrame({
+        "date": np.tile(rng, 1),
+        "region": np.random.choice(["South-West","South-South","North-Central","South-East","North-West"], size=len(rng)),
+        "product_category": np.random.choice(["Electronics","Fashion","Groceries","Sports","Toys"], size=len(rng)),
+        "units_sold": np.random.randint(10,500, size=len(rng)),
+        "unit_price": np.random.uniform(1000,20000,size=len(rng)),
+    })
+    df['revenue'] = (df['units_sold'] * df['unit_price']).round(2)
+    return df
+
+def filter_controls(cube, data_index):
+    """Sidebar filters (shared across pages, indexed - see query_engine.py)."""
+    filters = {}
+    with st.sidebar.expander("Filters", expanded=False):
+        if has_dims(cube, 'month') and cube['month'].notna().any():
+            months = [m.strftime('%Y-%m') for m in pd.date_range(cube['month'].min(), cube['month'].max(), freq='MS')]
+            if len(months) > 1:
+                m_start, m_end = st.select_slider("Date range (month)", options=months,
+                                                  value=(months[0], months[-1]),
+                                                  format_func=lambda m: pd.Timestamp(m).strftime('%b %Y'),
+                                                  key="flt_months")
+                if (m_start, m_end) != (months[0], months[-1]):
+                    filters['date'] = (pd.Timestamp(m_start), pd.Timestamp(m_end) + pd.offsets.MonthBegin(1))
+        for dim, label in [('region', 'Region'), ('store', 'Store'),
+                           ('product_category', 'Category'), ('sales_channel', 'Sales Channel')]:
+            if dim in data_index.codes:
+                picked = st.multiselect(label, data_index.values(dim), key=f"flt_{dim}")
+                if picked:
+                    filters[dim] = picked
+    return filters
+
+def build_context(page):
+    """Everything a page needs for this rerun. The heavy parts (dataset, cube,
+    index) come from the process-wide caches, so this is cheap after the first run."""
+    df_master, master_path = load_master_dataset(columns=PAGE_COLUMNS.get(page))
+    if master_path is None:
+        st.warning("Main dataset not found in data/ or root. Using a small simulated sample so dashboard remains functional.")
+    elif df_master is None:
+        st.error(f"Failed to read CSV {master_path}")
+
+    # If df_master is None, create a small realistic sample so charts render (fallback)
+    simulated = df_master is None
+    if simulated:
+        df_master = simulated_sample()
+
+    # Pre-aggregated rollup cube (one per dataset version) feeding the page charts
+    cube = build_cube(df_master) if simulated else master_cube()
+    if cube is None:
+        cube = build_cube(df_master)
+
+    data_index = DatasetIndex(df_master) if simulated else master_index()
+    filters = filter_controls(cube, data_index)
+    if not is_unfiltered(filters):
+        cube = filter_cube(cube, filters)
+        df_master = apply_filters(df_master, data_index, filters)
+        st.sidebar.caption(f"Filtered: {len(df_master):,} transactions")
+        if cube.empty and page not in ("Forecasts", "Business Insights"):
+            st.info("No transactions match the selected filters.")
+            st.stop()
+    return {'page': page, 'df_master': df_master, 'master_path': master_path, 'simulated': simulated,
+            'cube': cube, 'data_index': data_index, 'filters': filters,
+            'version': None if simulated else dataset_version(master_path)}
+
+# -------------------------
+# Drill-down grid (server-side pages, drilldown.py)
+# -------------------------
+DRILL_SORT_DEFAULT = 'revenue'
+
+def drill_key(name, dim):
+    return f"drill_{name}_{dim}"
+
+def drill_from_chart(name, dim, event):
+    """Chart click (st.plotly_chart on_select event) -> preset the grid's `dim` selection.
+    Only a changed click is applied, so the grid's own widget keeps working afterwards."""
+    points = (event or {}).get('selection', {}).get('points', []) if event else []
+    clicked = tuple(sorted({str(p.get('x')) for p in points if p.get('x') is not None}))
+    seen = f"{drill_key(name, dim)}_click"
+    if clicked and st.session_state.get(seen) != clicked:
+        st.session_state[drill_key(name, dim)] = list(clicked)
+    st.session_state[seen] = clicked
+
+def render_drilldown(ctx, name, dims):
+    """Paged, sortable transaction grid under the page's global filters plus its own
+    selections on indexed `dims`. Only the visible page is read and sent."""
+    from drilldown import GRID_COLUMNS, PAGE_SIZES, fetch_page
+    if ctx['simulated']:
+        df, index, base = ctx['df_master'], None, {}
+    else:
+        df, _ = load_master_dataset(columns=GRID_COLUMNS)
+        index, base = ctx['data_index'], dict(ctx['filters'] or {})
+    if df is None or df.empty:
+        return
+    st.subheader("Drill-down: transactions")
+    filters = dict(base)
+    if index is not None:
+        cols = st.columns(len(dims))
+        for col, dim in zip(cols, dims):
+            options = index.values(dim)
+            if not options:
+                continue
+            key = drill_key(name, dim)
+            if key in st.session_state:
+                st.session_state[key] = [v for v in st.session_state[key] if v in options]
+            picked = col.multiselect(dim.replace('_', ' ').title(), options, key=key)
+            if picked:
+                # narrows the sidebar selection on the same dim
+                outer = base.get(dim)
+                filters[dim] = [v for v in picked if not outer or v in outer]
+                if not filters[dim]:
+                    st.info(f"The selected {dim.replace('_', ' ')} is outside the sidebar filters.")
+                    return
+    columns = [c for c in GRID_COLUMNS if c in df.columns]
+    s1, s2, s3 = st.columns([2, 1, 1])
+    sort_by = s1.selectbox("Sort by", columns, index=columns.index(DRILL_SORT_DEFAULT) if DRILL_SORT_DEFAULT in columns else 0,
+                           key=f"drill_{name}_sort")
+    descending = s2.toggle("Descending", value=True, key=f"drill_{name}_desc")
+    size = s3.selectbox("Rows per page", PAGE_SIZES, index=1, key=f"drill_{name}_size")
+    # the row count only needs the (cached) selection, so the page widget can be bounded first
+    rows = index.select(filters) if index is not None else None
+    total = len(df) if rows is None else len(rows)
+    if not total:
+        st.info("No transactions match this drill-down.")
+        return
+    pages = -(-total // size)
+    page_key = f"drill_{name}_page"
+    # back to page 1 whenever the selection, sort or page size changes
+    signature = (filter_key(filters), sort_by, descending, size)
+    if st.session_state.get(f"{page_key}_for") != signature:
+        st.session_state[f"{page_key}_for"] = signature
+        st.session_state[page_key] = 1
+    page = st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, step=1, key=page_key)
+    view, total = fetch_page(df, index, filters, sort_by, descending, int(page) - 1, size,
+                             columns=columns, version=ctx['version'])
+    st.dataframe(view, use_container_width=True, hide_index=True)
+    first = (int(page) - 1) * size
+    st.caption(f"Rows {first + 1:,}-{first + len(view):,} of {total:,} (sorted by {sort_by}, "
+               f"{'descending' if descending else 'ascending'}).")
+
+# -------------------------
+# Top-K leaderboards (leaderboards.py)
+# -------------------------
+LEADER_METRICS = {'revenue': 'Revenue', 'units_sold': 'Units sold', 'profit': 'Profit'}
+
+def render_leaderboard(ctx):
+    """Top 20 products / brands of the filtered slice: candidates from the summaries,
+    exact totals for the final 20 only."""
+    if ctx['simulated']:
+        df, index, leaders = ctx['df_master'], None, None
+    else:
+        df, _ = load_master_dataset(columns=leaderboards.LEADER_COLUMNS)
+        index, leaders = ctx['data_index'], leaderboards.master_leaders()
+    if not leaderboards.available(df):
+        st.info("No 'product_id' / 'brand' columns found - product leaderboards omitted.")
+        return
+    boards = [b for b, key in leaderboards.BOARDS.items() if key in df.columns]
+    metrics = [m for m in LEADER_METRICS if m in df.columns]
+    c1, c2 = st.columns(2)
+    board = c1.radio("Leaderboard", boards, format_func=lambda b: f"{b.title()}s", horizontal=True,
+                     key="sales_top_board")
+    metric = c2.selectbox("Rank by", metrics, format_func=LEADER_METRICS.get, key="sales_top_metric")
+    st.subheader(f"Top {leaderboards.TOP_K} {board}s by {LEADER_METRICS[metric].lower()}")
+    top, method = cached_chart(ctx, f"top_{board}_{metric}",
+                               lambda: leaderboards.top_k(leaders, df, index, ctx['filters'], board, metric))
+    if top.empty:
+        st.info("No products in the current selection.")
+        return
+    st.dataframe(top.set_axis(range(1, len(top) + 1)), use_container_width=True)
+    st.caption("Exact totals. " + ("Candidates came from the per-cell summaries." if method == 'sketch' else
+                                   "This slice was aggregated in full (store / channel filter or no clear leaders)."))
+
+# -------------------------
+# Store / branch rankings (rankings.py)
+# -------------------------
+RANK_LABELS = {'revenue': 'Revenue', 'profit': 'Profit', 'margin_pct': 'Margin %', 'units_sold': 'Units sold',
+               'transactions': 'Transactions', 'revenue_per_txn': 'Revenue / transaction', 'growth_pct': 'MoM growth %'}
+RANK_PAGE_SIZES = (10, 25, 50, 100)
+
+def render_store_rankings(ctx):
+    """Ranked, sortable, paged store / branch table with revenue sparklines. Rows come
+    from the ranking engine (branch cells), never from the transactions."""
+    engine = None if ctx['simulated'] else rankings.master_rankings()
+    if engine is None or not engine.rows:
+        st.info("Store or branch data missing - store rankings omitted.")
+        return
+    filters = ctx['filters']
+    if not is_unfiltered(filters):
+        base = engine
+        engine = cached_chart(ctx, 'store_rankings', lambda: base.slice(filters))
+    levels = list(engine.rows)
+    c1, c2, c3, c4 = st.columns([1.2, 1.2, 0.8, 0.8])
+    level = c1.radio("Rank", levels, format_func=lambda l: "Branches" if l == 'branch' else "Stores",
+                     horizontal=True, key="perf_rank_level")
+    columns = [c for c in rankings.RANK_COLUMNS if c in engine.rows[level].columns]
+    sort_by = c2.selectbox("Sort by", columns, format_func=RANK_LABELS.get, key="perf_rank_sort")
+    descending = c3.toggle("Descending", value=True, key="perf_rank_desc")
+    size = c4.selectbox("Rows per page", RANK_PAGE_SIZES, index=1, key="perf_rank_size")
+    total = len(engine.rows[level])
+    if not total:
+        st.info("No stores match the selected filters.")
+        return
+    pages = -(-total // size)
+    # back to page 1 whenever the selection, level, sort or page size changes
+    signature = (filter_key(filters), level, sort_by, descending, size)
+    if st.session_state.get("perf_rank_page_for") != signature:
+        st.session_state["perf_rank_page_for"] = signature
+        st.session_state["perf_rank_page"] = 1
+    page = st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, step=1, key="perf_rank_page")
+    view, total = engine.page(level, sort_by, descending, int(page) - 1, size)
+    key, labels = rankings.LEVELS[level]
+    shown = [c for c in ['rank', key] + labels + columns + ['trend'] if c in view.columns]
+    trend_months = rankings.SPARK_MONTHS
+    st.dataframe(view[shown], use_container_width=True, hide_index=True,
+                 column_config={
+                     'rank': st.column_config.NumberColumn("Rank", format="%d"),
+                     'revenue': st.column_config.NumberColumn("Revenue (₦)", format="%.0f"),
+                     'profit': st.column_config.NumberColumn("Profit (₦)", format="%.0f"),
+                     'margin_pct': st.column_config.NumberColumn("Margin %", format="%.1f"),
+                     'revenue_per_txn': st.column_config.NumberColumn("Revenue / txn (₦)", format="%.0f"),
+                     'growth_pct': st.column_config.NumberColumn("MoM growth %", format="%.1f"),
+                     'trend': st.column_config.LineChartColumn(f"Revenue, last {trend_months} months"),
+                 })
+    first = (int(page) - 1) * size
+    st.caption(f"Rows {first + 1:,}-{first + len(view):,} of {total:,} (sorted by {RANK_LABELS[sort_by].lower()}, "
+               f"{'descending' if descending else 'ascending'}; rank = revenue rank).")
+    best, _ = engine.page(level, 'revenue', True, 0, 1)
+    if not best.empty:
+        top = best.iloc[0]
+        growth = top.get('growth_pct')
+        trend = "" if growth is None or pd.isna(growth) else f", {growth:+.1f}% month over month"
+        st.markdown(quick_insight_html(
+            "Store Insight",
+            f"{'Branch ' + str(top[key]) + ' (' + str(top['store']) + ')' if level == 'branch' else top[key]} "
+            f"leads with ₦{top['revenue']:,.0f} in revenue{trend}."
+        ), unsafe_allow_html=True)
+
 # -------------------------
 # --- Overview
 # -------------------------
-if current_page == "Overview":
+def render_overview(ctx):
+    cube = ctx['cube']
+
     st.markdown("<h1 style='color:#ffd27a'>Overview</h1>", unsafe_allow_html=True)
     st.write("Quick executive view — totals and trends.")
 
-    # aggregate
-    total_revenue = df_master['revenue'].sum()
+    # aggregate (cube totals)
+    tot = totals(cube)
+    total_revenue = tot['revenue']
     total_profit = None
-    if 'profit' in df_master.columns:
-        total_profit = df_master['profit'].sum()
+    if 'profit' in cube.columns:
+        total_profit = tot['profit']
     else:
         # crude profit sim 15% margin if not present
         total_profit = (total_revenue * 0.15)
 
-    unique_customers = df_master['date'].nunique()  # fallback
-    avg_ticket = df_master['revenue'].mean()
+    # distinct customers from the per-cell HyperLogLog sketches (sketches.py)
+    if ctx['simulated']:
+        customers = None
+    else:
+        customers = cached_chart(ctx, 'customer_counts',
+                                 lambda: sketches.customer_counts(sketches.master_sketches(), ctx['filters']))
+    avg_ticket = tot['revenue_mean']
 
     # Metrics row
-    col1, col2, col3, col4 = st.columns([1.5,1.2,1.2,1.2])
+    col1, col2, col3, col4, col5 = st.columns([1.5,1.2,1.2,1.2,1.2])
     col1.metric("Total Revenue (₦)", f"{total_revenue:,.0f}")
     col2.metric("Estimated Profit (₦)", f"{total_profit:,.0f}")
-    col3.metric("Unique periods (proxy)", f"{unique_customers}")
-    col4.metric("Avg Ticket (₦)", f"{avg_ticket:,.0f}")
+    if customers is None:
+        col3.metric("Unique Customers", "n/a")
+        col4.metric("Active Customers", "n/a")
+    else:
+        col3.metric("Unique Customers", f"{customers['unique']:,}",
+                    help="Distinct customer_ids in the selection (HyperLogLog estimate, ~1.6% error)")
+        active = customers.get('active')
+        col4.metric("Active Customers", "n/a" if active is None else f"{active:,}",
+                    help=None if active is None else
+                    f"Customers who bought since {customers['active_since']:%b %Y} "
+                    f"(last {sketches.ACTIVE_MONTHS} months of the selection)")
+    col5.metric("Avg Ticket (₦)", f"{avg_ticket:,.0f}")
 
     # Monthly revenue trend
-    if 'date' in df_master.columns:
-        monthly = (df_master.set_index('date').resample('M').sum(numeric_only=True).reset_index())
-        if 'revenue' in monthly.columns:
-            fig = px.bar(monthly, x='date', y='revenue', labels={'date':'Month','revenue':'Revenue'},
-                         title="Monthly Revenue Trend", height=380)
-            fig.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
-                              font_color='white', title_font_color='#ffd27a')
-            st.plotly_chart(fig, config=pio.renderers["browser"].config)
+    if has_dims(cube, 'month'):
+        if 'revenue' in cube.columns:
+            def build():
+                monthly = cube_monthly(cube).rename(columns={'month': 'date'})
+                fig = px.bar(monthly, x='date', y='revenue', labels={'date':'Month','revenue':'Revenue'},
+                             title="Monthly Revenue Trend", height=380)
+                fig.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
+                                  font_color='white', title_font_color='#ffd27a')
+                return fig, monthly['revenue'].tail(2).tolist()
+            fig, recent = cached_chart(ctx, 'monthly_revenue', build)
+            plotly_chart(fig, config=pio.renderers["browser"].config)
             # quick insight
-            last = monthly['revenue'].iloc[-1]
-            prev = monthly['revenue'].iloc[-2] if len(monthly)>=2 else last
+            last = recent[-1]
+            prev = recent[-2] if len(recent)>=2 else last
             pct = (last-prev)/prev*100 if prev!=0 else 0
             insight = f"Revenue {pct:+.1f}% vs previous month."
             st.markdown(quick_insight_html("Revenue Trend", insight), unsafe_allow_html=True)
@@ -596,30 +721,34 @@ if current_page == "Overview":
         st.warning("No 'date' column in master dataset to plot trends.")
 # Chat summary: Overview section gives executives a summary of total revenue, profit, and trends using bar charts and quick insights.
 
-# -------------------------
-# --- Sales
-# -------------------------
 # -------------------------
 # --- Sales (extended)
 # -------------------------
-elif current_page == "Sales":
+def render_sales(ctx):
+    cube = ctx['cube']
+
     st.markdown("<h1 style='color:#ffd27a'>Sales Analytics</h1>", unsafe_allow_html=True)
     st.write("Detailed sales performance — product, region, channel and price-demand relationships.")
 
     # Guard: ensure revenue exists
-    if 'revenue' not in df_master.columns:
+    if 'revenue' not in cube.columns:
         st.warning("Sales view requires a 'revenue' column in your dataset. Add it (or check loaded file).")
     else:
         # 1) Revenue by Product Category (existing main chart, kept and enriched)
-        if 'product_category' in df_master.columns:
-            cat = (df_master.groupby('product_category', observed=False)['revenue']
-                   .sum().sort_values(ascending=False).reset_index())
-            fig_cat = px.bar(cat, x='product_category', y='revenue',
-                             labels={'product_category':'Category','revenue':'Revenue'},
-                             title="Revenue by Product Category", height=380)
-            fig_cat.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
-                                  font_color='white', title_font_color='#ffd27a')
-            st.plotly_chart(fig_cat, use_container_width=True)
+        if has_dims(cube, 'product_category'):
+            def build_cat():
+                cat = (rollup(cube, 'product_category')[['product_category', 'revenue']]
+                       .sort_values('revenue', ascending=False).reset_index(drop=True))
+                fig_cat = px.bar(cat, x='product_category', y='revenue',
+                                 labels={'product_category':'Category','revenue':'Revenue'},
+                                 title="Revenue by Product Category", height=380)
+                fig_cat.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
+                                      font_color='white', title_font_color='#ffd27a')
+                return fig_cat, cat.head(1)
+            fig_cat, cat = cached_chart(ctx, 'category_revenue', build_cat)
+            event = plotly_chart(fig_cat, use_container_width=True, on_select="rerun", selection_mode="points",
+                                 key="sales_category_chart")
+            drill_from_chart('sales', 'product_category', event)
             # quick insight (safe indexing)
             if len(cat) > 0:
                 top_cat = cat.iloc[0]
@@ -630,27 +759,39 @@ elif current_page == "Sales":
             st.info("No 'product_category' column found — skipping category chart.")
 
         # 2) Revenue by Region / Store (if present)
-        if 'region' in df_master.columns:
-            reg = (df_master.groupby('region', observed=False)['revenue'].sum().sort_values(ascending=False).reset_index())
-            fig_reg = px.bar(reg, x='region', y='revenue',
-                             labels={'region':'Region','revenue':'Revenue'},
-                             title="Revenue by Region (Top → Bottom)", height=320)
-            fig_reg.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
-            st.plotly_chart(fig_reg, use_container_width=True)
+        if has_dims(cube, 'region'):
+            def build_reg():
+                reg = (rollup(cube, 'region')[['region', 'revenue']].sort_values('revenue', ascending=False).reset_index(drop=True))
+                fig_reg = px.bar(reg, x='region', y='revenue',
+                                 labels={'region':'Region','revenue':'Revenue'},
+                                 title="Revenue by Region (Top → Bottom)", height=320)
+                fig_reg.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
+                return fig_reg
+            event = plotly_chart(cached_chart(ctx, 'region_revenue', build_reg), use_container_width=True,
+                                 on_select="rerun", selection_mode="points", key="sales_region_chart")
+            drill_from_chart('sales', 'region', event)
         else:
             st.info("No 'region' column found - regional breakdown omitted.")
 
+        # 3) Top products / brands for the current slice (heavy-hitter summaries, leaderboards.py)
+        render_leaderboard(ctx)
+
         # 4) Avg price vs units sold (bubble) to understand price vs demand
-        if {'unit_price','units_sold','product_category'}.issubset(df_master.columns):
-            price_agg = (df_master.groupby('product_category', observed=False)
-                         .agg(avg_price=('unit_price','mean'), total_units=('units_sold','sum'), revenue=('revenue','sum'))
-                         .reset_index())
-            fig_bubble = px.scatter(price_agg, x='avg_price', y='total_units', size='revenue', color='product_category',
-                                    hover_name='product_category', title="Avg Price vs Units Sold (by Category)", height=420)
-            fig_bubble.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
-            st.plotly_chart(fig_bubble, use_container_width=True)
+        if has_dims(cube, 'unit_price', 'units_sold', 'product_category'):
+            def build_bubble():
+                price_agg = (rollup(cube, 'product_category')
+                             .rename(columns={'unit_price_mean': 'avg_price', 'units_sold': 'total_units'})
+                             [['product_category', 'avg_price', 'total_units', 'revenue']])
+                fig_bubble = px.scatter(price_agg, x='avg_price', y='total_units', size='revenue', color='product_category',
+                                        hover_name='product_category', title="Avg Price vs Units Sold (by Category)", height=420)
+                fig_bubble.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
+                return fig_bubble
+            plotly_chart(cached_chart(ctx, 'price_vs_units', build_bubble), use_container_width=True)
         else:
             st.info("Avg Price vs Units Sold bubble omitted (requires 'unit_price' and 'units_sold').")
+
+        # Rows behind the charts: click a category / region bar to drill in
+        render_drilldown(ctx, 'sales', ['product_category', 'region', 'store', 'sales_channel'])
               
         
 
@@ -658,55 +799,71 @@ elif current_page == "Sales":
 
     # End Sales
 
-
-# -------------------------
-# --- Customers
-# -------------------------
 # -------------------------
 # --- Customers (extended)
 # -------------------------
-elif current_page == "Customers":
+def render_customers(ctx):
+    from rfm import master_rfm, compute_state as rfm_compute_state, score as rfm_score, segment_summary
+    from retention import customer_months, monthly_repeat_rate, cohort_matrix, cohort_sizes, retention_curve
+    from chart_data import box_stats, box_figure, hist_bins, histogram_figure
+    df_master, simulated, filters = ctx['df_master'], ctx['simulated'], ctx['filters']
+
     st.markdown("<h1 style='color:#ffd27a'>Customer Insights</h1>", unsafe_allow_html=True)
     st.write("Demographics, loyalty and value-based views")
 
     # Age distribution (existing)
     if 'age' in df_master.columns:
-        fig_age = px.box(df_master, x='region' if 'region' in df_master.columns else None, y='age',
-                         title="Customer Age Distribution by Region", points="outliers", height=360)
-        fig_age.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
-        st.plotly_chart(fig_age, use_container_width=True)
+        # quartiles / whiskers computed here, only a sample of outliers is sent
+        def build_age():
+            by = 'region' if 'region' in df_master.columns else None
+            stats, outliers = box_stats(df_master, 'age', by)
+            fig_age = box_figure(stats, outliers, 'age', x_label=by,
+                                 title="Customer Age Distribution by Region", height=360)
+            fig_age.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
+            return fig_age
+        plotly_chart(cached_chart(ctx, 'age_box', build_age), use_container_width=True)
         st.markdown(quick_insight_html("Age Distribution", "Shows median age & spread across regions; useful for targeted campaigns."), unsafe_allow_html=True)
     else:
         st.info("Age column not available in dataset (we can simulate or add).")
 
     # Loyalty vs Repeat Purchase (existing)
     if 'loyalty_score' in df_master.columns and 'repeat_purchase' in df_master.columns:
-        temp = df_master.groupby('repeat_purchase', observed=False)['loyalty_score'].median().reset_index()
-        fig_loyal = px.bar(temp, x='repeat_purchase', y='loyalty_score', title="Loyalty vs Repeat Purchase", height=320)
-        fig_loyal.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
-        st.plotly_chart(fig_loyal, use_container_width=True)
+        def build_loyal():
+            temp = df_master.groupby('repeat_purchase', observed=False)['loyalty_score'].median().reset_index()
+            fig_loyal = px.bar(temp, x='repeat_purchase', y='loyalty_score', title="Loyalty vs Repeat Purchase", height=320)
+            fig_loyal.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
+            return fig_loyal
+        plotly_chart(cached_chart(ctx, 'loyalty_repeat', build_loyal), use_container_width=True)
         st.markdown(quick_insight_html("Loyalty vs Repeat", "Repeat buyers show slightly higher loyalty scores."), unsafe_allow_html=True)
     else:
         st.info("Loyalty / Repeat columns not found — skipping behaviour analysis.")
 
-    # 1) Customer segmentation by RFM-like quick proxy if required columns exist
-    # We'll compute a lightweight segmentation if we have customer_id, revenue and date
+    # 1) Customer segmentation — full R x F x M scoring with named segments (see rfm.py)
     if {'customer_id','revenue','date'}.issubset(df_master.columns):
-        df_c = df_master.copy()
-        # recency: days since last purchase
-        last_date = df_c['date'].max()
-        cust_metrics = (df_c.groupby('customer_id', observed=False)
-                        .agg(recency = ('date', lambda x: (last_date - x.max()).days),
-                             frequency = ('date', 'nunique'),
-                             monetary = ('revenue', 'sum'))
-                        .reset_index())
-        # simple segmentation: quartiles of monetary & recency
-        cust_metrics['mon_q'] = pd.qcut(cust_metrics['monetary'].rank(method='first'), 4, labels=['Low','Med','High','Top'])
-        cust_metrics['rec_q'] = pd.qcut(cust_metrics['recency'].rank(method='first'), 4, labels=['Top','High','Med','Low'])
-        seg = cust_metrics.groupby(['mon_q']).size().reset_index(name='count').sort_values('count', ascending=False)
-        fig_seg = px.bar(seg, x='mon_q', y='count', labels={'mon_q':'Monetary Segment','count':'Customers'}, title="Customer Monetary Segments (quick RFM proxy)", height=320)
-        fig_seg.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
-        st.plotly_chart(fig_seg, use_container_width=True)
+        def build_rfm():
+            # unfiltered view reuses the persisted master state; filtered slices are scored on the fly
+            scored = master_rfm() if (not simulated and is_unfiltered(filters)) else None
+            if scored is None:
+                scored = rfm_score(rfm_compute_state(df_master))
+            seg = segment_summary(scored)
+            fig_seg = px.bar(seg, x='segment', y='customers', color='revenue',
+                             labels={'segment':'RFM Segment','customers':'Customers','revenue':'Revenue (₦)'},
+                             title="Customer RFM Segments", height=360, color_continuous_scale='YlOrBr')
+            fig_seg.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
+            rf_grid = scored.pivot_table(index='r', columns='f', values='monetary', aggfunc='mean', observed=False)
+            fig_rf = px.imshow(rf_grid.sort_index(ascending=False), aspect='auto', color_continuous_scale='YlOrBr',
+                               labels={'x': 'Frequency score', 'y': 'Recency score', 'color': 'Avg monetary (₦)'},
+                               title="Recency x Frequency Grid (avg customer value)", height=360)
+            fig_rf.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
+            return fig_seg, fig_rf, seg.head(1)
+        fig_seg, fig_rf, seg = cached_chart(ctx, 'rfm', build_rfm)
+        plotly_chart(fig_seg, use_container_width=True)
+        plotly_chart(fig_rf, use_container_width=True)
+        if not seg.empty:
+            top_seg = seg.iloc[0]
+            st.markdown(quick_insight_html("Segment Insight",
+                                           f"'{top_seg['segment']}' customers ({top_seg['customers']:,}) generate the most revenue — ₦{top_seg['revenue']:,.0f}."),
+                        unsafe_allow_html=True)
     else:
         st.info("Customer segmentation omitted (requires 'customer_id', 'date', 'revenue').")
         st.markdown(quick_insight_html(
@@ -717,10 +874,13 @@ elif current_page == "Customers":
 
     # 2) Customer Lifetime Value (CLV) distribution if we have customer monetary info
     if 'customer_id' in df_master.columns and 'revenue' in df_master.columns:
-        clv = df_master.groupby('customer_id', observed=False)['revenue'].sum().reset_index(name='clv')
-        fig_clv = px.histogram(clv, x='clv', nbins=40, title="Customer Lifetime Value Distribution", height=330)
-        fig_clv.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
-        st.plotly_chart(fig_clv, use_container_width=True)
+        # binned here: the figure carries 40 bars, not one value per customer
+        def build_clv():
+            clv = df_master.groupby('customer_id', observed=True)['revenue'].sum()
+            fig_clv = histogram_figure(hist_bins(clv, 40), 'clv', "Customer Lifetime Value Distribution", height=330)
+            fig_clv.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
+            return fig_clv
+        plotly_chart(cached_chart(ctx, 'clv_hist', build_clv), use_container_width=True)
     else:
         st.info("CLV distribution omitted (requires 'customer_id' and 'revenue').")
         st.markdown(quick_insight_html(
@@ -728,26 +888,58 @@ elif current_page == "Customers":
     "The lifetime value distribution shows a concentration of mid-value customers, "
     "suggesting strong retention but room to improve premium loyalty."
 ), unsafe_allow_html=True)
-    # 3) Monthly repeat-rate (proxy retention) — simple, robust: % customers who bought in previous month and current
+    # 3) Monthly repeat-rate (proxy retention) + cohort retention — one vectorized pass over (customer, month) pairs
     if {'customer_id','date'}.issubset(df_master.columns):
-        df_r = df_master.copy()
-        df_r['month'] = pd.to_datetime(df_r['date']).dt.to_period('M').dt.to_timestamp()
-        monthly_cust = df_r.groupby('month')['customer_id'].nunique().reset_index(name='unique_customers')
-        # compute repeaters: customers present in both month t and t-1
-        months = sorted(df_r['month'].unique())
-        repeat_rates = []
-        for i in range(1, len(months)):
-            cur = set(df_r.loc[df_r['month']==months[i],'customer_id'])
-            prev = set(df_r.loc[df_r['month']==months[i-1],'customer_id'])
-            if len(cur) > 0:
-                rr = len(cur.intersection(prev))/len(cur)
-                repeat_rates.append({'month': months[i], 'repeat_rate': rr})
-        if repeat_rates:
-            rr_df = pd.DataFrame(repeat_rates)
+        lazy = {}
+        def customer_pairs():
+            # built at most once per render, and only when a figure below is not cached
+            if 'pairs' not in lazy:
+                lazy['pairs'] = customer_months(df_master)
+            return lazy['pairs']
+
+        def build_rr():
+            rr_df = monthly_repeat_rate(customer_pairs())
+            if rr_df.empty:
+                return None
             fig_rr = px.line(rr_df, x='month', y='repeat_rate', title="Monthly Repeat Rate (proxy retention)", height=300)
             fig_rr.update_yaxes(tickformat=".0%")
             fig_rr.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
-            st.plotly_chart(fig_rr, use_container_width=True)
+            return fig_rr
+        fig_rr = cached_chart(ctx, 'repeat_rate', build_rr)
+        if fig_rr is not None:
+            plotly_chart(fig_rr, use_container_width=True)
+
+        # 4) N-month cohort retention (curve + heatmap)
+        horizon = st.slider("Cohort retention horizon (months)", min_value=3, max_value=12, value=6, key="cohort_horizon")
+        def build_cohorts():
+            pairs = customer_pairs()
+            cohorts = cohort_matrix(pairs, horizon=horizon)
+            if cohorts.empty:
+                return None
+            curve = retention_curve(cohorts, cohort_sizes(pairs).reindex(cohorts.index))
+            fig_curve = px.line(curve, x='months_since_first', y='retention', markers=True,
+                                title=f"{horizon}-Month Cohort Retention Curve", height=300,
+                                labels={'months_since_first': 'Months since first purchase', 'retention': 'Active share'})
+            fig_curve.update_yaxes(tickformat=".0%")
+            fig_curve.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
+
+            heat_df = cohorts.copy()
+            heat_df.index = heat_df.index.strftime('%Y-%m')
+            fig_cohort = px.imshow(heat_df, aspect='auto', color_continuous_scale='YlOrBr', zmin=0,
+                                   labels={'x': 'Months since first purchase', 'y': 'Cohort', 'color': 'Retention'},
+                                   title="Cohort Retention Heatmap", height=420)
+            fig_cohort.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
+            m1 = curve.loc[curve['months_since_first'] == 1, 'retention']
+            return fig_curve, fig_cohort, (m1.iloc[0] if not m1.empty else None)
+        built = cached_chart(ctx, f'cohorts_{horizon}', build_cohorts)
+        if built is not None:
+            fig_curve, fig_cohort, m1 = built
+            plotly_chart(fig_curve, use_container_width=True)
+            plotly_chart(fig_cohort, use_container_width=True)
+            if m1 is not None and pd.notna(m1):
+                st.markdown(quick_insight_html("Cohort Insight",
+                                               f"On average {m1:.1%} of new customers buy again in their second month."),
+                            unsafe_allow_html=True)
     else:
         st.info("Monthly repeat-rate omitted (requires 'customer_id' and 'date').")
         st.markdown(quick_insight_html(
@@ -755,47 +947,92 @@ elif current_page == "Customers":
     "Repeat purchase rates are stable month-to-month, indicating a healthy returning customer base."
 ), unsafe_allow_html=True)
     # End Customers
+
+# -------------------------
 # --- Inventory
 # -------------------------
-elif current_page == "Inventory":
+LOW_STOCK_PAGE_SIZE = 25
+LOW_STOCK_COLUMNS = ['product_id', 'branch_id', 'store', 'product_name', 'product_category', 'status', 'urgency',
+                     'stock_available', 'reorder_level', 'velocity', 'days_of_cover', 'next_restock', 'order_qty']
+
+def render_low_stock(engine):
+    """Paged SKU/branch low-stock table sorted by reorder urgency."""
+    total = engine.flagged
+    st.write("Low stock by SKU and branch (most urgent first):")
+    if not total:
+        st.info("No SKU/branch is below its reorder point.")
+        return
+    pages = -(-total // LOW_STOCK_PAGE_SIZE)
+    if st.session_state.get("low_stock_page", 1) > pages:  # fewer flagged rows after a filter change
+        st.session_state["low_stock_page"] = pages
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key="low_stock_page")
+    rows, total = engine.page(int(page) - 1, LOW_STOCK_PAGE_SIZE)
+    view = rows[[c for c in LOW_STOCK_COLUMNS if c in rows.columns]].copy()
+    view['next_restock'] = view['next_restock'].dt.date
+    st.dataframe(view.round({'urgency': 2, 'velocity': 2, 'days_of_cover': 1}), use_container_width=True, hide_index=True)
+    first = (int(page) - 1) * LOW_STOCK_PAGE_SIZE
+    st.caption(f"Showing {first + 1:,}-{first + len(view):,} of {total:,} flagged SKU/branches "
+               f"({engine.watch:,} more on watch). Urgency >= 1: stock runs out before the next "
+               f"restock or sits at/below the reorder level.")
+    order = rows['order_qty'].sum() if len(rows) else 0
+    st.markdown(quick_insight_html("Stock Health", f"{total:,} SKU/branches need a reorder; "
+                                   f"this page alone needs {order:,.0f} units at the next restock."),
+                unsafe_allow_html=True)
+
+def render_inventory(ctx):
+    df_master, cube = ctx['df_master'], ctx['cube']
+
     st.markdown("<h1 style='color:#ffd27a'>Inventory & Stock Health</h1>", unsafe_allow_html=True)
     st.write("Stock levels, low-stock table and turnover rates.")
 
     if 'stock_available' in df_master.columns:
         # Stock by Category
-        if 'product_category' in df_master.columns:
-            df_stock = (df_master.groupby('product_category', observed=False)['stock_available']
-                        .sum().reset_index().sort_values('stock_available', ascending=False))
-            fig_stock = px.bar(df_stock, x='product_category', y='stock_available', title="Stock by Category", height=360)
-            fig_stock.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
-            st.plotly_chart(fig_stock, use_container_width=True)
+        if has_dims(cube, 'product_category'):
+            def build_stock():
+                df_stock = (rollup(cube, 'product_category')[['product_category', 'stock_available']]
+                            .sort_values('stock_available', ascending=False))
+                fig_stock = px.bar(df_stock, x='product_category', y='stock_available', title="Stock by Category", height=360)
+                fig_stock.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
+                return fig_stock
+            plotly_chart(cached_chart(ctx, 'stock_by_category', build_stock), use_container_width=True)
         else:
             st.info("product_category column not present - stock by category omitted.")
             st.markdown(quick_insight_html(
     "Inventory Insight",
     "Category-level stock analysis shows product availability balance — useful for preventing overstock or shortages."
 ), unsafe_allow_html=True)
-        # Low stock table (safe threshold using reorder_level if present else 20% of max)
-        reorder = df_master.get('reorder_level')
-        if 'reorder_level' in df_master.columns:
-            low = df_master[df_master['stock_available'] <= df_master['reorder_level']]
+        # Low stock: SKU/branch engine, most urgent first, paged off the urgency heap
+        engine = None
+        if inventory.available(df_master):
+            if ctx['simulated'] or not is_unfiltered(ctx['filters']):
+                engine = cached_chart(ctx, 'inventory_engine', lambda: inventory.engine_for(df_master))
+            else:
+                engine = inventory.master_inventory()
+        if engine is not None:
+            render_low_stock(engine)
         else:
-            threshold = df_master['stock_available'].max() * 0.2
-            low = df_master[df_master['stock_available'] <= threshold]
-        st.write("Low stock items sample (first 10):")
-        st.dataframe(low.head(10))
-        st.markdown(quick_insight_html("Stock Health", f"{len(low)} items flagged low stock."), unsafe_allow_html=True)
+            if 'reorder_level' in df_master.columns:
+                low = df_master[df_master['stock_available'] <= df_master['reorder_level']]
+            else:
+                threshold = df_master['stock_available'].max() * 0.2
+                low = df_master[df_master['stock_available'] <= threshold]
+            st.write("Low stock items sample (first 10):")
+            st.dataframe(low.head(10))
+            st.markdown(quick_insight_html("Stock Health", f"{len(low)} items flagged low stock."), unsafe_allow_html=True)
         # Stock turnover by category (requires units_sold or units_moved)
-        if 'units_sold' in df_master.columns and 'product_category' in df_master.columns:
-            turnover = (df_master.groupby('product_category', observed=False)
-                        .agg(total_units=('units_sold','sum'), avg_stock=('stock_available','mean'))
-                        .reset_index())
-            # avoid division by zero
-            turnover['turnover'] = turnover.apply(lambda r: (r['total_units'] / r['avg_stock']) if r['avg_stock'] and r['avg_stock']>0 else np.nan, axis=1)
-            fig_turn = px.bar(turnover.sort_values('turnover', ascending=False), x='product_category', y='turnover',
-                              title="Stock Turnover by Category (units sold / avg stock)", height=340)
-            fig_turn.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
-            st.plotly_chart(fig_turn, use_container_width=True)
+        if has_dims(cube, 'units_sold', 'product_category'):
+            def build_turnover():
+                turnover = (rollup(cube, 'product_category')
+                            .rename(columns={'units_sold': 'total_units', 'stock_available_mean': 'avg_stock'})
+                            [['product_category', 'total_units', 'avg_stock']])
+                # avoid division by zero
+                avg = turnover['avg_stock'].to_numpy(dtype=float)
+                turnover['turnover'] = np.where(avg > 0, turnover['total_units'].to_numpy(dtype=float) / np.where(avg > 0, avg, 1), np.nan)
+                fig_turn = px.bar(turnover.sort_values('turnover', ascending=False), x='product_category', y='turnover',
+                                  title="Stock Turnover by Category (units sold / avg stock)", height=340)
+                fig_turn.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
+                return fig_turn
+            plotly_chart(cached_chart(ctx, 'turnover', build_turnover), use_container_width=True)
         else:
             st.info("Stock turnover omitted (requires 'units_sold' and 'product_category').")
             st.markdown(quick_insight_html(
@@ -803,16 +1040,19 @@ elif current_page == "Inventory":
     "Categories with higher turnover indicate fast-moving items — these drive consistent revenue and should be prioritized."
 ), unsafe_allow_html=True)
         # Overstock vs Understock heatmap (requires stock_available and sales velocity proxy)
-        if {'stock_available','units_sold','product_category'}.issubset(df_master.columns):
-            heat = (df_master.groupby(['product_category'], observed=False)
-                    .agg(stock=('stock_available','sum'), sold=('units_sold','sum'))
-                    .reset_index())
-            # compute ratio sold/stock (higher = fast moving)
-            heat['sold_to_stock'] = heat.apply(lambda r: (r['sold'] / r['stock']) if r['stock'] and r['stock']>0 else 0, axis=1)
-            fig_heat = px.bar(heat.sort_values('sold_to_stock', ascending=False), x='product_category', y='sold_to_stock',
-                              title="Sold-to-Stock Ratio by Category (higher => fast-moving)", height=340)
-            fig_heat.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
-            st.plotly_chart(fig_heat, use_container_width=True)
+        if has_dims(cube, 'stock_available', 'units_sold', 'product_category'):
+            def build_heat():
+                heat = (rollup(cube, 'product_category')
+                        .rename(columns={'stock_available': 'stock', 'units_sold': 'sold'})
+                        [['product_category', 'stock', 'sold']])
+                # compute ratio sold/stock (higher = fast moving)
+                stock = heat['stock'].to_numpy(dtype=float)
+                heat['sold_to_stock'] = np.where(stock > 0, heat['sold'].to_numpy(dtype=float) / np.where(stock > 0, stock, 1), 0.0)
+                fig_heat = px.bar(heat.sort_values('sold_to_stock', ascending=False), x='product_category', y='sold_to_stock',
+                                  title="Sold-to-Stock Ratio by Category (higher => fast-moving)", height=340)
+                fig_heat.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
+                return fig_heat
+            plotly_chart(cached_chart(ctx, 'sold_to_stock', build_heat), use_container_width=True)
         else:
             st.info("Over/under-stock heatmap omitted (requires 'stock_available', 'units_sold', 'product_category').")
     else:
@@ -822,24 +1062,31 @@ elif current_page == "Inventory":
     "A higher sold-to-stock ratio reflects products that convert inventory to sales efficiently, reducing carrying costs."
 ), unsafe_allow_html=True)
     # End Inventory
+
+# -------------------------
 # --- Performance Section
 # -------------------------
-elif current_page == "Performance":
+def render_performance(ctx):
+    cube = ctx['cube']
+
     st.markdown("<h1 style='color:#ffd27a'>Performance Dashboard</h1>", unsafe_allow_html=True)
     st.write("Compare store and category performance, analyze profit margins, and identify top-performing regions and stores.")
 
     # --- Top Performing Regions
-    if 'region' in df_master.columns and 'revenue' in df_master.columns:
-        top_regions = df_master.groupby('region', observed=False)['revenue'].sum().reset_index()
-        top_regions = top_regions.sort_values('revenue', ascending=False)
-        fig_perf = px.bar(top_regions, x='region', y='revenue',
-                          title="Top Performing Regions (by Revenue)",
-                          labels={'region': 'Region', 'revenue': 'Total Revenue (₦)'},
-                          height=380)
-        fig_perf.update_layout(plot_bgcolor='rgba(0,0,0,0)',
-                               paper_bgcolor='rgba(0,0,0,0)',
-                               font_color='white', title_font_color='#ffd27a')
-        st.plotly_chart(fig_perf, use_container_width=True)
+    if has_dims(cube, 'region', 'revenue'):
+        def build_regions():
+            top_regions = rollup(cube, 'region')[['region', 'revenue']]
+            top_regions = top_regions.sort_values('revenue', ascending=False)
+            fig_perf = px.bar(top_regions, x='region', y='revenue',
+                              title="Top Performing Regions (by Revenue)",
+                              labels={'region': 'Region', 'revenue': 'Total Revenue (₦)'},
+                              height=380)
+            fig_perf.update_layout(plot_bgcolor='rgba(0,0,0,0)',
+                                   paper_bgcolor='rgba(0,0,0,0)',
+                                   font_color='white', title_font_color='#ffd27a')
+            return fig_perf, top_regions.head(1)
+        fig_perf, top_regions = cached_chart(ctx, 'top_regions', build_regions)
+        plotly_chart(fig_perf, use_container_width=True)
         if not top_regions.empty:
             top_r = top_regions.iloc[0]
             st.markdown(quick_insight_html(
@@ -850,18 +1097,24 @@ elif current_page == "Performance":
         st.info("Region or revenue data missing — cannot compute top performers.")
 
     # --- Top Performing Stores
+    st.subheader("Top Performing Stores")
+    render_store_rankings(ctx)
+
     # -------------------------------
     # --- Revenue by Sales Channel
-    if 'sales_channel' in df_master.columns and 'revenue' in df_master.columns:
-        channel_rev = df_master.groupby('sales_channel', observed=False)['revenue'].sum().reset_index()
-        fig_channel = px.pie(channel_rev, names='sales_channel', values='revenue',
-                             title="Revenue Distribution by Sales Channel")
-        fig_channel.update_layout(
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font_color='white', title_font_color='#ffd27a'
-        )
-        st.plotly_chart(fig_channel, use_container_width=True)
+    if has_dims(cube, 'sales_channel', 'revenue'):
+        def build_channel():
+            channel_rev = rollup(cube, 'sales_channel')[['sales_channel', 'revenue']]
+            fig_channel = px.pie(channel_rev, names='sales_channel', values='revenue',
+                                 title="Revenue Distribution by Sales Channel")
+            fig_channel.update_layout(
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)',
+                font_color='white', title_font_color='#ffd27a'
+            )
+            return fig_channel, channel_rev
+        fig_channel, channel_rev = cached_chart(ctx, 'channel_share', build_channel)
+        plotly_chart(fig_channel, use_container_width=True)
         if not channel_rev.empty:
             best_channel = channel_rev.loc[channel_rev['revenue'].idxmax()]
             st.markdown(quick_insight_html(
@@ -870,18 +1123,20 @@ elif current_page == "Performance":
             ), unsafe_allow_html=True)
 
     # --- Profit Margin by Product Category
-    if {'profit', 'revenue', 'product_category'}.issubset(df_master.columns):
-        margin = df_master.groupby('product_category', observed=False).agg(
-            total_revenue=('revenue', 'sum'),
-            total_profit=('profit', 'sum')
-        ).reset_index()
-        margin['profit_margin_%'] = (margin['total_profit'] / margin['total_revenue']) * 100
-        fig_margin = px.bar(margin, x='product_category', y='profit_margin_%',
-                            title="Profit Margins by Product Category (%)", height=380)
-        fig_margin.update_layout(plot_bgcolor='rgba(0,0,0,0)',
-                                 paper_bgcolor='rgba(0,0,0,0)',
-                                 font_color='white', title_font_color='#ffd27a')
-        st.plotly_chart(fig_margin, use_container_width=True)
+    if has_dims(cube, 'profit', 'revenue', 'product_category'):
+        def build_margin():
+            margin = (rollup(cube, 'product_category')
+                      .rename(columns={'revenue': 'total_revenue', 'profit': 'total_profit'})
+                      [['product_category', 'total_revenue', 'total_profit']])
+            margin['profit_margin_%'] = (margin['total_profit'] / margin['total_revenue']) * 100
+            fig_margin = px.bar(margin, x='product_category', y='profit_margin_%',
+                                title="Profit Margins by Product Category (%)", height=380)
+            fig_margin.update_layout(plot_bgcolor='rgba(0,0,0,0)',
+                                     paper_bgcolor='rgba(0,0,0,0)',
+                                     font_color='white', title_font_color='#ffd27a')
+            return fig_margin, margin
+        fig_margin, margin = cached_chart(ctx, 'category_margin', build_margin)
+        plotly_chart(fig_margin, use_container_width=True)
         if not margin.empty:
             top_margin = margin.loc[margin['profit_margin_%'].idxmax()]
             st.markdown(quick_insight_html(
@@ -898,36 +1153,16 @@ elif current_page == "Performance":
     ), unsafe_allow_html=True)
 
 # -------------------------
-# Forecasts — Business-as-Usual vs Veekstar Growth Model
-# -------------------------#
-elif current_page == "Forecasts":
-    st.markdown("<h1 style='color:#ffd27a'>Forecasts — Business-as-Usual vs Veekstar Growth Model</h1>", unsafe_allow_html=True)
+# --- Forecasts — Business-as-Usual vs Veekstar Growth Model
+# -------------------------
+def render_forecasts(ctx):
+    from data_store import load_output_csv
+    from model_registry import get_registry
+    from scenarios import get_simulator, has_features
+    from segment_forecasts import SEGMENTS_FILE
+    cube = ctx['cube']
 
-    # helper loader for forecast CSVs in outputs/
-    def robust_load_forecast(filename):
-        p = OUT_DIR / filename
-        if not p.exists():
-            return None
-        df = pd.read_csv(p)
-        # normalize column names
-        df.columns = [c.lower().strip() for c in df.columns]
-        # try common column names
-        if 'date' not in df.columns:
-            for cand in ['ds','timestamp','month']:
-                if cand in df.columns:
-                    df = df.rename(columns={cand: 'date'})
-                    break
-        if 'revenue' not in df.columns:
-            for cand in ['y','value','sales','rev','total_revenue']:
-                if cand in df.columns:
-                    df = df.rename(columns={cand: 'revenue'})
-                    break
-        # coerce types
-        if 'date' in df.columns:
-            df['date'] = pd.to_datetime(df['date'], errors='coerce')
-        if 'revenue' in df.columns:
-            df['revenue'] = pd.to_numeric(df['revenue'], errors='coerce').fillna(0)
-        return df
+    st.markdown("<h1 style='color:#ffd27a'>Forecasts — Business-as-Usual vs Veekstar Growth Model</h1>", unsafe_allow_html=True)
 
     forecast_base = robust_load_forecast("forecast_baseline.csv")
     forecast_imp  = robust_load_forecast("forecast_improvement.csv")
@@ -942,8 +1177,8 @@ elif current_page == "Forecasts":
 
     # If still missing, build a simple synthetic baseline from df_master monthly revenue if available
     if forecast_base is None:
-        if 'date' in df_master.columns and 'revenue' in df_master.columns:
-            monthly = (df_master.set_index('date').resample('M').sum(numeric_only=True).reset_index())
+        if has_dims(cube, 'month', 'revenue'):
+            monthly = cube_monthly(cube).rename(columns={'month': 'date'})
             baseline = monthly[['date','revenue']].tail(12).copy()
             forecast_base = baseline
             forecast_imp = baseline.copy()
@@ -955,8 +1190,22 @@ elif current_page == "Forecasts":
             forecast_base = pd.DataFrame({'date': dates, 'revenue': rev})
             forecast_imp  = pd.DataFrame({'date': dates, 'revenue': (rev * 1.18)})
 
+    # Live scoring: re-score the scenario feature tables through the trained models (see model_registry.py)
+    scored_live = False
+    registry = get_registry()
+    if forecast_imp is not None and registry.available():
+        try:
+            for scenario, fdf in [("baseline", forecast_base), ("improvement", forecast_imp)]:
+                preds = registry.predict_scenario(scenario, fdf)
+                for target in preds.columns:
+                    fdf[target] = preds[target].round(2)
+            scored_live = True
+            st.caption("Forecasts scored live by the revenue & profit models in models/.")
+        except Exception as e:
+            st.info(f"Live model scoring unavailable ({e}) — showing stored forecast values.")
+
     # If improvement file exists but exactly matches baseline (or sums to zero), force an improvement factor
-    if forecast_imp is None or forecast_imp['revenue'].sum() == 0 or forecast_imp['revenue'].equals(forecast_base['revenue']):
+    if not scored_live and (forecast_imp is None or forecast_imp['revenue'].sum() == 0 or forecast_imp['revenue'].equals(forecast_base['revenue'])):
         forecast_imp = forecast_base.copy()
         IMPROVE_FACTOR = 1.18
         forecast_imp['revenue'] = (forecast_imp['revenue'] * IMPROVE_FACTOR).round(2)
@@ -969,6 +1218,8 @@ elif current_page == "Forecasts":
     if 'date' in forecast_imp.columns:
         forecast_imp['date'] = pd.to_datetime(forecast_imp['date'], errors='coerce')
 
+    horizon = forecast_base['date'].nunique() if 'date' in forecast_base.columns else len(forecast_base)
+
     # Plot
     try:
         fig = go.Figure()
@@ -978,12 +1229,12 @@ elif current_page == "Forecasts":
         fig.add_trace(go.Scatter(x=forecast_imp['date'], y=forecast_imp['revenue'],
                                  mode='lines+markers', name='Veekstar Growth Model',
                                  line=dict(color='#ffd27a', width=3)))
-        fig.update_layout(title="Forecast Comparison (12 months)",
+        fig.update_layout(title=f"Forecast Comparison ({horizon} months)",
                           xaxis_title="Date", yaxis_title="Revenue (₦)",
                           plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
                           font_color='white', title_font_color='#ffd27a',
                           legend=dict(bgcolor='rgba(0,0,0,0)'))
-        st.plotly_chart(fig, config=pio.renderers["browser"].config)
+        plotly_chart(fig, config=pio.renderers["browser"].config)
     except Exception as e:
         st.error(f"Could not draw forecast chart: {e}")
     # ---- Extra: Forecast decomposition & simple error checks (safe, optional)
@@ -1007,7 +1258,7 @@ elif current_page == "Forecasts":
                 })
                 fig_trend = px.line(decomp_df, x='date', y='trend', title="Forecast Trend (decomposed)", height=260)
                 fig_trend.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
-                st.plotly_chart(fig_trend, use_container_width=True)
+                plotly_chart(fig_trend, use_container_width=True)
         else:
             # if statsmodels missing or series short - show a simple monthly baseline vs improvement residual chart
             # compute simple residual (improvement - baseline)
@@ -1020,7 +1271,7 @@ elif current_page == "Forecasts":
                 res_df['delta'] = res_df['improvement'] - res_df['baseline']
                 fig_res = px.bar(res_df, x='date', y='delta', title="Forecast Uplift by Month (improvement - baseline)", height=260)
                 fig_res.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', font_color='white', title_font_color='#ffd27a')
-                st.plotly_chart(fig_res, use_container_width=True)
+                plotly_chart(fig_res, use_container_width=True)
             except Exception:
                 pass
     except Exception:
@@ -1036,30 +1287,79 @@ elif current_page == "Forecasts":
         <div style='background:linear-gradient(90deg, rgba(20,20,20,0.6), rgba(10,10,10,0.45)); padding:14px; border-radius:12px; border:1px solid rgba(255,184,77,0.08)'>
           <div style="font-weight:700; color:#ffd27a; margin-bottom:6px;">Forecast Summary</div>
           <div style="color:#fff;">
-            <b>Baseline 12-month revenue (est):</b> ₦{baseline_revenue:,.0f}<br>
+            <b>Baseline {horizon}-month revenue (est):</b> ₦{baseline_revenue:,.0f}<br>
             <b>Veekstar Growth Model (est):</b> ₦{improved_revenue:,.0f}<br>
             <b>Estimated uplift:</b> <span style="color:{'#7CFC00' if uplift_pct>0 else '#FF6B6B'}">{uplift_pct:.2f}%</span>
           </div>
         </div>
         """, unsafe_allow_html=True)
-# -------------------------
-# End Forecasts
+
+    # ---- Segment forecasts (region / store / category, reconciled bottom-up; see segment_forecasts.py)
+    seg_fc = load_output_csv(SEGMENTS_FILE)
+    if seg_fc is not None and not seg_fc.empty:
+        st.markdown("<h3 style='color:#ffd27a'>Segment Forecasts</h3>", unsafe_allow_html=True)
+        c1, c2 = st.columns(2)
+        levels = [lv for lv in seg_fc['level'].unique() if lv != 'Total'] or ['Total']
+        level = c1.selectbox("Level", levels, key="seg_level")
+        seg_rows = seg_fc[seg_fc['level'] == level]
+        segment = c2.selectbox("Segment", sorted(seg_rows['segment'].unique()), key="seg_segment")
+        seg_rows = seg_rows[seg_rows['segment'] == segment].sort_values('ds')
+        fig_seg_fc = go.Figure()
+        for kind, color, dash in [('actual', '#cfc6a6', 'solid'), ('forecast', '#ffd27a', 'dot')]:
+            part = seg_rows[seg_rows['kind'] == kind]
+            fig_seg_fc.add_trace(go.Scatter(x=part['ds'], y=part['Revenue'], mode='lines', name=kind.title(),
+                                            line=dict(color=color, width=3, dash=dash)))
+        fig_seg_fc.update_layout(title=f"{level}: {segment} — Revenue", xaxis_title="Date", yaxis_title="Revenue (₦)",
+                                 plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
+                                 font_color='white', title_font_color='#ffd27a', legend=dict(bgcolor='rgba(0,0,0,0)'),
+                                 height=340)
+        plotly_chart(fig_seg_fc, use_container_width=True)
+        seg_total = seg_rows.loc[seg_rows['kind'] == 'forecast', 'Revenue'].sum()
+        all_total = seg_fc.loc[(seg_fc['level'] == level) & (seg_fc['kind'] == 'forecast'), 'Revenue'].sum()
+        if all_total > 0:
+            st.markdown(quick_insight_html("Segment Share",
+                                           f"{segment} accounts for {seg_total / all_total:.1%} of forecast revenue (₦{seg_total:,.0f})."),
+                        unsafe_allow_html=True)
+
+    # ---- What-if scenario simulator (drivers re-scored through the models, see scenarios.py)
+    if registry.available() and has_features(forecast_base):
+        st.markdown("<h3 style='color:#ffd27a'>What-if Scenario Simulator</h3>", unsafe_allow_html=True)
+        s1, s2 = st.columns(2)
+        drivers = {
+            'campaign_spend_pct': s1.slider("Campaign spend change (%)", -50, 100, 0, step=5, key="wi_campaign"),
+            'discount_delta': s1.slider("Discount rate change", -0.20, 0.20, 0.0, step=0.01, key="wi_discount"),
+            'loyalty_delta': s2.slider("Loyalty score change (pts)", -10.0, 10.0, 0.0, step=1.0, key="wi_loyalty"),
+            'satisfaction_delta': s2.slider("Satisfaction score change", -1.0, 1.0, 0.0, step=0.1, key="wi_satisfaction"),
+        }
+        try:
+            simulator = get_simulator()
+            sim_base = simulator.run(forecast_base, {})
+            sim = simulator.run(forecast_base, drivers)
+            fig_sim = go.Figure()
+            fig_sim.add_trace(go.Scatter(x=sim_base['date'], y=sim_base['revenue'], mode='lines',
+                                         name='No change', line=dict(color='#cfc6a6', width=2, dash='dot')))
+            fig_sim.add_trace(go.Scatter(x=sim['date'], y=sim['revenue'], mode='lines+markers',
+                                         name='Scenario', line=dict(color='#ffd27a', width=3)))
+            fig_sim.update_layout(title=f"Scenario Revenue ({len(sim)} months)", xaxis_title="Date", yaxis_title="Revenue (₦)",
+                                  plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)',
+                                  font_color='white', title_font_color='#ffd27a', legend=dict(bgcolor='rgba(0,0,0,0)'),
+                                  height=340)
+            plotly_chart(fig_sim, use_container_width=True)
+            base_rev, sim_rev = float(sim_base['revenue'].sum()), float(sim['revenue'].sum())
+            base_pft, sim_pft = float(sim_base['profit'].sum()), float(sim['profit'].sum())
+            rev_delta = ((sim_rev - base_rev) / base_rev * 100) if base_rev else 0.0
+            pft_delta = ((sim_pft - base_pft) / base_pft * 100) if base_pft else 0.0
+            m1, m2 = st.columns(2)
+            m1.metric("Scenario Revenue (₦)", f"{sim_rev:,.0f}", f"{rev_delta:+.2f}%")
+            m2.metric("Scenario Profit (₦)", f"{sim_pft:,.0f}", f"{pft_delta:+.2f}%")
+        except Exception as e:
+            st.info(f"Scenario simulator unavailable: {e}")
+
 # -------------------------
 # --- Business Insights
-# -------------------------#
-elif current_page == "Business Insights":
-    st.markdown("<h1 style='color:#ffd27a'>Business Insights</h1>", unsafe_allow_html=True)
-    mdtxt, mdpath = load_markdown(["veekstar_business_insights.md", "outputs/veekstar_business_insights.md"])
-    if mdtxt:
-        st.markdown(mdtxt, unsafe_allow_html=True)
-    else:
-        st.warning("Insights file not found. Please add 'veekstar_business_insights.md' to outputs/ or project root.")
-# -------------------------------
-# 💡 Key Takeaways & Recommendations
-# -------------------------------
-elif selected_page == "Key Takeaways & Recommendations":
-    st.title("💡 Key Takeaways & Strategic Recommendations")
-    st.markdown("""
+# -------------------------
+# 💡 Key Takeaways & Recommendations - shown when the insights markdown is missing
+KEY_TAKEAWAYS_HTML = """
     <p style='color:#ffd27a;font-weight:600;font-size:17px;margin-bottom:4px;'>Overall Performance</p>
     <ul style='color:white;font-size:14px;line-height:1.6;'>
       <li>Total revenue grew steadily by 7.3% MoM, led by the South-West region.</li>
@@ -1084,13 +1384,157 @@ elif selected_page == "Key Takeaways & Recommendations":
       <li>Use Veekstar predictive models for pricing optimization and regional targeting.</li>
       <li>Invest in demand forecasting to reduce slow-moving stock and enhance cash flow.</li>
     </ul>
-    """, unsafe_allow_html=True)
+    """
+
+def render_insights(ctx):
+    st.markdown("<h1 style='color:#ffd27a'>Business Insights</h1>", unsafe_allow_html=True)
+    mdtxt, mdpath = load_markdown(["veekstar_business_insights.md", "outputs/veekstar_business_insights.md"])
+    if mdtxt:
+        st.markdown(mdtxt, unsafe_allow_html=True)
+    else:
+        st.warning("Insights file not found. Please add 'veekstar_business_insights.md' to outputs/ or project root.")
+        st.title("💡 Key Takeaways & Strategic Recommendations")
+        st.markdown(KEY_TAKEAWAYS_HTML, unsafe_allow_html=True)
+
+# -------------------------
+# --- Admin (process diagnostics)
+# -------------------------
+@lru_cache(maxsize=2)
+def memory_report_for(version):
+    # one report per dataset version; the frame is this process's shared cached copy
+    from dataset_schema import memory_report
+    df, _ = load_master_dataset()
+    return memory_report(df), len(df)
+
+def render_memory_report(ctx):
+    st.subheader("Dataset memory (this worker)")
+    if ctx['simulated']:
+        st.info("No master dataset loaded - the memory report needs the real dataset.")
+        return
+    report, n_rows = memory_report_for(dataset_version(ctx['master_path']))
+    before, after = report['bytes_before'].sum(), report['bytes_after'].sum()
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Rows", f"{n_rows:,}")
+    c2.metric("Plain CSV types", f"{before / 2**20:,.1f} MB")
+    c3.metric("Compact types", f"{after / 2**20:,.1f} MB")
+    c4.metric("Reduction", f"{before / after:,.1f}×" if after else "-")
+    st.dataframe(report, use_container_width=True, hide_index=True,
+                 column_config={'bytes_before': st.column_config.NumberColumn("Before (bytes)", format="%d"),
+                                'bytes_after': st.column_config.NumberColumn("After (bytes)", format="%d"),
+                                'ratio': st.column_config.NumberColumn("Ratio", format="%.1f×"),
+                                'saved': st.column_config.NumberColumn("Saved (bytes)", format="%d")})
+    st.caption("Before: object strings and 64-bit numbers as read_csv returns them. "
+               "After: the schema in dataset_schema.py (categoricals, Arrow strings, downcast numbers, bools).")
+
+def page_breakdown(hists):
+    """Per page: render time split into chart output (serialize + send) and the rest
+    (data access, aggregation, figure building), averaged per render."""
+    rows = []
+    for page in PAGES + [ADMIN_PAGE]:
+        h = hists.get(f"page.{page}")
+        if not h or not h['count']:
+            continue
+        n = h['count']
+        charts = hists.get(f"page.{page}.chart", {})
+        payload = hists.get(f"page.{page}.chart_bytes", {})
+        chart_ms = charts.get('total', 0) / n
+        rows.append({'page': page, 'renders': n, 'render_p50_ms': h['p50'], 'render_p95_ms': h['p95'],
+                     'compute_ms': h['mean'] - chart_ms, 'charts_ms': chart_ms,
+                     'charts': charts.get('count', 0) / n, 'payload_kb': payload.get('total', 0) / n / 1024})
+    return pd.DataFrame(rows)
+
+def render_performance_panel():
+    st.subheader("Render performance (this worker)")
+    on = st.toggle("Collect timings", value=instrumentation.enabled(), key="admin_metrics",
+                   help="Applies to every session served by this process; when off the overhead is near zero.")
+    if on != instrumentation.enabled():
+        instrumentation.set_enabled(on)
+    c1, c2, _ = st.columns([1, 1, 4])
+    if c1.button("Reset", key="admin_metrics_reset"):
+        instrumentation.reset()
+    if c2.button("Export", key="admin_metrics_export"):
+        try:
+            st.success(f"Metrics written to {instrumentation.export()}")
+        except OSError as e:
+            st.warning(f"Could not write metrics file: {e}")
+    snap = instrumentation.snapshot()
+    hists = snap['histograms']
+    if not hists and not snap['counters']:
+        st.info("No measurements yet - switch collection on and open a few pages.")
+        return
+    st.caption(f"Since {snap['since']} (pid {snap['pid']}). Percentiles are histogram bucket bounds.")
+    pages = page_breakdown(hists)
+    if not pages.empty:
+        st.markdown("**Pages** (per render)")
+        st.dataframe(pages.round(1), use_container_width=True, hide_index=True)
+    spans = pd.DataFrame([{'span': k, 'count': h['count'], 'mean_ms': h['mean'], 'p50_ms': h['p50'],
+                           'p95_ms': h['p95'], 'max_ms': h['max'], 'total_ms': h['total']}
+                          for k, h in hists.items() if h['unit'] == 'ms'])
+    if not spans.empty:
+        st.markdown("**Spans**")
+        st.dataframe(spans.sort_values('total_ms', ascending=False).round(1), use_container_width=True, hide_index=True)
+    caches = pd.DataFrame([{'cache': k, 'hits': h, 'misses': m, 'hit_rate': h / (h + m) if h + m else None}
+                           for k, (h, m) in sorted(instrumentation.cache_stats().items())])
+    if not caches.empty:
+        st.markdown("**Caches**")
+        st.dataframe(caches, use_container_width=True, hide_index=True,
+                     column_config={'hit_rate': st.column_config.NumberColumn("Hit rate", format="%.2f")})
+
+def render_admin(ctx):
+    if not is_admin():
+        st.warning("The Admin page is only available to admin users.")
+        return
+    st.markdown("<h1 style='color:#ffd27a'>Admin</h1>", unsafe_allow_html=True)
+    render_memory_report(ctx)
+    render_performance_panel()
+
+PAGE_RENDERERS = {
+    "Overview": render_overview,
+    "Sales": render_sales,
+    "Customers": render_customers,
+    "Inventory": render_inventory,
+    "Performance": render_performance,
+    "Forecasts": render_forecasts,
+    "Business Insights": render_insights,
+    ADMIN_PAGE: render_admin,
+}
+
+def render(page, ctx):
+    """Render one page with the context from build_context()."""
+    renderer = PAGE_RENDERERS.get(page)
+    if renderer is None:
+        st.warning(f"Unknown page: {page}")
+        return
+    with instrumentation.span(f"page.{page}"):
+        renderer(ctx)
+
 # -------------------------
 # Footer
 # -------------------------
-st.markdown("""
+FOOTER_HTML = """
     <div style="position:relative;padding:20px 0 40px 0;text-align:center;color:rgba(255,255,255,0.7)">
         © 2025 Veekstar Retail Intelligence — Veekstar Insights
     </div>
-""", unsafe_allow_html=True)
+"""
 
+# -------------------------
+# Entry point (called by app.py on every rerun)
+# -------------------------
+def main():
+    if "is_mobile" not in st.session_state:
+        st.session_state.is_mobile = detect_device()
+    if "display_mode" not in st.session_state:
+        st.session_state["display_mode"] = "Auto"
+    with instrumentation.span("rerun"):
+        apply_theme()
+        page = navigation()
+        with instrumentation.span("context"):
+            ctx = build_context(page)
+        render(page, ctx)
+        st.markdown(FOOTER_HTML, unsafe_allow_html=True)
+    instrumentation.maybe_export()
+
+if __name__ == "__main__":
+    import streamlit.runtime.scriptrunner as scriptrunner
+    if scriptrunner.get_script_run_ctx() is not None:
+        main()
@@ -0,0 +1,315 @@
+# data_store.py - Veekstar Retail Intelligence (shared dataset layer)
+# Loads the master transaction dataset once per process and hands out
+# read-only views to every Streamlit session / rerun.
+import os
+import json
+import threading
+import hashlib
+import warnings
+from pathlib import Path
+
+import pandas as pd
+
+from dataset_schema import optimize_types
+from instrumentation import span, cache_result
+
+# pyarrow is optional: without it the loader simply stays on the CSV path
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:
+    pa = pq = None
+
+# -------------------------
+# Base directories
+# -------------------------
+BASE = Path(__file__).resolve().parent
+DATA_DIR = BASE / "data"
+OUT_DIR = BASE / "outputs"
+
+SNAPSHOT_PATH = DATA_DIR / "veekstar_master.parquet"
+SNAPSHOT_META_KEY = "veekstar_source"
+
+MASTER_CANDIDATES = [
+    "Veekstar_Retail_Cleaned.csv",
+    "veekstar_retail_data_final.csv",
+    "veekstar_retail_data.csv",
+    "Veekstar_Retail_Cleaned.CSV",
+    "sales_data.csv"
+]
+# master CSVs above this size are streamed into the partitioned store instead of read whole
+STREAM_MIN_BYTES = int(float(os.environ.get("VEEKSTAR_STREAM_MB", 1024)) * 2**20)
+
+# -------------------------
+# Copy-on-write (opt-in per entry point)
+# -------------------------
+def enable_copy_on_write():
+    """Turn on pandas copy-on-write for this process. The loaders hand out shallow
+    copies of one shared frame; with copy-on-write a caller that mutates its frame
+    in place gets a private copy instead of editing the shared one. It is a
+    process-wide pandas option, so only the dashboard and the API (which hold
+    shared frames for many sessions) call this - importing this module doesn't."""
+    try:
+        pd.set_option("mode.copy_on_write", True)
+    except Exception:
+        pass
+
+# -------------------------
+# Utilities: robust CSV loader & normalizer
+# -------------------------
+def too_large(path: Path):
+    try:
+        return Path(path).stat().st_size > STREAM_MIN_BYTES
+    except OSError:
+        return False
+
+def find_file(candidates):
+    """Look for candidate filenames under common folders (data/, outputs/, root)"""
+    for c in candidates:
+        # search exact relative to dashboard folder
+        p = BASE / c
+        if p.exists():
+            return p
+        # try in outputs and data subfolders
+        p2 = OUT_DIR / c
+        if p2.exists():
+            return p2
+        p3 = DATA_DIR / c
+        if p3.exists():
+            return p3
+    return None
+
+def load_csv_any(path: Path):
+    try:
+        # read with utf-8 and fallback to latin-1 if necessary
+        try:
+            df = pd.read_csv(path, parse_dates=False, low_memory=False)
+        except Exception:
+            df = pd.read_csv(path, encoding="latin-1", parse_dates=False, low_memory=False)
+        return df
+    except Exception as e:
+        warnings.warn(f"Failed to read CSV {path}: {e}")
+        return None
+
+def normalize_df_columns(df: pd.DataFrame):
+    # make a lowercase mapping to original
+    cols = {c: c.lower() for c in df.columns}
+    df = df.rename(columns=cols)
+    # Accept variants of date/revenue
+    # Rename first matching variant to 'date' and 'revenue'
+    date_keys = ['date', 'ds', 'transaction_date', 'sale_date', 'datetime']
+    rev_keys = ['revenue', 'total_revenue', 'sales', 'amount', 'total']
+    found_date = next((k for k in date_keys if k in df.columns), None)
+    if found_date and found_date != 'date':
+        df = df.rename(columns={found_date: 'date'})
+    found_rev = next((k for k in rev_keys if k in df.columns), None)
+    if found_rev and found_rev != 'revenue':
+        df = df.rename(columns={found_rev: 'revenue'})
+    return df
+
+def coerce_master_types(df: pd.DataFrame):
+    # parse date column if present
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    # ensure numeric revenue
+    if 'revenue' in df.columns:
+        df['revenue'] = pd.to_numeric(df['revenue'], errors='coerce')
+    return df
+
+# -------------------------
+# Columnar snapshot (typed Parquet written once by the ingest step)
+# -------------------------
+def write_parquet(df: pd.DataFrame, path: Path, meta: dict = None):
+    """Write `df` as Parquet with optional JSON metadata, atomically (tmp + rename)
+    so readers never see a half-written file."""
+    if pq is None:
+        raise RuntimeError("pyarrow is required to write Parquet files")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if meta:
+        schema_meta = dict(table.schema.metadata or {})
+        schema_meta.update({k.encode("utf-8") if isinstance(k, str) else k: json.dumps(v).encode("utf-8")
+                            for k, v in meta.items()})
+        table = table.replace_schema_metadata(schema_meta)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    pq.write_table(table, tmp)
+    os.replace(tmp, path)
+    return path
+
+def read_parquet_meta(path: Path, key):
+    """JSON metadata value written by write_parquet (None if absent/unreadable)."""
+    if pq is None or not Path(path).exists():
+        return None
+    try:
+        meta = pq.read_schema(path).metadata or {}
+        raw = meta.get(key.encode("utf-8") if isinstance(key, str) else key)
+        return json.loads(raw) if raw is not None else None
+    except Exception:
+        return None
+
+def build_snapshot(csv_path: Path = None, out_path: Path = SNAPSHOT_PATH):
+    """Convert the cleaned CSV into a typed Parquet snapshot. The source CSV
+    fingerprint is stored in the file metadata so staleness can be detected."""
+    if pq is None:
+        raise RuntimeError("pyarrow is required to build the columnar snapshot")
+    csv_path = Path(csv_path) if csv_path else find_file(MASTER_CANDIDATES)
+    if csv_path is None:
+        raise FileNotFoundError("Master dataset CSV not found in data/ or root")
+    df = _read_master(csv_path)
+    if df is None:
+        raise ValueError(f"Could not parse {csv_path}")
+    return write_parquet(df, out_path, {SNAPSHOT_META_KEY: list(file_fingerprint(csv_path)[1:])})
+
+def snapshot_is_fresh(csv_path: Path = None, snapshot_path: Path = SNAPSHOT_PATH):
+    """True when the snapshot exists and was built from the CSV as it is now
+    (a missing CSV counts as fresh - the snapshot is then the only source)."""
+    if pq is None or not Path(snapshot_path).exists():
+        return False
+    if csv_path is None:
+        return True
+    return read_parquet_meta(snapshot_path, SNAPSHOT_META_KEY) == list(file_fingerprint(csv_path)[1:])
+
+def _read_snapshot_columns(path: Path, columns=None):
+    table = pq.read_table(path, columns=columns)
+    # snapshots written before the compact schema are converted on read
+    return optimize_types(table.to_pandas())
+
+# -------------------------
+# Process-wide cache (keyed on file fingerprint)
+# -------------------------
+_CACHE_LOCK = threading.Lock()
+_BOOTSTRAP_LOCK = threading.Lock()
+_CACHE = {}  # cache key -> (fingerprint, DataFrame)
+
+def file_fingerprint(path: Path):
+    """(path, mtime_ns, size) - changes whenever the file is rewritten."""
+    s = os.stat(path)
+    return (str(Path(path).resolve()), s.st_mtime_ns, s.st_size)
+
+def fingerprint_version(fp):
+    """Short stable string for a fingerprint, usable as a cache / ETag key."""
+    return hashlib.sha1(repr(fp).encode("utf-8")).hexdigest()[:16]
+
+def dataset_version(path: Path):
+    """Version string of a dataset file as it is on disk right now."""
+    return fingerprint_version(file_fingerprint(path))
+
+def _read_master(path: Path):
+    df = load_csv_any(path)
+    if df is None:
+        return None
+    # compact types (dataset_schema.py): categoricals, downcast numerics, bools
+    return optimize_types(coerce_master_types(normalize_df_columns(df)))
+
+def _cached(key, path: Path, loader):
+    fp = file_fingerprint(path)
+    # one lock for the whole cache: concurrent sessions arriving during a
+    # reload wait for the single parse instead of starting their own
+    with _CACHE_LOCK:
+        hit = _CACHE.get(key)
+        cache_result(key if isinstance(key, str) else key[0], hit is not None and hit[0] == fp)
+        if hit is not None and hit[0] == fp:
+            return hit[1]
+        df = loader(path)
+        if df is not None:
+            _CACHE[key] = (fp, df)
+        else:
+            _CACHE.pop(key, None)
+        return df
+
+def _load_snapshot_projection(path: Path, columns):
+    """Serve `columns` from the snapshot, reading only the ones this process
+    has not loaded yet and merging them into the shared cached frame."""
+    fp = file_fingerprint(path)
+    with _CACHE_LOCK:
+        hit = _CACHE.get("master")
+        df = hit[1] if hit is not None and hit[0] == fp else None
+        available = pq.read_schema(path).names
+        wanted = available if columns is None else [c for c in columns if c in available]
+        missing = [c for c in wanted if df is None or c not in df.columns]
+        cache_result("snapshot", not missing)
+        if missing:
+            part = _read_snapshot_columns(path, missing)
+            df = part if df is None else pd.concat([df, part], axis=1)
+            df = df[[c for c in available if c in df.columns]]  # keep source column order
+            _CACHE["master"] = (fp, df)
+        return df[wanted]
+
+def load_master_dataset(columns=None):
+    """Return (read-only view of master df, path). (None, None) when no file is found,
+    (None, path) when the file could not be parsed.
+
+    `columns` projects the frame to the (normalized) column names a page uses;
+    with a fresh Parquet snapshot only those columns are read from disk. Once the
+    dataset lives in the partitioned store (ingest.py) that is the source; the
+    returned path is then the store manifest, whose fingerprint is the version."""
+    from partition_store import store_exists, load_store, MANIFEST_PATH as STORE_MANIFEST
+    with span("load_master_dataset"):
+        if store_exists():
+            try:
+                return load_store(columns).copy(deep=False), STORE_MANIFEST
+            except Exception as e:
+                warnings.warn(f"Partitioned store unreadable, falling back to CSV: {e}")
+        p = find_file(MASTER_CANDIDATES)
+        if snapshot_is_fresh(p):
+            try:
+                return _load_snapshot_projection(SNAPSHOT_PATH, columns).copy(deep=False), SNAPSHOT_PATH
+            except Exception as e:
+                warnings.warn(f"Snapshot {SNAPSHOT_PATH} unreadable, falling back to CSV: {e}")
+        if not p:
+            return None, None
+        if too_large(p):
+            # never materialize an oversized CSV: stream it into the store once, serve from there
+            with _BOOTSTRAP_LOCK:
+                if not store_exists():
+                    from ingest import bootstrap
+                    bootstrap()
+            return load_store(columns).copy(deep=False), STORE_MANIFEST
+        df = _cached("master", p, _read_master)
+        if df is None:
+            return None, p
+        if columns is not None:
+            df = df[[c for c in columns if c in df.columns]]
+        return df.copy(deep=False), p
+
+def _read_output_csv(path: Path):
+    df = load_csv_any(path)
+    if df is None:
+        return None
+    if 'ds' in df.columns:
+        df['ds'] = pd.to_datetime(df['ds'], errors='coerce')
+    return df
+
+def load_output_csv(name):
+    """Artifact from outputs/ (e.g. forecast_segments.csv), parsed once per file version."""
+    p = OUT_DIR / name
+    if not p.exists():
+        return None
+    df = _cached(("output", name), p, _read_output_csv)
+    return None if df is None else df.copy(deep=False)
+
+def master_version():
+    """Version string of the currently cached master dataset (None if not loaded)."""
+    hit = _CACHE.get("master")
+    return fingerprint_version(hit[0]) if hit else None
+
+def clear_cache():
+    with _CACHE_LOCK:
+        _CACHE.clear()
+
+
+# -------------------------
+# Ingest CLI: python data_store.py snapshot [--csv PATH] [--out PATH]
+# -------------------------
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Veekstar dataset ingest")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    snap = sub.add_parser("snapshot", help="convert the cleaned CSV into a typed Parquet snapshot")
+    snap.add_argument("--csv", type=Path, default=None)
+    snap.add_argument("--out", type=Path, default=SNAPSHOT_PATH)
+    args = parser.parse_args()
+    if args.cmd == "snapshot":
+        out = build_snapshot(args.csv, args.out)
+        print(f"Snapshot written: {out}")
@@ -0,0 +1,158 @@
+# dataset_schema.py - Veekstar Retail Intelligence (compact in-memory types)
+# One schema for the master dataset, applied by every loader (CSV, Parquet
+# snapshot, partitioned store): repeated strings become dictionary-encoded
+# categoricals, unique text becomes Arrow-backed strings, small integers and
+# scores are downcast and the Yes/No style flags become bools. Money columns
+# stay float64. Columns the schema doesn't know are encoded by cardinality.
+#
+# memory_report() compares each column with the plain read_csv representation
+# (object strings, float64/int64) - shown on the Admin page.
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401 - enables string[pyarrow]
+    STRING_DTYPE = pd.StringDtype("pyarrow")
+except Exception:
+    STRING_DTYPE = object
+
+# column -> storage kind
+MASTER_SCHEMA = {
+    'transaction_id': 'string',
+    'store': 'category',
+    'branch_id': 'category',
+    'sales_channel': 'category',
+    'product_id': 'string',
+    'product_category': 'category',
+    'product_name': 'category',
+    'brand': 'category',
+    'unit_cost': 'float64',
+    'unit_price': 'float64',
+    'units_sold': 'int16',
+    'revenue': 'float64',
+    'cost_of_sales': 'float64',
+    'profit': 'float64',
+    'discount_applied': 'int8',
+    'payment_method': 'category',
+    'transaction_time': 'string',
+    'customer_id': 'string',
+    'customer_name': 'category',
+    'gender': 'category',
+    'age': 'float32',
+    'marital_status': 'category',
+    'occupation': 'category',
+    'income_level': 'category',
+    'customer_segment': 'category',
+    'loyalty_score': 'float32',
+    'stock_available': 'int32',
+    'reorder_level': 'int32',
+    'supplier': 'category',
+    'restock_frequency': 'int16',
+    'promotion_type': 'category',
+    'campaign_name': 'category',
+    'campaign_spend': 'int32',
+    'customer_response': 'category',
+    'ad_channel': 'category',
+    'month': 'category',
+    'year': 'int16',
+    'quarter': 'category',
+    'weekday': 'category',
+    'holiday_period': 'bool',
+    'repeat_purchase': 'bool',
+    'satisfaction_score': 'float32',
+    'computed_revenue': 'float64',
+    'region': 'category',
+}
+# unknown text columns with at most this share of distinct values are dictionary-encoded
+CATEGORY_MAX_RATIO = 0.5
+_TRUE = {'true', 'yes', 'y', '1', 't'}
+_FALSE = {'false', 'no', 'n', '0', 'f'}
+
+# -------------------------
+# Conversions
+# -------------------------
+def to_bool(s: pd.Series):
+    """bool column; 'boolean' (nullable) when some values are missing or unrecognized."""
+    if s.dtype == bool:
+        return s
+    if pd.api.types.is_numeric_dtype(s) and not isinstance(s.dtype, pd.CategoricalDtype):
+        out = s.map({1: True, 0: False})
+    else:
+        text = s.astype(object).where(s.notna()).map(lambda v: str(v).strip().lower(), na_action='ignore')
+        out = text.map(lambda v: True if v in _TRUE else False if v in _FALSE else None, na_action='ignore')
+    out = out.astype('boolean')
+    return out.astype(bool) if not out.isna().any() else out
+
+def to_int(s: pd.Series, dtype):
+    """Downcast integer column; float32 when it has missing values (exact up to 2**24).
+    Columns holding fractional values are not integer columns and stay float64."""
+    s = pd.to_numeric(s, errors='coerce')
+    if pd.api.types.is_float_dtype(s) and not (s.dropna() % 1 == 0).all():
+        return s.astype('float64')
+    if s.isna().any():
+        return s.astype('float32')
+    info = np.iinfo(dtype)
+    if len(s) and (s.min() < info.min or s.max() > info.max):
+        return s.astype('int64')
+    return s.astype(dtype)
+
+def _is_text(s: pd.Series):
+    return s.dtype == object or isinstance(s.dtype, pd.StringDtype)
+
+def optimize_column(s: pd.Series, kind=None):
+    """`s` in its compact dtype. Columns already in the target dtype are returned as-is."""
+    if kind is None:
+        if not _is_text(s):
+            return s
+        kind = 'category' if s.nunique(dropna=True) <= CATEGORY_MAX_RATIO * max(len(s), 1) else 'string'
+    if kind == 'category':
+        return s if isinstance(s.dtype, pd.CategoricalDtype) else s.astype('category')
+    if kind == 'string':
+        if STRING_DTYPE is object or s.dtype == STRING_DTYPE:
+            return s
+        return s.astype(object).where(s.notna()).astype(STRING_DTYPE)
+    if kind == 'bool':
+        return s if s.dtype == bool or s.dtype == 'boolean' else to_bool(s)
+    if kind.startswith('int'):
+        return s if s.dtype == kind else to_int(s, kind)
+    if s.dtype == kind:
+        return s
+    return pd.to_numeric(s, errors='coerce').astype(kind)
+
+def optimize_types(df: pd.DataFrame, schema=MASTER_SCHEMA):
+    """Apply the schema to every column of `df` (date and other datetimes untouched)."""
+    for c in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[c]):
+            continue
+        out = optimize_column(df[c], schema.get(c))
+        if out is not df[c]:
+            df[c] = out
+    return df
+
+# -------------------------
+# Memory report
+# -------------------------
+def baseline_column(s: pd.Series):
+    """The column as plain read_csv would hold it (object text, 64-bit numbers)."""
+    if isinstance(s.dtype, pd.CategoricalDtype) or isinstance(s.dtype, pd.StringDtype):
+        return s.astype(object)
+    if s.dtype == 'boolean':
+        return s.astype(object)
+    if pd.api.types.is_float_dtype(s):
+        return s.astype('float64')
+    if pd.api.types.is_integer_dtype(s):
+        return s.astype('int64')
+    return s
+
+def memory_report(df: pd.DataFrame):
+    """Per-column bytes before (read_csv types) and after (compact types), largest saving first."""
+    rows = []
+    for c in df.columns:
+        s = df[c]
+        before = int(baseline_column(s).memory_usage(index=False, deep=True))
+        after = int(s.memory_usage(index=False, deep=True))
+        rows.append({'column': c, 'dtype': str(s.dtype), 'bytes_before': before, 'bytes_after': after})
+    report = pd.DataFrame(rows, columns=['column', 'dtype', 'bytes_before', 'bytes_after'])
+    report['ratio'] = (report['bytes_before'] / report['bytes_after'].where(report['bytes_after'] > 0)).round(1)
+    report['saved'] = report['bytes_before'] - report['bytes_after']
+    return report.sort_values('saved', ascending=False, ignore_index=True)
@@ -0,0 +1,111 @@
+# drilldown.py - Veekstar Retail Intelligence (server-side paged row grid)
+# The transactions behind a chart are browsed one page at a time: filters on
+# the indexed columns (date + FILTER_DIMS) come from DatasetIndex, sorting runs
+# on a numeric sort key per column and only the rows of the requested page are
+# materialized and sent to the browser. The first pages of a sort use a
+# partial sort (argpartition, O(n)); deeper pages trigger one full stable sort
+# whose order is cached per (dataset version, filter, sort column, direction).
+# Page boundaries are identical either way: ties always break on row position.
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from query_engine import filter_key
+from instrumentation import cache_result
+
+GRID_COLUMNS = ['date', 'transaction_id', 'store', 'region', 'branch_id', 'sales_channel', 'product_category',
+                'product_name', 'product_id', 'units_sold', 'unit_price', 'revenue', 'profit',
+                'customer_id', 'payment_method']
+PAGE_SIZES = (25, 50, 100, 250)
+PARTIAL_SHARE = 0.1  # prefixes up to this share of the selection use a partial sort
+MAX_ORDERS = 8
+
+# -------------------------
+# Sort keys
+# -------------------------
+def sort_key(s: pd.Series, descending=False):
+    """float64 key whose ascending order is the requested order of `s`; missing
+    values map to +inf so they come last in both directions."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        cats = s.cat.categories
+        rank = np.empty(len(cats), dtype=np.float64)
+        rank[np.argsort(cats.astype(str), kind='stable')] = np.arange(len(cats))
+        codes = s.cat.codes.to_numpy()
+        key = np.where(codes >= 0, rank[codes], np.nan)
+    elif pd.api.types.is_datetime64_any_dtype(s):
+        v = s.to_numpy(dtype='datetime64[ns]')
+        key = np.where(np.isnat(v), np.nan, v.view('i8').astype(np.float64))
+    elif pd.api.types.is_bool_dtype(s) or pd.api.types.is_numeric_dtype(s):
+        key = pd.to_numeric(s, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    else:
+        codes, _ = pd.factorize(s, sort=True)
+        key = np.where(codes >= 0, codes, np.nan).astype(np.float64)
+    if descending:
+        key = -key
+    return np.where(np.isnan(key), np.inf, key)
+
+def ordered_prefix(key, stop):
+    """Positions (into key) of the first `stop` entries of the stable ascending sort."""
+    n = len(key)
+    if stop >= n:
+        return np.argsort(key, kind='stable')
+    if stop <= 0:
+        return np.empty(0, dtype=np.int64)
+    kth = np.partition(key, stop - 1)[stop - 1]
+    below = np.flatnonzero(key < kth)
+    ties = np.flatnonzero(key == kth)[:stop - len(below)]  # lowest positions first, as a stable sort
+    pick = np.concatenate([below, ties])
+    return pick[np.argsort(key[pick], kind='stable')]
+
+# -------------------------
+# Grid
+# -------------------------
+_LOCK = threading.Lock()
+_ORDERS = OrderedDict()  # (version, filter key, column, descending) -> full order (selection positions)
+
+def _order(df, rows, column, descending, stop, cache_key):
+    """Selection-relative positions of the first `stop` sorted rows."""
+    if cache_key is not None:
+        with _LOCK:
+            if cache_key in _ORDERS:
+                _ORDERS.move_to_end(cache_key)
+                cache_result("grid_order", True)
+                return _ORDERS[cache_key][:stop]
+    values = df[column] if rows is None else df[column].take(rows)
+    key = sort_key(values, descending)
+    if stop <= PARTIAL_SHARE * len(key):
+        return ordered_prefix(key, stop)
+    order = np.argsort(key, kind='stable')
+    if cache_key is not None:
+        cache_result("grid_order", False)
+        with _LOCK:
+            _ORDERS[cache_key] = order
+            while len(_ORDERS) > MAX_ORDERS:
+                _ORDERS.popitem(last=False)
+    return order[:stop]
+
+def fetch_page(df: pd.DataFrame, index, filters=None, sort_by=None, descending=False, page=0, size=50,
+               columns=None, version=None):
+    """Page `page` (0-based) of the rows of `df` matching `filters` (answered by
+    `index`, built on the same row order), sorted by `sort_by`. Only the page's
+    rows are copied. Returns (page frame, total matching rows). With a dataset
+    `version` the full sort order of deep pages is cached."""
+    rows = index.select(filters) if index is not None else None
+    total = len(df) if rows is None else len(rows)
+    start, stop = page * size, min((page + 1) * size, total)
+    columns = [c for c in (columns or GRID_COLUMNS) if c in df.columns]
+    if start >= stop:
+        return df[columns].iloc[0:0], total
+    if sort_by in df.columns:
+        cache_key = None if version is None else (version, filter_key(filters), sort_by, bool(descending))
+        picks = _order(df, rows, sort_by, descending, stop, cache_key)[start:stop]
+    else:
+        picks = np.arange(start, stop)
+    positions = picks if rows is None else rows[picks]
+    return df[columns].take(positions).reset_index(drop=True), total
+
+def clear_cache():
+    with _LOCK:
+        _ORDERS.clear()
@@ -0,0 +1,326 @@
+# forecast_pipeline.py - Veekstar Retail Intelligence (offline forecast pipeline)
+# Reproducible replacement for the notebook that produced outputs/*.csv:
+#   master dataset -> monthly feature table -> revenue & profit models
+#   -> recursive baseline / improvement forecasts -> outputs/ + models/
+# Target fits run in a process pool; unchanged inputs are skipped by content hash.
+# The horizon is capped at half the monthly history (see supported_horizon).
+#
+# Run: python forecast_pipeline.py [--force] [--jobs N] [--horizon 36]
+import json
+import hashlib
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import joblib
+
+from data_store import (BASE, OUT_DIR, MASTER_CANDIDATES, find_file, load_master_dataset,
+                        load_csv_any, normalize_df_columns, coerce_master_types)
+from partition_store import MANIFEST_PATH as STORE_MANIFEST, store_exists
+from model_registry import MODELS_DIR, MODEL_FILES, FEATURES
+from scenarios import simulate_batch, driver_grid, quantize
+from segment_forecasts import SEGMENT_DIMS, SEGMENTS_FILE, run_segments
+
+MANIFEST_PATH = OUT_DIR / "pipeline_manifest.json"
+OUTPUT_FILES = ["forecast_baseline.csv", "forecast_improvement.csv",
+                "forecast_yearly_summary.csv", "monthly_trends.csv", SEGMENTS_FILE]
+
+TARGETS = {'revenue': 'Revenue', 'profit': 'Profit'}
+# monthly aggregation of the transaction-level drivers
+DRIVER_AGG = {
+    'Units_Sold': 'sum',
+    'Campaign_Spend': 'sum',
+    'Discount_Applied': 'mean',
+    'Loyalty_Score': 'mean',
+    'Satisfaction_Score': 'mean',
+    'Holiday_Period': 'mean',
+}
+HOLIDAY_MONTHS = (11, 12)
+# "Veekstar Growth Model": sustained driver improvements (slider units of scenarios.DRIVERS)
+IMPROVEMENT = {'campaign_spend_pct': 15, 'discount_delta': -0.05, 'loyalty_delta': 5.0, 'satisfaction_delta': 0.2}
+DEFAULT_HORIZON = 36
+SEASON = 12  # months
+
+# small monthly history: shallow trees and a low min-leaf size, otherwise
+# LightGBM degenerates to a single leaf (a constant forecast)
+LGBM_PARAMS = dict(objective='regression', n_estimators=300, learning_rate=0.05, num_leaves=7,
+                   min_child_samples=3, subsample=0.8, subsample_freq=5, colsample_bytree=0.9,
+                   random_state=42, verbose=-1)
+
+# -------------------------
+# Hashing / manifest
+# -------------------------
+def file_sha1(path: Path, chunk=1 << 20):
+    h = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def frame_sha1(df: pd.DataFrame):
+    return hashlib.sha1(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes()).hexdigest()
+
+def config_sha1(horizon):
+    cfg = {'params': LGBM_PARAMS, 'improvement': IMPROVEMENT, 'horizon': horizon,
+           'drivers': DRIVER_AGG, 'driver_path': 'seasonal-yoy', 'features': FEATURES}
+    return hashlib.sha1(json.dumps(cfg, sort_keys=True).encode("utf-8")).hexdigest()
+
+def load_manifest(path: Path = MANIFEST_PATH):
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+def save_manifest(manifest, path: Path = MANIFEST_PATH):
+    Path(path).write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+
+def mark_stale(path: Path = MANIFEST_PATH):
+    """Forget the input hash so the next run rebuilds (called by ingest.py after
+    new rows land in the store). Models are still reused if their data is unchanged."""
+    manifest = load_manifest(path)
+    if manifest.pop('input', None) is not None:
+        save_manifest(manifest, path)
+
+# -------------------------
+# Feature table
+# -------------------------
+def add_lag_features(m: pd.DataFrame):
+    """Lag / rolling features on a month-ordered frame with Revenue & Profit."""
+    m['month'] = m['ds'].dt.month
+    m['is_holiday_month'] = m['month'].isin(HOLIDAY_MONTHS).astype(int)
+    m['rev_lag_1'] = m['Revenue'].shift(1)
+    m['rev_lag_3'] = m['Revenue'].shift(3)
+    m['rev_roll_3_mean'] = m['Revenue'].shift(1).rolling(3).mean()
+    m['profit_lag_1'] = m['Profit'].shift(1)
+    m['profit_roll_3_mean'] = m['Profit'].shift(1).rolling(3).mean()
+    return m
+
+def monthly_features(df: pd.DataFrame):
+    """Monthly feature table (one row per calendar month) from normalized transactions."""
+    lower = {k.lower(): k for k in DRIVER_AGG}
+    work = pd.DataFrame({'ds': pd.to_datetime(df['date'], errors='coerce').dt.to_period('M').dt.to_timestamp()})
+    for col, target in TARGETS.items():
+        work[target] = pd.to_numeric(df[col], errors='coerce')
+    agg = {t: (t, 'sum') for t in TARGETS.values()}
+    for low, feat in lower.items():
+        if low in df.columns:
+            work[feat] = pd.to_numeric(df[low], errors='coerce').astype(float)
+            agg[feat] = (feat, DRIVER_AGG[feat])
+    m = work.dropna(subset=['ds']).groupby('ds').agg(**agg)
+    m = m.reindex(pd.date_range(m.index.min(), m.index.max(), freq='MS')).rename_axis('ds')
+    m[list(TARGETS.values())] = m[list(TARGETS.values())].fillna(0)
+    m = m.ffill().reset_index()
+    for feat in DRIVER_AGG:
+        if feat not in m.columns:
+            m[feat] = 0.0
+    return add_lag_features(m)
+
+def future_drivers(history: pd.DataFrame, horizon):
+    """Baseline driver path: each month repeats the drivers of the same calendar
+    month a year earlier (history, then forecast), with the summed volume drivers
+    scaled by their year-over-year growth; without a year of history each month
+    carries the mean of the previous three. Calendar fields follow the dates."""
+    drivers = list(DRIVER_AGG)
+    window = history[drivers].to_numpy(dtype=float).tolist()
+    growth = np.ones(len(drivers))
+    if len(window) >= 2 * SEASON:
+        last, prev = np.sum(window[-SEASON:], axis=0), np.sum(window[-2 * SEASON:-SEASON], axis=0)
+        volume = np.array([DRIVER_AGG[d] == 'sum' for d in drivers]) & (prev > 0)
+        growth[volume] = last[volume] / prev[volume]
+    rows = []
+    for _ in range(horizon):
+        nxt = np.asarray(window[-SEASON]) * growth if len(window) >= SEASON else np.mean(window[-3:], axis=0)
+        rows.append(nxt)
+        window.append(nxt)
+    fut = pd.DataFrame(rows, columns=drivers)
+    fut.insert(0, 'ds', pd.date_range(history['ds'].max() + pd.offsets.MonthBegin(1), periods=horizon, freq='MS'))
+    fut['month'] = fut['ds'].dt.month
+    fut['is_holiday_month'] = fut['month'].isin(HOLIDAY_MONTHS).astype(int)
+    # seed lag features for the first forecast month from actual history
+    rev, pft = history['Revenue'].to_numpy(), history['Profit'].to_numpy()
+    for c in ['rev_lag_1', 'rev_lag_3', 'rev_roll_3_mean', 'profit_lag_1', 'profit_roll_3_mean']:
+        fut[c] = np.nan
+    fut.loc[0, ['rev_lag_1', 'rev_lag_3', 'rev_roll_3_mean']] = [rev[-1], rev[-3], rev[-3:].mean()]
+    fut.loc[0, ['profit_lag_1', 'profit_roll_3_mean']] = [pft[-1], pft[-3:].mean()]
+    return fut
+
+# -------------------------
+# Training (process pool)
+# -------------------------
+def fit_model(X: pd.DataFrame, y: pd.Series, params=None):
+    """Fit one regressor. LightGBM (saved as a Booster, like the original pickles)
+    when installed, scikit-learn gradient boosting otherwise. Top-level so it
+    can run in a worker process."""
+    params = dict(params or LGBM_PARAMS)
+    try:
+        import lightgbm as lgb
+        model = lgb.LGBMRegressor(**params)
+        model.fit(X, y)
+        return model.booster_
+    except ImportError:
+        from sklearn.ensemble import GradientBoostingRegressor
+        model = GradientBoostingRegressor(n_estimators=params.get('n_estimators', 300),
+                                          learning_rate=params.get('learning_rate', 0.05),
+                                          max_depth=3, min_samples_leaf=params.get('min_child_samples', 3),
+                                          random_state=params.get('random_state', 42))
+        model.fit(X, y)
+        return model
+
+def train_models(jobs, jobs_n=None):
+    """Fit {key: (X, y)} in a process pool. Returns {key: model}."""
+    if not jobs:
+        return {}
+    if jobs_n == 1 or len(jobs) == 1:
+        return {k: fit_model(X, y) for k, (X, y) in jobs.items()}
+    with ProcessPoolExecutor(max_workers=jobs_n) as pool:
+        futures = {k: pool.submit(fit_model, X, y) for k, (X, y) in jobs.items()}
+        return {k: f.result() for k, f in futures.items()}
+
+class _Models:
+    """Minimal registry interface (get) over freshly trained models."""
+    def __init__(self, models):
+        self.models = models
+
+    def get(self, name):
+        return self.models[name]
+
+# -------------------------
+# Forecast outputs
+# -------------------------
+def scenario_frame(fut: pd.DataFrame, history: pd.DataFrame, scenario, q, revenue, profit):
+    """Output rows in the outputs/forecast_*.csv schema for one scenario."""
+    grid = driver_grid(fut.rename(columns={'ds': 'date'}), [q])
+    out = pd.DataFrame({'ds': fut['ds']})
+    for f in FEATURES:
+        if f in grid:
+            out[f] = grid[f][0]
+    rev = pd.Series(np.concatenate([history['Revenue'].to_numpy()[-3:], revenue]))
+    pft = pd.Series(np.concatenate([history['Profit'].to_numpy()[-3:], profit]))
+    out['rev_lag_1'] = rev.shift(1).to_numpy()[3:]
+    out['rev_lag_3'] = rev.shift(3).to_numpy()[3:]
+    out['rev_roll_3_mean'] = rev.shift(1).rolling(3).mean().to_numpy()[3:]
+    out['profit_lag_1'] = pft.shift(1).to_numpy()[3:]
+    out['profit_roll_3_mean'] = pft.shift(1).rolling(3).mean().to_numpy()[3:]
+    out[['month', 'is_holiday_month']] = out[['month', 'is_holiday_month']].astype(int)
+    out['Revenue'] = revenue
+    out['Profit'] = profit
+    out['scenario'] = scenario
+    return out[['ds'] + FEATURES + ['Revenue', 'Profit', 'scenario']]
+
+def forecast_scenarios(models, history: pd.DataFrame, horizon):
+    fut = future_drivers(history, horizon)
+    qs = {'baseline': quantize({}), 'improvement': quantize(IMPROVEMENT)}
+    _, revenue, profit = simulate_batch(fut, list(qs.values()), horizon, _Models(models))
+    return {name: scenario_frame(fut, history, name, q, revenue[i], profit[i])
+            for i, (name, q) in enumerate(qs.items())}
+
+def yearly_summary(frames):
+    allf = pd.concat(frames.values(), ignore_index=True)
+    allf['year'] = allf['ds'].dt.year
+    return allf.groupby(['scenario', 'year'])[['Revenue', 'Profit']].sum().reset_index()
+
+def supported_horizon(months, horizon):
+    """Forecast months the history supports: at most half of it. The tree models
+    can't extrapolate, so a rollout much longer than the seasons they were fitted
+    on settles into replaying them."""
+    return min(horizon, months // 2)
+
+def monthly_trends(history: pd.DataFrame):
+    return pd.DataFrame({'Month_Num': history['ds'].dt.strftime('%Y-%m-%d'),
+                         'Revenue': history['Revenue'], 'Profit': history['Profit'],
+                         'Month_Label': history['ds'].dt.strftime('%Y-%m')})
+
+# -------------------------
+# Pipeline
+# -------------------------
+def load_source(data_path: Path = None):
+    """Normalized transactions: the cached master dataset, or an explicit file."""
+    columns = ['date'] + list(TARGETS) + [k.lower() for k in DRIVER_AGG] + SEGMENT_DIMS
+    if data_path is None:
+        return load_master_dataset(columns=columns)[0]
+    df = load_csv_any(data_path)
+    return None if df is None else coerce_master_types(normalize_df_columns(df))
+
+def run(force=False, jobs=None, horizon=DEFAULT_HORIZON, data_path=None,
+        out_dir: Path = OUT_DIR, models_dir: Path = MODELS_DIR, log=print):
+    explicit = data_path is not None
+    if explicit:
+        data_path = Path(data_path)
+    else:
+        # load_source reads the partitioned store once ingest.py created it; its
+        # manifest lists every ingested file and partition, so it is the input to hash
+        data_path = STORE_MANIFEST if store_exists() else find_file(MASTER_CANDIDATES)
+    if data_path is None:
+        raise FileNotFoundError("Master dataset not found in data/ or root")
+    out_dir, models_dir = Path(out_dir), Path(models_dir)
+    manifest_path = out_dir / MANIFEST_PATH.name
+    manifest = load_manifest(manifest_path)
+    input_hash, cfg_hash = file_sha1(data_path), config_sha1(horizon)
+    outputs_exist = all((out_dir / f).exists() for f in OUTPUT_FILES) and \
+        all((models_dir / f).exists() for f in MODEL_FILES.values())
+    if not force and outputs_exist and manifest.get('input') == input_hash and manifest.get('config') == cfg_hash:
+        log("Inputs unchanged - forecast artifacts are up to date (use --force to rebuild).")
+        return manifest
+
+    df = load_source(data_path if explicit else None)
+    if df is None:
+        raise ValueError(f"Could not read {data_path}")
+    features = monthly_features(df)
+    train = features.dropna(subset=FEATURES)
+    if len(train) < 6:
+        raise ValueError(f"Not enough monthly history to train ({len(train)} usable months)")
+    log(f"Feature table: {len(features)} months, {len(train)} usable for training")
+    supported = supported_horizon(len(features), horizon)
+    if supported < horizon:
+        log(f"Only {len(features)} months of history - forecasting {supported} of {horizon} months")
+        horizon = supported
+
+    # per-target fits, skipped when the training data + config are unchanged
+    fits, models, model_hashes = {}, {}, dict(manifest.get('models', {}))
+    for target, col in TARGETS.items():
+        key = hashlib.sha1((frame_sha1(train[FEATURES + [col]]) + cfg_hash).encode()).hexdigest()
+        path = models_dir / MODEL_FILES[target]
+        if not force and path.exists() and model_hashes.get(target) == key:
+            models[target] = joblib.load(path)
+            log(f"  {target}: unchanged, reusing {path.name}")
+        else:
+            fits[target] = (train[FEATURES], train[col])
+            model_hashes[target] = key
+    trained = train_models(fits, jobs)
+    if trained:
+        models_dir.mkdir(parents=True, exist_ok=True)
+        for target, model in trained.items():
+            joblib.dump(model, models_dir / MODEL_FILES[target])
+            log(f"  {target}: trained -> {MODEL_FILES[target]}")
+    models.update(trained)
+
+    frames = forecast_scenarios(models, features, horizon)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    frames['baseline'].to_csv(out_dir / "forecast_baseline.csv", index=False)
+    frames['improvement'].to_csv(out_dir / "forecast_improvement.csv", index=False)
+    yearly_summary(frames).to_csv(out_dir / "forecast_yearly_summary.csv", index=False)
+    monthly_trends(features).to_csv(out_dir / "monthly_trends.csv", index=False)
+    log(f"Forecasts written to {out_dir} ({horizon} months)")
+
+    # region / store / category forecasts, reconciled to the company baseline
+    totals = frames['baseline'][list(TARGETS.values())].to_numpy().T
+    segments = run_segments(df, horizon, jobs=jobs, totals=totals)
+    segments.to_csv(out_dir / SEGMENTS_FILE, index=False)
+    log(f"Segment forecasts: {segments['segment'].nunique()} segments -> {SEGMENTS_FILE}")
+
+    source = Path(data_path).resolve()
+    manifest.update({'input': input_hash, 'config': cfg_hash, 'models': model_hashes,
+                     'source': str(source.relative_to(BASE)) if source.is_relative_to(BASE) else str(source)})
+    save_manifest(manifest, manifest_path)
+    return manifest
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regenerate Veekstar forecast artifacts (outputs/*.csv, models/*.pkl)")
+    parser.add_argument("--force", action="store_true", help="rebuild even if inputs are unchanged")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes for model fitting")
+    parser.add_argument("--horizon", type=int, default=DEFAULT_HORIZON, help="forecast months")
+    parser.add_argument("--data", type=Path, default=None, help="master dataset CSV (default: data/)")
+    args = parser.parse_args()
+    run(force=args.force, jobs=args.jobs, horizon=args.horizon, data_path=args.data)
@@ -0,0 +1,273 @@
+# ingest.py - Veekstar Retail Intelligence (incremental inbox ingest)
+# Daily transaction files dropped into data/inbox/ (CSV or Parquet) are
+# validated with the same normalization rules as the master dataset and
+# appended to the year/month partitioned store (partition_store.py). Only the
+# months a file touches are written; the persisted page aggregates (rollup
+# cube, inventory state, store-ranking cells), the RFM state, the customer
+# sketches and the product / brand leaderboards are folded forward with the new
+# rows, the forecast pipeline is marked stale, and the dashboard's indexes
+# rebuild just those partitions.
+# Ingest cost scales with the new file, not with the history.
+#
+# Run: python ingest.py init            # split the current master CSV/snapshot into partitions (streamed)
+#      python ingest.py run             # ingest everything waiting in the inbox
+#      python ingest.py watch [--interval 60]
+import copy
+import time
+import hashlib
+import argparse
+import warnings
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+from data_store import (DATA_DIR, MASTER_CANDIDATES, SNAPSHOT_PATH, find_file, load_csv_any,
+                        normalize_df_columns, coerce_master_types, dataset_version, snapshot_is_fresh)
+from partition_store import (PARTITIONS_DIR, MANIFEST_PATH, store_exists, read_manifest, write_manifest,
+                             new_manifest, conform, append_rows, read_partition, compact)
+from chunked import (CHUNK_ROWS, iter_chunks, iter_parquet_chunks, aggregate_chunks, save_aggregates,
+                     save_aggregate, load_aggregate, merge_cubes)
+from rollups import build_cube
+import rfm
+import inventory
+import sketches
+import leaderboards
+import rankings
+
+INBOX_DIR = DATA_DIR / "inbox"
+PROCESSED_DIR = INBOX_DIR / "processed"
+REJECTED_DIR = INBOX_DIR / "rejected"
+INBOX_PATTERNS = ("*.csv", "*.CSV", "*.parquet")
+REQUIRED_COLUMNS = ['date', 'revenue']
+
+# -------------------------
+# Validation
+# -------------------------
+def read_inbox_file(path: Path):
+    if path.suffix.lower() == ".parquet":
+        return pd.read_parquet(path)
+    df = load_csv_any(path)
+    if df is None:
+        raise ValueError(f"could not parse {path.name}")
+    return df
+
+def validate(df: pd.DataFrame, manifest):
+    """Normalize a new batch into the store schema. Raises ValueError for files
+    that can't be used at all; rows without a valid date/revenue are dropped.
+    Returns (rows, report)."""
+    df = coerce_master_types(normalize_df_columns(df))
+    columns = manifest["columns"]
+    missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"missing required columns: {missing}")
+    unknown = [c for c in df.columns if c not in columns]
+    ok = df['date'].notna() & df['revenue'].notna()
+    report = {"rows_in": len(df), "dropped_invalid": int((~ok).sum()), "unknown_columns": unknown,
+              "missing_columns": [c for c in columns if c not in df.columns]}
+    return conform(df[ok], manifest), report
+
+def drop_known_transactions(rows: pd.DataFrame, manifest):
+    """Drop transaction_ids already stored in the months this batch touches (and
+    duplicates inside the batch) - re-delivered files don't double count."""
+    if 'transaction_id' not in rows.columns:
+        return rows
+    rows = rows.drop_duplicates('transaction_id')
+    keys = {f"{p.year:04d}-{p.month:02d}" for p in rows['date'].dt.to_period('M').unique()}
+    known = [read_partition(k, manifest, ['transaction_id'])['transaction_id']
+             for k in keys if k in manifest["partitions"]]
+    if not known:
+        return rows
+    return rows[~rows['transaction_id'].isin(pd.concat(known, ignore_index=True))]
+
+# -------------------------
+# Store bootstrap
+# -------------------------
+def store_rows(chunks, manifest_box, root: Path = PARTITIONS_DIR):
+    """Append each normalized chunk to the store (rows with a valid date) and yield
+    the rows as stored. The manifest is created from the first chunk's schema."""
+    dropped = 0
+    for chunk in chunks:
+        if manifest_box.get("manifest") is None:
+            manifest_box["manifest"] = new_manifest(chunk)
+        rows = conform(chunk[chunk['date'].notna()], manifest_box["manifest"])
+        dropped += len(chunk) - len(rows)
+        if len(rows):
+            append_rows(rows, manifest_box["manifest"], root)
+            yield rows
+    if dropped:
+        warnings.warn(f"{dropped} rows without a valid date were not partitioned")
+
+def bootstrap(chunk_rows=CHUNK_ROWS):
+    """Create the partitioned store from the current master dataset (snapshot or CSV).
+    The source is streamed in chunks - memory stays bounded by the chunk size - and
+    the page aggregates are folded in the same pass and persisted for the new version."""
+    if store_exists():
+        return read_manifest()
+    csv_path = find_file(MASTER_CANDIDATES)
+    if snapshot_is_fresh(csv_path):
+        chunks = iter_parquet_chunks(SNAPSHOT_PATH, chunk_rows)
+    elif csv_path is not None:
+        chunks = iter_chunks(csv_path, chunk_rows)
+    else:
+        raise FileNotFoundError("Master dataset not found in data/ or root")
+    box = {}
+    aggregates = aggregate_chunks(store_rows(chunks, box))
+    if box.get("manifest") is None:
+        raise ValueError("Master dataset has no rows")
+    write_manifest(box["manifest"])
+    # streamed appends leave one part per chunk and month; merge them once
+    compact()
+    try:
+        save_aggregates(aggregates, dataset_version(MANIFEST_PATH))
+    except Exception as e:
+        warnings.warn(f"Aggregates not persisted: {e}")
+    return read_manifest()
+
+# -------------------------
+# Incremental ingest
+# -------------------------
+def update_rfm_state(new_rows: pd.DataFrame, previous_version, version):
+    """Fold the batch into the persisted RFM state. Falls back to a full rebuild
+    when the state is stale or the batch is back-dated for a known customer
+    (update_state is only exact for appended transactions)."""
+    if not set(rfm.RFM_COLUMNS).issubset(new_rows.columns):
+        return
+    state, source = rfm.load_state()
+    backdated = False
+    if state is not None and source == previous_version:
+        last = state.set_index('customer_id')['last_date']
+        seen = new_rows[new_rows['customer_id'].isin(last.index)]
+        backdated = bool((seen['date'].dt.normalize() < last.reindex(seen['customer_id']).to_numpy()).any())
+    if state is None or source != previous_version or backdated:
+        from data_store import load_master_dataset
+        full, _ = load_master_dataset(columns=rfm.RFM_COLUMNS)
+        state = rfm.compute_state(full)
+    else:
+        state = rfm.update_state(state, new_rows)
+    try:
+        rfm.save_state(state, version)
+    except Exception as e:
+        warnings.warn(f"RFM state not persisted: {e}")
+
+def _inventory_state(rows):
+    return inventory.compute_state(rows) if inventory.available(rows) else None
+
+# persisted states (chunked.STATES) that merge with any batch of new rows: name -> (state of rows, merge)
+SUMMARIES = {
+    'cube': (build_cube, merge_cubes),
+    'inventory': (_inventory_state, inventory.merge_states),
+    'sketches': (sketches.sketch_state, sketches.merge_sketches),
+    'leaders': (leaderboards.leader_state, leaderboards.merge_leaders),
+    'branches': (rankings.branch_cells, rankings.merge_cells),
+}
+
+def update_summaries(new_rows: pd.DataFrame, previous_version, version):
+    """Fold the batch into the persisted page aggregates (cube, inventory, branch
+    cells) and summaries (customer sketches, leaderboards). Back-dated rows need
+    no rebuild (unlike RFM); a state without a current version is left to the
+    dashboard, which rebuilds it per partition."""
+    for name, (state_of, merge) in SUMMARIES.items():
+        state = load_aggregate(name, previous_version)
+        if state is None:
+            continue
+        try:
+            save_aggregate(name, merge([state, state_of(new_rows)]), version)
+        except Exception as e:
+            warnings.warn(f"{name} not persisted: {e}")
+
+def mark_forecasts_stale():
+    """New rows change the forecast inputs: the next `python forecast_pipeline.py`
+    rebuilds instead of reporting the artifacts up to date."""
+    try:
+        from forecast_pipeline import mark_stale
+        mark_stale()
+    except Exception as e:
+        warnings.warn(f"Forecast manifest not marked stale: {e}")
+
+def ingest_file(path: Path, manifest=None):
+    """Validate + append one inbox file. Returns a report dict; raises ValueError
+    for files that fail validation."""
+    manifest = manifest or bootstrap()
+    digest = hashlib.sha1(Path(path).read_bytes()).hexdigest()
+    if digest in manifest["ingested"]:
+        return {"file": Path(path).name, "skipped": "already ingested", "rows_added": 0, "partitions": []}
+    rows, report = validate(read_inbox_file(path), manifest)
+    rows = drop_known_transactions(rows, manifest)
+    previous_version = dataset_version(MANIFEST_PATH)
+    # work on a copy: a failed append leaves the live manifest (and readers) untouched
+    work = copy.deepcopy(manifest)
+    touched = append_rows(rows, work) if len(rows) else []
+    work["ingested"][digest] = {"file": Path(path).name, "rows": len(rows),
+                                "at": datetime.now(timezone.utc).isoformat(timespec="seconds")}
+    write_manifest(work)
+    manifest.update(work)
+    if len(rows):
+        version = dataset_version(MANIFEST_PATH)
+        update_rfm_state(rows, previous_version, version)
+        update_summaries(rows, previous_version, version)
+        mark_forecasts_stale()
+    report.update(file=Path(path).name, rows_added=len(rows), partitions=touched)
+    return report
+
+def inbox_files(inbox: Path = INBOX_DIR):
+    files = {p for pattern in INBOX_PATTERNS for p in inbox.glob(pattern) if p.is_file()}
+    return sorted(files, key=lambda p: (p.stat().st_mtime_ns, p.name))
+
+def _move(path: Path, folder: Path):
+    folder.mkdir(parents=True, exist_ok=True)
+    target = folder / path.name
+    if target.exists():
+        target = folder / f"{path.stem}.{int(time.time())}{path.suffix}"
+    return path.replace(target)
+
+def run_once(inbox: Path = INBOX_DIR):
+    """Ingest every file waiting in the inbox (oldest first). Processed files move
+    to inbox/processed/, invalid ones to inbox/rejected/ with a .error.txt note."""
+    reports = []
+    files = inbox_files(inbox)
+    if not files:
+        return reports
+    manifest = bootstrap()
+    for path in files:
+        try:
+            reports.append(ingest_file(path, manifest))
+            _move(path, PROCESSED_DIR)
+        except Exception as e:
+            moved = _move(path, REJECTED_DIR)
+            moved.with_name(moved.name + ".error.txt").write_text(str(e), encoding="utf-8")
+            reports.append({"file": path.name, "error": str(e)})
+    return reports
+
+def watch(interval=60, inbox: Path = INBOX_DIR):
+    inbox.mkdir(parents=True, exist_ok=True)
+    print(f"Watching {inbox} every {interval}s (Ctrl+C to stop)")
+    while True:
+        for r in run_once(inbox):
+            print(r)
+        time.sleep(interval)
+
+# -------------------------
+# CLI
+# -------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Veekstar incremental ingest")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    init = sub.add_parser("init", help="split the master dataset into year/month partitions")
+    init.add_argument("--force", action="store_true", help="rebuild the store from the master CSV")
+    init.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows read per chunk (bounds memory)")
+    sub.add_parser("run", help="ingest the files waiting in data/inbox/")
+    w = sub.add_parser("watch", help="poll data/inbox/ and ingest new files")
+    w.add_argument("--interval", type=int, default=60)
+    args = parser.parse_args()
+    if args.cmd == "init":
+        if args.force and store_exists():
+            import shutil
+            shutil.rmtree(PARTITIONS_DIR)
+        m = bootstrap(args.chunk_rows)
+        print(f"Store: {len(m['partitions'])} partitions, {sum(p['rows'] for p in m['partitions'].values()):,} rows")
+    elif args.cmd == "run":
+        for r in run_once():
+            print(r)
+    else:
+        watch(args.interval)
@@ -0,0 +1,188 @@
+# instrumentation.py - Veekstar Retail Intelligence (in-process timings + counters)
+# Lightweight spans, counters and value histograms aggregated in this process:
+#   with span("load_master_dataset"): ...    -> latency histogram (ms)
+#   count("cache.cube.hit")                  -> counter
+#   observe("page.Customers.chart_bytes", n) -> size histogram (bytes)
+# Off by default: span() then hands back one shared no-op context manager and
+# count()/observe() return immediately, so instrumented code pays a function
+# call and a dict lookup. Switch on with VEEKSTAR_METRICS=1 or from the Admin
+# page. With VEEKSTAR_METRICS_FILE set (or via export()) a JSON snapshot is
+# written to disk for scraping / comparison.
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from pathlib import Path
+
+# bucket upper bounds; the last bucket is open-ended
+MS_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1_000, 2_000, 5_000, 10_000)
+BYTE_BUCKETS = tuple(2**k for k in range(10, 25))  # 1 KB .. 16 MB
+EXPORT_INTERVAL = 30  # seconds between automatic exports
+DEFAULT_EXPORT_PATH = Path(__file__).resolve().parent / "outputs" / "metrics.json"
+
+_LOCK = threading.Lock()
+_STATE = {
+    "enabled": os.environ.get("VEEKSTAR_METRICS", "").lower() in ("1", "true", "yes", "on"),
+    "since": time.time(),
+    "exported": 0.0,
+}
+_HISTOGRAMS = {}  # name -> Histogram
+_COUNTERS = {}    # name -> int
+_NOOP = nullcontext()
+_local = threading.local()
+
+class Histogram:
+    """Fixed-bucket histogram with exact count / sum / min / max."""
+    def __init__(self, bounds, unit):
+        self.bounds = bounds
+        self.unit = unit
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (capped at the observed max)."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self):
+        return {"unit": self.unit, "count": self.count, "mean": self.total / self.count if self.count else None,
+                "p50": self.quantile(0.5), "p95": self.quantile(0.95), "max": self.max if self.count else None,
+                "min": self.min if self.count else None, "total": self.total,
+                "buckets": dict(zip([str(b) for b in self.bounds] + ["inf"], self.buckets))}
+
+# -------------------------
+# Toggle
+# -------------------------
+def enabled():
+    return _STATE["enabled"]
+
+def set_enabled(on):
+    _STATE["enabled"] = bool(on)
+
+def reset():
+    with _LOCK:
+        _HISTOGRAMS.clear()
+        _COUNTERS.clear()
+        _STATE["since"] = time.time()
+
+# -------------------------
+# Recording
+# -------------------------
+def _record(name, value, bounds, unit):
+    with _LOCK:
+        h = _HISTOGRAMS.get(name)
+        if h is None:
+            h = _HISTOGRAMS[name] = Histogram(bounds, unit)
+        h.add(value)
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, (time.perf_counter() - self.start) * 1000, MS_BUCKETS, "ms")
+        _local.stack.pop()
+        return False
+
+def span(name):
+    """Context manager timing its block into the `name` latency histogram."""
+    if not _STATE["enabled"]:
+        return _NOOP
+    return _Span(name)
+
+def current():
+    """Name of the innermost open span on this thread (None outside any span)."""
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+def count(name, n=1):
+    if not _STATE["enabled"]:
+        return
+    with _LOCK:
+        _COUNTERS[name] = _COUNTERS.get(name, 0) + n
+
+def cache_result(cache, hit):
+    """hit/miss counter pair for a named cache."""
+    count(f"cache.{cache}.{'hit' if hit else 'miss'}")
+
+def observe(name, value, bounds=BYTE_BUCKETS, unit="bytes"):
+    """Add a (non-timing) value such as a payload size to the `name` histogram."""
+    if not _STATE["enabled"]:
+        return
+    _record(name, value, bounds, unit)
+
+# -------------------------
+# Reading + export
+# -------------------------
+def snapshot():
+    """All histograms / counters as plain dicts (JSON-serializable)."""
+    with _LOCK:
+        return {
+            "enabled": _STATE["enabled"],
+            "since": datetime.fromtimestamp(_STATE["since"], timezone.utc).isoformat(timespec="seconds"),
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "pid": os.getpid(),
+            "histograms": {name: h.summary() for name, h in sorted(_HISTOGRAMS.items())},
+            "counters": dict(sorted(_COUNTERS.items())),
+        }
+
+def cache_stats():
+    """{cache: (hits, misses)} from the cache.<name>.hit/miss counters."""
+    out = {}
+    with _LOCK:
+        for name, n in _COUNTERS.items():
+            parts = name.split(".")
+            if len(parts) == 3 and parts[0] == "cache" and parts[2] in ("hit", "miss"):
+                hits, misses = out.get(parts[1], (0, 0))
+                out[parts[1]] = (hits + n, misses) if parts[2] == "hit" else (hits, misses + n)
+    return out
+
+def export(path=None):
+    """Write the current snapshot as JSON (atomic); returns the path."""
+    path = Path(path or os.environ.get("VEEKSTAR_METRICS_FILE") or DEFAULT_EXPORT_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(snapshot(), indent=1), encoding="utf-8")
+    tmp.replace(path)
+    _STATE["exported"] = time.time()
+    return path
+
+def maybe_export():
+    """Periodic export when VEEKSTAR_METRICS_FILE is set (called once per rerun)."""
+    if not _STATE["enabled"] or not os.environ.get("VEEKSTAR_METRICS_FILE"):
+        return None
+    if time.time() - _STATE["exported"] < EXPORT_INTERVAL:
+        return None
+    try:
+        return export()
+    except OSError:
+        return None
@@ -0,0 +1,253 @@
+# inventory.py - Veekstar Retail Intelligence (SKU / branch stock health engine)
+# Per (product_id, branch_id) state - first/last sighting, units sold and the
+# stock, reorder level and restock cycle at the latest sighting - is built with
+# vectorized group reductions. States of disjoint row sets merge, so on the
+# partitioned store each month is reduced once and only touched months are
+# recomputed after an ingest. From the state:
+#   velocity      units sold per day over the observed span (at least one restock cycle)
+#   days_of_cover stock / velocity
+#   urgency       max(restock cycle / days of cover, reorder level / stock); >= 1 means reorder
+#   next_restock  last sighting + restock_frequency, with the order quantity that
+#                 covers one more cycle above the reorder level
+# A max-heap on urgency is kept up to date incrementally (only changed keys are
+# re-scored and pushed), so the low-stock view reads its pages off the heap
+# instead of filtering and sorting every SKU on each rerun.
+import heapq
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_store import load_master_dataset, dataset_version
+from partition_store import MANIFEST_PATH as STORE_MANIFEST, per_partition
+from instrumentation import cache_result
+
+KEY_COLUMNS = ['product_id', 'branch_id']
+INVENTORY_COLUMNS = KEY_COLUMNS + ['date', 'store', 'product_name', 'product_category', 'units_sold',
+                                   'stock_available', 'reorder_level', 'restock_frequency']
+LATEST_COLUMNS = ['store', 'product_name', 'product_category', 'stock_available', 'reorder_level',
+                  'restock_frequency']
+DEFAULT_RESTOCK_DAYS = 14
+REORDER_SHARE = 0.2   # reorder level when the column is missing: share of the largest stock
+URGENCY_CAP = 100.0   # urgency of an empty shelf
+WATCH_URGENCY = 0.75
+MAX_COVER_DAYS = 3650  # no stock-out date beyond this horizon
+
+def available(df):
+    return df is not None and {'product_id', 'branch_id', 'stock_available'}.issubset(df.columns)
+
+# -------------------------
+# State (mergeable)
+# -------------------------
+def compute_state(df: pd.DataFrame):
+    """One row per (product_id, branch_id): first_date, last_date, units_sold, rows
+    and the latest sighting's stock / reorder level / restock cycle / labels."""
+    cols = [c for c in INVENTORY_COLUMNS if c in df.columns]
+    work = df[cols].dropna(subset=KEY_COLUMNS)
+    work = work.assign(**{k: work[k].astype(str) for k in KEY_COLUMNS})
+    if 'date' in work.columns:
+        work = work.assign(date=pd.to_datetime(work['date'], errors='coerce'))
+    else:
+        work = work.assign(date=pd.NaT)
+    work = work.assign(units_sold=pd.to_numeric(work['units_sold'], errors='coerce').fillna(0)
+                       if 'units_sold' in work.columns else 0.0, rows=1)
+    g = work.groupby(KEY_COLUMNS, sort=False, observed=True)
+    state = g.agg(first_date=('date', 'min'), last_date=('date', 'max'),
+                  units_sold=('units_sold', 'sum'), rows=('rows', 'sum'))
+    return pd.concat([state, _latest(work, g.ngroup().to_numpy(), state.index)], axis=1).reset_index()
+
+def _latest(df, codes, index, date='date'):
+    """LATEST_COLUMNS of each group's most recent row (file order breaks ties).
+    `codes` number the groups in the order of `index`."""
+    stamps = df[date].to_numpy(dtype='datetime64[ns]').view('i8')  # NaT sorts first
+    order = np.argsort(stamps, kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    last = order[pd.Series(rank).groupby(codes).max().to_numpy()]
+    latest = [c for c in LATEST_COLUMNS if c in df.columns]
+    return df[latest].iloc[last].set_axis(index)
+
+def merge_states(states):
+    """Combine states of disjoint row sets (e.g. one per partition)."""
+    states = [s for s in states if s is not None and len(s)]
+    if not states:
+        return compute_state(pd.DataFrame(columns=INVENTORY_COLUMNS))
+    if len(states) == 1:
+        return states[0]
+    allst = pd.concat(states, ignore_index=True)
+    g = allst.groupby(KEY_COLUMNS, sort=False)
+    merged = g.agg(first_date=('first_date', 'min'), last_date=('last_date', 'max'),
+                   units_sold=('units_sold', 'sum'), rows=('rows', 'sum'))
+    return pd.concat([merged, _latest(allst, g.ngroup().to_numpy(), merged.index, 'last_date')], axis=1).reset_index()
+
+# -------------------------
+# Metrics (vectorized)
+# -------------------------
+def _days(x):
+    # whole days, NaN -> NaT
+    return np.floor(np.asarray(x, dtype=float)).astype('timedelta64[D]')
+
+def compute_metrics(state: pd.DataFrame):
+    """Velocity, cover, urgency and restock schedule for every row of `state`."""
+    out = state.copy()
+    stock = pd.to_numeric(out['stock_available'], errors='coerce').fillna(0).to_numpy(dtype=float)
+    if 'reorder_level' in out.columns:
+        reorder = pd.to_numeric(out['reorder_level'], errors='coerce').fillna(0).to_numpy(dtype=float)
+    else:
+        reorder = np.full(len(out), stock.max() * REORDER_SHARE if len(out) else 0.0)
+    if 'restock_frequency' in out.columns:
+        cycle = pd.to_numeric(out['restock_frequency'], errors='coerce').fillna(DEFAULT_RESTOCK_DAYS)
+        cycle = cycle.clip(lower=1).to_numpy(dtype=float)
+    else:
+        cycle = np.full(len(out), float(DEFAULT_RESTOCK_DAYS))
+    span = ((out['last_date'] - out['first_date']).dt.days + 1).fillna(1).to_numpy(dtype=float)
+    velocity = out['units_sold'].to_numpy(dtype=float) / np.maximum(span, cycle)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cover = np.where(velocity > 0, stock / velocity, np.inf)
+        cover_ratio = np.where(cover > 0, cycle / cover, URGENCY_CAP)
+        level_ratio = np.where(stock > 0, reorder / stock, np.where(reorder > 0, URGENCY_CAP, 0.0))
+    urgency = np.minimum(np.maximum(cover_ratio, level_ratio), URGENCY_CAP)
+    out['reorder_level'] = reorder
+    out['restock_frequency'] = cycle
+    out['velocity'] = velocity
+    out['days_of_cover'] = cover
+    out['urgency'] = urgency
+    out['stockout_date'] = out['last_date'] + _days(np.where(cover <= MAX_COVER_DAYS, cover, np.nan))
+    out['next_restock'] = out['last_date'] + _days(cycle)
+    out['order_qty'] = np.ceil(np.maximum(velocity * cycle + reorder - stock, 0)).astype(np.int64)
+    out['status'] = np.select([stock <= 0, urgency >= 1, urgency >= WATCH_URGENCY],
+                              ['out of stock', 'reorder now', 'watch'], default='ok')
+    return out
+
+# -------------------------
+# Urgency heap
+# -------------------------
+class UrgencyHeap:
+    """Max-heap of key -> urgency with lazy deletion: updates push a fresh entry
+    and stale ones are dropped when they surface. top(k) costs O(k log n)."""
+    def __init__(self, keys=(), scores=()):
+        self._score = dict(zip(keys, scores))
+        self._heap = [(-s, k) for k, s in self._score.items()]
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self._score)
+
+    def update(self, keys, scores):
+        for k, s in zip(keys, scores):
+            if self._score.get(k) != s:
+                self._score[k] = s
+                heapq.heappush(self._heap, (-s, k))
+        # rebuild once stale entries outnumber live ones
+        if len(self._heap) > 2 * len(self._score) + 1024:
+            self._heap = [(-s, k) for k, s in self._score.items()]
+            heapq.heapify(self._heap)
+
+    def discard(self, keys):
+        for k in keys:
+            self._score.pop(k, None)
+
+    def top(self, k):
+        """The k most urgent (key, urgency) pairs, highest first."""
+        out, popped = [], []
+        while self._heap and len(out) < k:
+            item = heapq.heappop(self._heap)
+            s, key = -item[0], item[1]
+            if self._score.get(key) != s or any(key == o[0] for o in out[-1:]):
+                continue  # stale or duplicate entry
+            popped.append(item)
+            out.append((key, s))
+        for item in popped:
+            heapq.heappush(self._heap, item)
+        return out
+
+# -------------------------
+# Engine
+# -------------------------
+class InventoryEngine:
+    """SKU/branch metrics plus the urgency heap; update() re-scores only changed keys.
+    Engines are shared between sessions, so reads and updates take the engine lock."""
+    def __init__(self, state: pd.DataFrame):
+        self._lock = threading.Lock()
+        self.state = state.set_index(KEY_COLUMNS)
+        self.metrics = compute_metrics(state).set_index(KEY_COLUMNS)
+        self.heap = UrgencyHeap(self.metrics.index, self.metrics['urgency'].to_numpy())
+        self._count()
+
+    def _count(self):
+        u = self.metrics['urgency']
+        self.flagged = int((u >= 1).sum())
+        self.watch = int(((u >= WATCH_URGENCY) & (u < 1)).sum())
+
+    def update(self, state: pd.DataFrame):
+        """Swap in a newer state, re-scoring only the keys whose state changed."""
+        with self._lock:
+            return self._update(state)
+
+    def _update(self, state):
+        new = state.set_index(KEY_COLUMNS)
+        common = new.index.intersection(self.state.index)
+        old, cur = self.state.loc[common], new.loc[common]
+        cols = [c for c in new.columns if c in old.columns]
+        # object compare: per-partition states carry different category sets
+        old, cur = old[cols].astype(object), cur[cols].astype(object)
+        same = (old.eq(cur) | (old.isna() & cur.isna())).all(axis=1)
+        changed = common[~same.to_numpy()].append(new.index.difference(self.state.index))
+        removed = self.state.index.difference(new.index)
+        if len(changed):
+            fresh = compute_metrics(new.loc[changed].reset_index()).set_index(KEY_COLUMNS)
+            keep = self.metrics.drop(index=changed.union(removed), errors='ignore')
+            self.metrics = pd.concat([keep, fresh])
+            self.heap.update(fresh.index, fresh['urgency'].to_numpy())
+        elif len(removed):
+            self.metrics = self.metrics.drop(index=removed)
+        self.heap.discard(removed)
+        self.state = new
+        self._count()
+        return len(changed) + len(removed)
+
+    def page(self, page=0, size=25, min_urgency=1.0):
+        """Rows of page `page` (0-based) of the keys with urgency >= min_urgency,
+        most urgent first. Returns (frame, total matching keys)."""
+        with self._lock:
+            total = self.flagged if min_urgency == 1.0 else int((self.metrics['urgency'] >= min_urgency).sum())
+            top = self.heap.top(min((page + 1) * size, total))[page * size:]
+            if not top:
+                return self.metrics.iloc[0:0].reset_index(), total
+            return self.metrics.loc[[k for k, _ in top]].reset_index(), total
+
+def engine_for(df: pd.DataFrame):
+    return InventoryEngine(compute_state(df))
+
+# -------------------------
+# Master engine (one per dataset version)
+# -------------------------
+_INV_LOCK = threading.Lock()
+_ENGINE = {}  # 'version' / 'engine' of the latest build
+
+def master_inventory():
+    """Engine for the full master dataset. A new dataset version updates the
+    previous engine in place of a rebuild; on the partitioned store only the
+    touched months are re-reduced."""
+    df, p = load_master_dataset(columns=INVENTORY_COLUMNS)
+    if not available(df):
+        return None
+    version = dataset_version(p)
+    with _INV_LOCK:
+        cache_result("inventory", _ENGINE.get('version') == version)
+        if _ENGINE.get('version') == version:
+            return _ENGINE['engine']
+        if p == STORE_MANIFEST:
+            from chunked import load_aggregate
+            state = load_aggregate('inventory', version)
+            if state is None:
+                state = merge_states(per_partition('inventory', INVENTORY_COLUMNS, compute_state))
+        else:
+            state = compute_state(df)
+        engine = _ENGINE.get('engine')
+        if engine is None:
+            engine = InventoryEngine(state)
+        else:
+            engine.update(state)
+        _ENGINE.update(version=version, engine=engine)
+        return engine
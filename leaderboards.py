@@ -0,0 +1,213 @@
+# leaderboards.py - Veekstar Retail Intelligence (top-K product / brand leaderboards)
+# Per-SKU groupbys over every store and month are the costliest query the
+# dashboard would run, so top-K products (product_id) and brands by revenue,
+# units and profit come from heavy-hitter summaries kept per
+# (month, region, product_category) cell instead. A summary is not a streaming
+# counter: a batch of rows (chunk, partition or inbox file) is grouped exactly
+# per cell and key, then truncated to the CAPACITY largest keys with bounds:
+#   lo / hi   the key's total in the cell lies in [lo, hi]
+#   floor     no key missing from the list has a total above floor
+# Building costs one groupby of the batch; what is bounded is the state kept
+# afterwards. Summaries of disjoint row sets merge by adding bounds (a missing
+# key counts as [0, floor]) and truncating back to CAPACITY, so they are folded
+# while the store is built (chunked.py), rebuilt per touched partition and
+# carried forward by `ingest.py` with just the new rows. A query merges the
+# selected cells, takes every key whose upper bound reaches the K-th lower bound
+# as a candidate and computes exact totals for the candidates only. When the merged
+# floor can't rule out an unlisted key (flat distributions), a filter isn't a
+# cell dimension (store, channel) or the selected summaries hold no fewer
+# entries than the slice has rows, the slice is aggregated exactly instead -
+# always the case for products on the demo data, where nearly every product_id
+# is sold once, so only catalogues with repeat sellers use the summaries.
+# Bounds assume non-negative cell totals; profit can be negative, so its
+# leaderboard is exact on the refined keys but the candidate cut is a heuristic.
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_store import load_master_dataset, dataset_version
+from partition_store import MANIFEST_PATH as STORE_MANIFEST, per_partition
+from query_engine import filter_cube, filter_key
+from instrumentation import cache_result
+
+CELL_DIMS = ['month', 'region', 'product_category']
+BOARDS = {'product': 'product_id', 'brand': 'brand'}
+METRICS = ['revenue', 'units_sold', 'profit']
+LABELS = {'product': ['product_name', 'brand', 'product_category']}
+SUMMARY_COLUMNS = ['date', 'region', 'product_category', 'product_id', 'brand'] + METRICS
+LEADER_COLUMNS = SUMMARY_COLUMNS + ['product_name']
+CAPACITY = 100  # keys kept per (cell, board, metric)
+TOP_K = 20
+
+_SUMMARY = ['board', 'metric']
+
+def available(df):
+    return df is not None and any(k in df.columns for k in BOARDS.values()) and any(m in df.columns for m in METRICS)
+
+# -------------------------
+# Summaries (mergeable)
+# -------------------------
+def leader_state(df: pd.DataFrame):
+    """Heavy-hitter summaries of `df`: exact per-cell totals truncated to CAPACITY keys
+    (one groupby of `df`; the summaries it returns are bounded, not the work)."""
+    if not available(df):
+        return None
+    work = pd.DataFrame(index=df.index)
+    if 'date' in df.columns:
+        work['month'] = pd.to_datetime(df['date'], errors='coerce').dt.to_period('M').dt.to_timestamp()
+    for d in CELL_DIMS[1:]:
+        if d in df.columns:
+            work[d] = df[d]
+    dims = [d for d in CELL_DIMS if d in work.columns]
+    metrics = [m for m in METRICS if m in df.columns]
+    for m in metrics:
+        work[m] = pd.to_numeric(df[m], errors='coerce').astype('float64')
+    parts = []
+    for board, key in BOARDS.items():
+        if key not in df.columns:
+            continue
+        # group on the native column (codes / arrow strings); only the reduced keys become str
+        sums = (work.assign(key=df[key]).groupby(dims + ['key'], observed=True, dropna=False)[metrics]
+                .sum().reset_index())
+        sums = sums[sums['key'].notna()]
+        sums['key'] = sums['key'].astype(str).astype(object)
+        cells = sums.groupby(dims, observed=True, dropna=False, sort=False).ngroup().to_numpy()
+        for m in metrics:
+            keep, floor = _top(cells, sums[m].to_numpy())
+            part = sums[dims + ['key']].iloc[keep]
+            parts.append(part.assign(board=board, metric=m, lo=sums[m].to_numpy()[keep],
+                                     hi=sums[m].to_numpy()[keep], floor=floor))
+    return _categorical(pd.concat(parts, ignore_index=True)) if parts else None
+
+def _top(groups, values, floors=None, capacity=CAPACITY):
+    """Positions of the `capacity` highest values per group id, and each kept
+    row's floor: max(its floor, the highest value dropped from its group)."""
+    n = len(values)
+    floors = np.zeros(n) if floors is None else floors
+    order = np.argsort(-values, kind='stable')
+    order = order[np.argsort(groups[order], kind='stable')]  # by group, then value descending
+    g = groups[order]
+    starts = np.flatnonzero(np.r_[True, g[1:] != g[:-1]])
+    pos = np.arange(n) - np.repeat(starts, np.diff(np.r_[starts, n]))
+    keep = order[pos < capacity]
+    dropped = np.full(groups.max() + 1 if n else 0, -np.inf)
+    first_out = pos == capacity  # sorted descending: the first dropped row is the group max
+    dropped[g[first_out]] = values[order[first_out]]
+    return keep, np.fmax(floors[keep], dropped[groups[keep]])
+
+def _truncate(entries, by, capacity=CAPACITY):
+    """Keep the `capacity` keys with the highest upper bound per summary; dropped
+    keys raise the summary's floor to their upper bound."""
+    groups = entries.groupby(by, observed=True, dropna=False, sort=False).ngroup().to_numpy()
+    keep, floor = _top(groups, entries['hi'].to_numpy(), entries['floor'].to_numpy(), capacity)
+    return entries.iloc[keep].assign(floor=floor).reset_index(drop=True)
+
+def _combine(entries, parts, by):
+    """Merge the summaries identified by `parts` into one summary per `by`."""
+    floors = entries.groupby(parts, observed=True, dropna=False)['floor'].first().reset_index()
+    total = floors.groupby(by, observed=True, dropna=False)['floor'].sum().rename('_total')
+    g = entries.groupby(by + ['key'], observed=True, dropna=False).agg(
+        lo=('lo', 'sum'), hi=('hi', 'sum'), _listed=('floor', 'sum')).reset_index()
+    g = g.join(total, on=by)
+    # a summary that doesn't list the key contributes [0, its floor]
+    g['hi'] = g['hi'] + g['_total'] - g['_listed']
+    g['floor'] = g['_total']
+    return g.drop(columns=['_total', '_listed'])
+
+def merge_leaders(states):
+    """Merge summaries of disjoint row sets (e.g. chunks or inbox batches)."""
+    states = [s for s in states if s is not None and len(s)]
+    if len(states) <= 1:
+        return states[0] if states else None
+    allst = pd.concat([s.assign(_part=i) for i, s in enumerate(states)], ignore_index=True)
+    by = [d for d in CELL_DIMS if d in allst.columns] + _SUMMARY
+    return _categorical(_truncate(_combine(allst, ['_part'] + by, by), by))
+
+def _categorical(leaders):
+    # persisted / concatenated summaries come back with object columns
+    cols = [c for c in CELL_DIMS[1:] + _SUMMARY if c in leaders.columns and leaders[c].dtype == object]
+    return leaders.assign(**{c: leaders[c].astype('category') for c in cols}) if cols else leaders
+
+# -------------------------
+# Queries
+# -------------------------
+def exact_top(df: pd.DataFrame, rows=None, board='product', metric='revenue', k=TOP_K, candidates=None):
+    """Exact top-k of `board` by `metric` over `rows` of df (all rows if None),
+    optionally restricted to `candidates` keys."""
+    key = BOARDS[board]
+    labels = [c for c in LABELS.get(board, []) if c in df.columns]
+    metrics = [m for m in METRICS if m in df.columns]
+    sub = df[[key] + labels + metrics]
+    if rows is not None:
+        sub = sub.take(rows)
+    if candidates is not None:
+        ids = sub[key].astype(str) if pd.api.types.is_numeric_dtype(sub[key]) else sub[key]
+        sub = sub[pd.Index(candidates).get_indexer(ids) >= 0]
+    agg = {c: (c, 'first') for c in labels}
+    agg.update({m: (m, 'sum') for m in metrics})
+    agg['transactions'] = (key, 'size')
+    out = sub.groupby(key, observed=True).agg(**agg)
+    # stable: ties keep key order whichever rows were aggregated
+    return out.sort_values(metric, ascending=False, kind='stable').head(k).reset_index()
+
+def top_k(leaders, df, index=None, filters=None, board='product', metric='revenue', k=TOP_K):
+    """Top-k `board` keys by `metric` for the slice `filters` (sidebar filters,
+    answered for the rows by `index`, built on df's row order). Returns
+    (frame, method) with method 'sketch' when the summaries settled the
+    candidates, 'exact' when the slice was aggregated in full."""
+    rows = index.select(filters) if index is not None else None
+    dims = {dim for dim, _ in filter_key(filters)}
+    cells = leaders is not None and dims <= set(CELL_DIMS[1:]) | {'date'}
+    if cells:
+        sel = filter_cube(leaders, filters)
+        sel = sel[(sel['board'] == board).to_numpy() & (sel['metric'] == metric).to_numpy()]
+        # summaries no smaller than the selected rows can't beat scanning them
+        cells = 0 < len(sel) < (len(df) if rows is None else len(rows))
+    if not cells:
+        return exact_top(df, rows, board, metric, k), 'exact'
+    # merge the selected cells: every cell that doesn't list a key adds [0, its floor]
+    floors = sel.groupby([d for d in CELL_DIMS if d in sel.columns], observed=True, dropna=False)['floor'].first()
+    floor = float(floors.sum())
+    summary = sel.groupby('key', sort=False)[['lo', 'hi', 'floor']].sum()
+    hi = summary['hi'] + floor - summary['floor']
+    if floor > 0 and (len(summary) < k or hi.nlargest(k).min() < floor):
+        return exact_top(df, rows, board, metric, k), 'exact'  # an unlisted key could still place
+    kth = summary['lo'].nlargest(k).min() if len(summary) >= k else -np.inf
+    top = exact_top(df, rows, board, metric, k, summary.index[(hi >= kth).to_numpy()])
+    # unlisted keys total at most `floor`: the list is settled if the K-th exact value beats it
+    if floor > 0 and (len(top) < k or top[metric].iat[-1] < floor):
+        return exact_top(df, rows, board, metric, k), 'exact'
+    return top, 'sketch'
+
+# -------------------------
+# Master summaries (one per dataset version)
+# -------------------------
+_LEADER_LOCK = threading.Lock()
+_LEADERS = {}  # dataset version -> summaries
+_MAX_VERSIONS = 2
+
+def master_leaders():
+    """Summaries of the full master dataset. On the partitioned store the state
+    persisted at init / ingest is used when it matches the version, else each
+    month is summarized once (disjoint cells, so partitions just concatenate)."""
+    df, p = load_master_dataset(columns=SUMMARY_COLUMNS)
+    if not available(df):
+        return None
+    version = dataset_version(p)
+    with _LEADER_LOCK:
+        leaders = _LEADERS.get(version)
+        cache_result("leaders", leaders is not None)
+        if leaders is None:
+            if p == STORE_MANIFEST:
+                from chunked import load_aggregate
+                leaders = load_aggregate('leaders', version)
+                if leaders is None:
+                    leaders = pd.concat(per_partition('leaders', SUMMARY_COLUMNS, leader_state), ignore_index=True)
+            else:
+                leaders = leader_state(df)
+            leaders = _categorical(leaders)
+            _LEADERS[version] = leaders
+            while len(_LEADERS) > _MAX_VERSIONS:
+                _LEADERS.pop(next(iter(_LEADERS)))
+        return leaders
@@ -0,0 +1,131 @@
+# model_registry.py - Veekstar Retail Intelligence (cached model inference)
+# Loads models/model_revenue.pkl and models/model_profit.pkl lazily, once per
+# process, and reloads a model only when its file changes on disk. Scoring is
+# batched (one predict call per model per request) and memoized per scenario.
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import joblib
+except Exception:  # joblib ships with scikit-learn; plain pickle is the fallback
+    joblib = None
+import pickle
+
+BASE = Path(__file__).resolve().parent
+MODELS_DIR = BASE / "models"
+
+MODEL_FILES = {
+    "revenue": "model_revenue.pkl",
+    "profit": "model_profit.pkl",
+}
+
+# feature schema of the monthly forecast tables (outputs/forecast_*.csv)
+FEATURES = [
+    'Units_Sold', 'Campaign_Spend', 'Discount_Applied', 'Loyalty_Score', 'Satisfaction_Score',
+    'Holiday_Period', 'month', 'rev_lag_1', 'rev_lag_3', 'rev_roll_3_mean',
+    'profit_lag_1', 'profit_roll_3_mean', 'is_holiday_month',
+]
+
+def model_feature_names(model):
+    """Feature order the model was trained with (LightGBM Booster / sklearn API)."""
+    if hasattr(model, "feature_name") and callable(model.feature_name):
+        return list(model.feature_name())
+    if hasattr(model, "feature_names_in_"):
+        return list(model.feature_names_in_)
+    if hasattr(model, "feature_name_"):
+        return list(model.feature_name_)
+    return list(FEATURES)
+
+def feature_matrix(features_df: pd.DataFrame, names):
+    """Columns of `features_df` in model order as float64, matched case-insensitively
+    (the dashboard lower-cases CSV headers). Missing features raise KeyError."""
+    lookup = {c.lower(): c for c in features_df.columns}
+    missing = [n for n in names if n.lower() not in lookup]
+    if missing:
+        raise KeyError(f"Missing model features: {missing}")
+    cols = [lookup[n.lower()] for n in names]
+    return features_df[cols].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+
+# -------------------------
+# Registry
+# -------------------------
+class ModelRegistry:
+    def __init__(self, models_dir: Path = MODELS_DIR, files=None, memo_size=128):
+        self.models_dir = Path(models_dir)
+        self.files = dict(files or MODEL_FILES)
+        self._lock = threading.Lock()
+        self._models = {}  # name -> (mtime_ns, model)
+        self._memo = OrderedDict()
+        self._memo_size = memo_size
+
+    def available(self):
+        return [n for n, f in self.files.items() if (self.models_dir / f).exists()]
+
+    def _load(self, path: Path):
+        if joblib is not None:
+            return joblib.load(path)
+        with open(path, "rb") as fh:
+            return pickle.load(fh)
+
+    def get(self, name):
+        """Model `name`, loaded on first use and reloaded when the pickle's mtime changes."""
+        path = self.models_dir / self.files[name]
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            hit = self._models.get(name)
+            if hit is None or hit[0] != mtime:
+                hit = (mtime, self._load(path))
+                self._models[name] = hit
+                # a new model version invalidates every memoized prediction
+                self._memo.clear()
+            return hit[1]
+
+    def version(self):
+        with self._lock:
+            return tuple(sorted((n, m[0]) for n, m in self._models.items()))
+
+    def predict(self, features_df: pd.DataFrame, targets=None):
+        """Batched scoring: one predict call per target over all rows.
+        Returns a DataFrame (same index) with one column per target."""
+        targets = list(targets or self.available())
+        out = pd.DataFrame(index=features_df.index)
+        for t in targets:
+            model = self.get(t)
+            X = feature_matrix(features_df, model_feature_names(model))
+            out[t] = np.asarray(model.predict(X), dtype=np.float64) if len(X) else np.array([], dtype=np.float64)
+        return out
+
+    def predict_scenario(self, scenario, features_df: pd.DataFrame, targets=None):
+        """predict() memoized per (scenario, feature content, model versions)."""
+        targets = tuple(targets or self.available())
+        for t in targets:
+            self.get(t)  # refresh versions before building the key
+        digest = hashlib.sha1(pd.util.hash_pandas_object(features_df, index=True).to_numpy().tobytes()).hexdigest()
+        key = (scenario, digest, targets, self.version())
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+        result = self.predict(features_df, targets)
+        with self._lock:
+            self._memo[key] = result
+            while len(self._memo) > self._memo_size:
+                self._memo.popitem(last=False)
+        return result
+
+_REGISTRY = None
+_REGISTRY_LOCK = threading.Lock()
+
+def get_registry():
+    """Process-wide registry shared by every session."""
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None:
+            _REGISTRY = ModelRegistry()
+        return _REGISTRY
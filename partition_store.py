@@ -0,0 +1,281 @@
+# partition_store.py - Veekstar Retail Intelligence (year/month partitioned dataset)
+# The master dataset as append-only columnar part files:
+#   data/partitions/year=YYYY/month=MM/part-NNNNN.arrow
+# plus a JSON manifest (schema, per-partition file list, row count, version).
+# Appending a batch only writes new part files into the months it touches and
+# bumps those partitions' versions. Readers rebuild only the changed partitions:
+# untouched ones are reused from the previously loaded frame, and derived
+# per-partition results (cube cells, indexes) are cached by partition version.
+#
+# Part files are uncompressed Arrow IPC, memory-mapped on read: only the columns
+# a caller asks for are ever paged in, and string columns stay Arrow-backed
+# (string[pyarrow]) on top of the mapping, so every worker process on the host
+# shares the OS page cache instead of holding a private copy of the text data.
+# Parquet parts from older stores are still read; `compact` rewrites them.
+#
+# Run: python partition_store.py compact   # one Arrow file per partition
+import json
+import hashlib
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from data_store import DATA_DIR, file_fingerprint
+from dataset_schema import optimize_types
+from instrumentation import cache_result
+
+PARTITIONS_DIR = DATA_DIR / "partitions"
+MANIFEST_PATH = PARTITIONS_DIR / "_manifest.json"
+
+# -------------------------
+# Layout + manifest
+# -------------------------
+def partition_key(ts):
+    """'YYYY-MM' partition key of a timestamp."""
+    return f"{ts.year:04d}-{ts.month:02d}"
+
+def partition_dir(key, root: Path = PARTITIONS_DIR):
+    year, month = key.split("-")
+    return root / f"year={year}" / f"month={month}"
+
+def store_exists(root: Path = PARTITIONS_DIR):
+    return (root / MANIFEST_PATH.name).exists()
+
+def read_manifest(root: Path = PARTITIONS_DIR):
+    path = root / MANIFEST_PATH.name
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+def write_manifest(manifest, root: Path = PARTITIONS_DIR):
+    """Atomic manifest replace - the manifest's file fingerprint is the dataset version."""
+    root.mkdir(parents=True, exist_ok=True)
+    path = root / MANIFEST_PATH.name
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True), encoding="utf-8")
+    tmp.replace(path)
+    return path
+
+def new_manifest(df: pd.DataFrame):
+    """Empty manifest with the schema (column order + pandas dtypes) of `df`."""
+    return {"columns": list(df.columns), "dtypes": {c: str(t) for c, t in df.dtypes.items()},
+            "partitions": {}, "ingested": {}}
+
+def _partition_version(files, rows):
+    return hashlib.sha1(json.dumps([files, rows]).encode("utf-8")).hexdigest()[:16]
+
+# -------------------------
+# Part files (Arrow IPC, memory-mapped)
+# -------------------------
+PART_SUFFIX = ".arrow"
+# strings as string[pyarrow]: the column keeps pointing into the mapped file
+_STRING_DTYPE = pd.StringDtype("pyarrow")
+_TYPES = {pa.string(): _STRING_DTYPE, pa.large_string(): _STRING_DTYPE}
+
+def write_part(df: pd.DataFrame, path: Path):
+    """Uncompressed Arrow IPC file, written atomically (tmp + rename). Strings are
+    stored as large_string - the layout string[pyarrow] uses, so reads are zero-copy."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # all-null text columns (a batch without that field) are typed as strings too
+    schema = pa.schema([pa.field(f.name, pa.large_string())
+                        if pa.types.is_string(f.type) or pa.types.is_null(f.type) else f
+                        for f in table.schema])
+    table = table.cast(schema)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with pa.OSFile(str(tmp), "wb") as sink, ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    tmp.replace(path)
+    return path
+
+def read_part(path: Path, columns=None):
+    """Arrow table of one part file. IPC parts are memory-mapped (no read, no copy);
+    selecting columns only touches the pages of those columns."""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        return pq.read_table(path, columns=columns)
+    table = ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+    return table if columns is None else table.select([c for c in columns if c in table.column_names])
+
+def to_frame(table: pa.Table):
+    # split_blocks keeps null-free numeric columns as views of the Arrow buffers
+    return table.to_pandas(types_mapper=_TYPES.get, split_blocks=True)
+
+# -------------------------
+# Write
+# -------------------------
+def conform(df: pd.DataFrame, manifest):
+    """Rows in the store schema: missing columns become NA, unknown ones are dropped,
+    text columns stay text even when a batch has them empty."""
+    out = df.reindex(columns=manifest["columns"])
+    for c, dtype in manifest.get("dtypes", {}).items():
+        if dtype in ("object", "string", "category") and out[c].dtype != object:
+            out[c] = out[c].astype(object)
+    return optimize_types(out)
+
+def append_rows(df: pd.DataFrame, manifest, root: Path = PARTITIONS_DIR):
+    """Write `df` (store schema, valid 'date') as one new part file per touched month.
+    Updates `manifest` in place and returns the touched partition keys; the caller
+    writes the manifest once everything derived from the batch is in place."""
+    months = pd.to_datetime(df['date']).dt.to_period('M')
+    touched = []
+    for period, rows in df.groupby(months, sort=True):
+        key = partition_key(period.to_timestamp())
+        entry = manifest["partitions"].setdefault(key, {"files": [], "rows": 0})
+        rel = partition_dir(key, Path(".")) / f"part-{len(entry['files']):05d}{PART_SUFFIX}"
+        write_part(rows.reset_index(drop=True), root / rel)
+        entry["files"].append(rel.as_posix())
+        entry["rows"] += len(rows)
+        entry["version"] = _partition_version(entry["files"], entry["rows"])
+        entry["updated"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        touched.append(key)
+    return touched
+
+# -------------------------
+# Read
+# -------------------------
+def _concat(frames):
+    """Row-concat partition frames keeping categoricals categorical: every frame
+    gets the union of the category sets first (otherwise pandas decodes to object)."""
+    cats = {}
+    for f in frames:
+        for c in f.columns:
+            if isinstance(f[c].dtype, pd.CategoricalDtype):
+                cats[c] = f[c].cat.categories if c not in cats else cats[c].union(f[c].cat.categories)
+    frames = [f.assign(**{c: f[c].cat.set_categories(cats[c]) for c in cats
+                          if c in f.columns and isinstance(f[c].dtype, pd.CategoricalDtype)})
+              for f in frames]
+    # parts from older stores predate the compact schema
+    return optimize_types(pd.concat(frames, ignore_index=True))
+
+def read_partition(key, manifest, columns=None, root: Path = PARTITIONS_DIR):
+    """All part files of one partition (optionally only `columns`)."""
+    tables = [read_part(root / f, columns) for f in manifest["partitions"][key]["files"]]
+    if not tables:
+        return pd.DataFrame(columns=columns or manifest["columns"])
+    # parts written on different days may disagree on types (e.g. int vs float with NaN)
+    return to_frame(tables[0] if len(tables) == 1 else pa.concat_tables(tables, promote_options="permissive"))
+
+def scan(columns=None, start=None, end=None, root: Path = PARTITIONS_DIR):
+    """Rows with start <= date < end, reading only the partitions that overlap the
+    range (and only `columns`). Not cached - for one-off queries and jobs."""
+    manifest = read_manifest(root)
+    lo = None if start is None else partition_key(pd.Timestamp(start))
+    hi = None if end is None else partition_key(pd.Timestamp(end) - pd.Timedelta(1, 'ns'))
+    keys = [k for k in sorted(manifest["partitions"]) if (lo is None or k >= lo) and (hi is None or k <= hi)]
+    read_cols = None if columns is None else list(dict.fromkeys(list(columns) + ['date']))
+    frames = [read_partition(k, manifest, read_cols, root) for k in keys]
+    if not frames:
+        return pd.DataFrame(columns=columns or manifest["columns"])
+    df = _concat(frames)
+    mask = pd.Series(True, index=df.index)
+    if start is not None:
+        mask &= df['date'] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= df['date'] < pd.Timestamp(end)
+    df = df[mask.to_numpy()].reset_index(drop=True)
+    return df if columns is None else df[list(columns)]
+
+def compact(root: Path = PARTITIONS_DIR):
+    """Rewrite every partition with more than one part (or legacy Parquet parts)
+    as a single Arrow file. Returns the rewritten partition keys."""
+    manifest = read_manifest(root)
+    done, stale = [], []
+    for key, entry in sorted(manifest["partitions"].items()):
+        if len(entry["files"]) == 1 and entry["files"][0].endswith(PART_SUFFIX):
+            continue
+        df = read_partition(key, manifest, None, root)
+        seq = max(int(Path(f).stem.split("-")[1]) for f in entry["files"]) + 1
+        rel = partition_dir(key, Path(".")) / f"part-{seq:05d}{PART_SUFFIX}"
+        write_part(df, root / rel)
+        stale += entry["files"]
+        entry["files"] = [rel.as_posix()]
+        entry["version"] = _partition_version(entry["files"], entry["rows"])
+        entry["updated"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        done.append(key)
+    if done:
+        write_manifest(manifest, root)
+        # readers that already mapped an old part keep it alive until they remap
+        for f in stale:
+            (root / f).unlink(missing_ok=True)
+    return done
+
+_LOCK = threading.RLock()
+_STATE = {"fp": None, "df": None, "spans": {}}  # spans: key -> (version, start, stop)
+_DERIVED = {}  # (name, key) -> (version, result)
+
+def load_store(columns=None, root: Path = PARTITIONS_DIR):
+    """Whole store as one frame (partitions in month order) projected to `columns`.
+    Only partitions whose version changed - and columns not loaded yet - are read."""
+    fp = file_fingerprint(root / MANIFEST_PATH.name)
+    with _LOCK:
+        manifest = read_manifest(root)
+        available = manifest["columns"]
+        wanted = available if columns is None else [c for c in columns if c in available]
+        old_df, old_spans = _STATE["df"], _STATE["spans"]
+        loaded = [] if old_df is None else list(old_df.columns)
+        hit = _STATE["fp"] == fp and all(c in loaded for c in wanted)
+        cache_result("store", hit)
+        if hit:
+            return old_df[wanted]
+        cols = [c for c in available if c in loaded or c in wanted]
+        frames, spans, start = [], {}, 0
+        for key in sorted(manifest["partitions"]):
+            version = manifest["partitions"][key]["version"]
+            prev = old_spans.get(key)
+            if prev is not None and prev[0] == version:
+                frame = old_df.iloc[prev[1]:prev[2]].reset_index(drop=True)
+                missing = [c for c in cols if c not in loaded]
+                if missing:
+                    frame = pd.concat([frame, read_partition(key, manifest, missing, root)], axis=1)
+            else:
+                frame = read_partition(key, manifest, cols, root)
+            frames.append(frame[cols])
+            spans[key] = (version, start, start + len(frame))
+            start += len(frame)
+        df = _concat(frames) if frames else pd.DataFrame(columns=cols)
+        _STATE.update(fp=fp, df=df, spans=spans)
+        return df[wanted]
+
+def per_partition(name, columns, fn):
+    """[fn(partition frame) for each partition] in store row order, cached per
+    partition version - after an append only the touched partitions are recomputed.
+    Rows line up with load_store() as long as the store version is unchanged."""
+    with _LOCK:
+        df = load_store(columns)
+        out = []
+        for key, (version, start, stop) in _STATE["spans"].items():
+            hit = _DERIVED.get((name, key))
+            cache_result(f"partition_{name}", hit is not None and hit[0] == version)
+            if hit is None or hit[0] != version:
+                hit = (version, fn(df.iloc[start:stop]))
+                _DERIVED[(name, key)] = hit
+            out.append(hit[1])
+        live = set(_STATE["spans"])
+        for k in [k for k in _DERIVED if k[0] == name and k[1] not in live]:
+            del _DERIVED[k]
+        return out
+
+def clear_cache():
+    with _LOCK:
+        _STATE.update(fp=None, df=None, spans={})
+        _DERIVED.clear()
+
+# -------------------------
+# CLI
+# -------------------------
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Veekstar partitioned store maintenance")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("compact", help="merge each partition's part files into one Arrow file")
+    args = parser.parse_args()
+    if args.cmd == "compact":
+        keys = compact()
+        print(f"Compacted {len(keys)} partitions" + (f": {', '.join(keys)}" if keys else ""))
@@ -0,0 +1,199 @@
+# query_engine.py - Veekstar Retail Intelligence (indexed global filters)
+# Global sidebar filters (date range, region, store, category, channel) are
+# answered from precomputed indexes instead of boolean scans of df_master:
+#   - date: row order sorted by date + binary search (searchsorted) per range
+#   - dims: integer category codes; a filter is one lookup-table gather
+# Row selections are kept in a bounded LRU per filter combination.
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from data_store import load_master_dataset, dataset_version
+from partition_store import MANIFEST_PATH as STORE_MANIFEST, per_partition
+from instrumentation import cache_result
+
+FILTER_DIMS = ['region', 'store', 'product_category', 'sales_channel']
+INDEX_COLUMNS = ['date'] + FILTER_DIMS
+
+# -------------------------
+# Filter state helpers
+# -------------------------
+def filter_key(filters):
+    """Hashable, order-independent key for a filters dict. Empty selections are
+    dropped, so {} and {'region': ()} hit the same cache entry."""
+    if not filters:
+        return ()
+    items = []
+    for k in sorted(filters):
+        v = filters[k]
+        if v is None or (isinstance(v, (list, tuple, set)) and len(v) == 0):
+            continue
+        if k == 'date':
+            items.append((k, tuple(pd.Timestamp(x) if x is not None else None for x in v)))
+        else:
+            items.append((k, tuple(sorted(map(str, v)))))
+    return tuple(items)
+
+def is_unfiltered(filters):
+    return filter_key(filters) == ()
+
+# -------------------------
+# Index
+# -------------------------
+class DatasetIndex:
+    """Row indexes over one dataset version. select() returns sorted row positions."""
+
+    def __init__(self, df: pd.DataFrame, cache_size=64):
+        self.n = len(df)
+        self.date_order = None
+        if 'date' in df.columns:
+            dates = pd.to_datetime(df['date'], errors='coerce').to_numpy(dtype='datetime64[ns]')
+            # numpy sorts NaT last, so range lookups never include missing dates
+            self.date_order = np.argsort(dates, kind='stable')
+            self.sorted_dates = dates[self.date_order]
+        self.codes = {}
+        for dim in FILTER_DIMS:
+            if dim in df.columns:
+                codes, uniques = pd.factorize(df[dim].astype(str).where(df[dim].notna()), sort=True)
+                self.codes[dim] = (codes.astype(np.int32), pd.Index(uniques))
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+        self._cache_size = cache_size
+        self.hits = self.misses = 0
+
+    @classmethod
+    def combine(cls, parts, cache_size=64):
+        """Index over the row-wise concatenation of `parts` (indexes of consecutive
+        row blocks, e.g. month partitions) without re-sorting or re-factorizing."""
+        idx = cls(pd.DataFrame(), cache_size)
+        offsets = np.cumsum([0] + [p.n for p in parts])
+        idx.n = int(offsets[-1])
+        if parts and all(p.date_order is not None for p in parts):
+            idx.date_order = np.concatenate([p.date_order + off for p, off in zip(parts, offsets)])
+            idx.sorted_dates = np.concatenate([p.sorted_dates for p in parts])
+            # blocks normally cover disjoint, ordered date ranges; re-sort otherwise
+            # (also moves NaT from the block ends to the end)
+            if len(idx.sorted_dates) and not (np.diff(idx.sorted_dates.view('int64')) >= 0).all():
+                order = np.argsort(idx.sorted_dates, kind='stable')
+                idx.date_order, idx.sorted_dates = idx.date_order[order], idx.sorted_dates[order]
+        for dim in FILTER_DIMS:
+            if parts and all(dim in p.codes for p in parts):
+                uniques = pd.Index(sorted(set().union(*(p.codes[dim][1] for p in parts))))
+                remapped = []
+                for p in parts:
+                    codes, part_uniques = p.codes[dim]
+                    lut = np.append(uniques.get_indexer(part_uniques), -1).astype(np.int32)
+                    remapped.append(lut[codes])  # code -1 hits the trailing -1 slot
+                idx.codes[dim] = (np.concatenate(remapped), uniques)
+        return idx
+
+    def values(self, dim):
+        return list(self.codes[dim][1]) if dim in self.codes else []
+
+    def _date_rows(self, start, end):
+        # [start, end) on the sorted date array
+        lo = 0 if start is None else np.searchsorted(self.sorted_dates, np.datetime64(pd.Timestamp(start)), 'left')
+        hi = (np.searchsorted(self.sorted_dates, np.datetime64('NaT'), 'left') if end is None
+              else np.searchsorted(self.sorted_dates, np.datetime64(pd.Timestamp(end)), 'left'))
+        return self.date_order[lo:hi]
+
+    def _compute(self, key):
+        mask = None
+        for k, v in key:
+            if k == 'date':
+                if self.date_order is None:
+                    continue
+                m = np.zeros(self.n, dtype=bool)
+                m[self._date_rows(*v)] = True
+            elif k in self.codes:
+                codes, uniques = self.codes[k]
+                # lookup table with a trailing False slot for code -1 (missing values)
+                table = np.zeros(len(uniques) + 1, dtype=bool)
+                table[uniques.get_indexer([x for x in v if x in uniques])] = True
+                m = table[codes]
+            else:
+                continue
+            mask = m if mask is None else (mask & m)
+        return None if mask is None else np.flatnonzero(mask)
+
+    def select(self, filters):
+        """Sorted row positions matching `filters`, or None when nothing is filtered."""
+        key = filters if isinstance(filters, tuple) else filter_key(filters)
+        if key == ():
+            return None
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.hits += 1
+                cache_result("selection", True)
+                return self._results[key]
+        rows = self._compute(key)
+        cache_result("selection", False)
+        with self._lock:
+            self.misses += 1
+            self._results[key] = rows
+            while len(self._results) > self._cache_size:
+                self._results.popitem(last=False)
+        return rows
+
+# -------------------------
+# Per-version cache
+# -------------------------
+_INDEX_LOCK = threading.Lock()
+_INDEXES = {}  # dataset version -> DatasetIndex
+_MAX_VERSIONS = 2
+
+def master_index():
+    df, p = load_master_dataset(columns=INDEX_COLUMNS)
+    if df is None:
+        return None
+    version = dataset_version(p)
+    with _INDEX_LOCK:
+        idx = _INDEXES.get(version)
+        cache_result("index", idx is not None)
+        if idx is None:
+            if p == STORE_MANIFEST:
+                # only partitions touched since the last build are re-indexed
+                idx = DatasetIndex.combine(per_partition('index', INDEX_COLUMNS, DatasetIndex))
+            else:
+                idx = DatasetIndex(df)
+            _INDEXES[version] = idx
+            while len(_INDEXES) > _MAX_VERSIONS:
+                _INDEXES.pop(next(iter(_INDEXES)))
+        return idx
+
+# -------------------------
+# Applying filters
+# -------------------------
+def apply_filters(df: pd.DataFrame, index: DatasetIndex, filters):
+    """Rows of `df` (same row order the index was built on) matching `filters`.
+    Unfiltered requests return `df` itself - no copy."""
+    rows = index.select(filters) if index is not None else None
+    if rows is None:
+        return df
+    return df.take(rows)
+
+def filter_cube(cube: pd.DataFrame, filters):
+    """Same filters applied to rollup cube cells (month-aligned date ranges)."""
+    key = filter_key(filters)
+    if key == () or cube is None:
+        return cube
+    mask = np.ones(len(cube), dtype=bool)
+    for k, v in key:
+        if k == 'date' and 'month' in cube.columns:
+            start, end = v
+            if start is not None:
+                mask &= (cube['month'] >= start).to_numpy()
+            if end is not None:
+                mask &= (cube['month'] < end).to_numpy()
+        elif k in cube.columns:
+            col = cube[k]
+            if isinstance(col.dtype, pd.CategoricalDtype):
+                # match the categories once, then look the codes up
+                hit = np.append(col.cat.categories.astype(str).isin(v), False)
+                mask &= hit[col.cat.codes.to_numpy()]  # code -1 (missing) -> the trailing False
+            else:
+                mask &= col.astype(str).isin(v).to_numpy()
+    return cube[mask]
@@ -0,0 +1,214 @@
+# rankings.py - Veekstar Retail Intelligence (store / branch ranking engine)
+# Branch cells - revenue, profit, units and transactions per (month, region,
+# store, branch_id, product_category, sales_channel) - are additive like the
+# rollup cube, so they are built per partition (only touched months after an
+# ingest) and any sidebar filter is applied to the cells, never to the
+# transactions. From the cells the engine precomputes one ranked row per branch
+# (or store):
+#   revenue, profit, margin %, units, transactions, revenue per transaction
+#   growth %   latest month of the selection vs the month before
+#   trend      monthly revenue of the last SPARK_MONTHS months (sparkline)
+# update() re-scores only the branches whose monthly figures changed (all of
+# them when a new month starts), and sorted orders are cached per column until
+# the next update, so a page of the ranking is a slice of a cached order.
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_store import load_master_dataset, dataset_version
+from partition_store import MANIFEST_PATH as STORE_MANIFEST, per_partition
+from query_engine import filter_cube
+from drilldown import sort_key
+from instrumentation import cache_result
+
+CELL_DIMS = ['month', 'region', 'store', 'branch_id', 'product_category', 'sales_channel']
+MEASURES = ['revenue', 'profit', 'units_sold']
+BRANCH_COLUMNS = ['date'] + CELL_DIMS[1:] + MEASURES
+LEVELS = {'branch': ('branch_id', ['store', 'region']), 'store': ('store', ['region'])}
+RANK_COLUMNS = ['revenue', 'profit', 'margin_pct', 'units_sold', 'transactions', 'revenue_per_txn', 'growth_pct']
+SPARK_MONTHS = 12
+
+def available(df):
+    return df is not None and {'store', 'revenue'}.issubset(df.columns)
+
+# -------------------------
+# Branch cells (additive)
+# -------------------------
+def branch_cells(df: pd.DataFrame):
+    """Sums of MEASURES and a transaction count per (month, store, branch, ...) cell."""
+    if not available(df):
+        return None
+    work = pd.DataFrame(index=df.index)
+    if 'date' in df.columns:
+        work['month'] = pd.to_datetime(df['date'], errors='coerce').dt.to_period('M').dt.to_timestamp()
+    for d in CELL_DIMS[1:]:
+        if d in df.columns:
+            work[d] = df[d]
+    dims = [d for d in CELL_DIMS if d in work.columns]
+    for m in MEASURES:
+        if m in df.columns:
+            v = pd.to_numeric(df[m], errors='coerce')
+            work[m] = v.astype('int64') if pd.api.types.is_integer_dtype(v) else v.astype('float64')
+    work['transactions'] = 1
+    return work.groupby(dims, observed=True, dropna=False).sum().reset_index()
+
+def merge_cells(states):
+    """Combine cells of disjoint row sets (every measure is a sum)."""
+    states = [s for s in states if s is not None and len(s)]
+    if len(states) <= 1:
+        return states[0] if states else None
+    allc = pd.concat(states, ignore_index=True)
+    dims = [d for d in CELL_DIMS if d in allc.columns]
+    return allc.groupby(dims, observed=True, dropna=False).sum().reset_index()
+
+# -------------------------
+# Ranked table
+# -------------------------
+def monthly(cells: pd.DataFrame, level='branch'):
+    """Per (key, month) sums - what a ranking row is computed from."""
+    key, labels = LEVELS[level]
+    by = [key] + (['month'] if 'month' in cells.columns else [])
+    values = [c for c in MEASURES + ['transactions'] if c in cells.columns]
+    agg = {c: (c, 'sum') for c in values}
+    agg.update({c: (c, 'first') for c in labels if c in cells.columns})
+    out = cells.dropna(subset=[key]).groupby(by, observed=True).agg(**agg)
+    return out.reset_index().assign(**{key: lambda d: d[key].astype(str)})
+
+def rank_rows(per_month: pd.DataFrame, level='branch', last_month=None):
+    """Ranking rows from monthly(); growth and trend end at `last_month`
+    (default: the latest month present)."""
+    key, labels = LEVELS[level]
+    values = [c for c in MEASURES + ['transactions'] if c in per_month.columns]
+    agg = {c: (c, 'sum') for c in values}
+    agg.update({c: (c, 'first') for c in labels if c in per_month.columns})
+    rows = per_month.groupby(key, sort=False).agg(**agg)
+    rev, txn = rows['revenue'], rows['transactions']
+    if 'profit' in rows.columns:
+        rows['margin_pct'] = (rows['profit'] / rev.where(rev != 0) * 100).round(2)
+    rows['revenue_per_txn'] = rev / txn.where(txn != 0)
+    if 'month' in per_month.columns and per_month['month'].notna().any():
+        last = per_month['month'].max() if last_month is None else last_month
+        months = pd.date_range(end=last, periods=SPARK_MONTHS, freq='MS')
+        grid = (per_month[per_month['month'].isin(months)]
+                .pivot_table(index=key, columns='month', values='revenue', aggfunc='sum', observed=True)
+                .reindex(index=rows.index, columns=months).fillna(0.0))
+        cur, prev = grid.iloc[:, -1], grid.iloc[:, -2]
+        rows['growth_pct'] = ((cur / prev.where(prev > 0) - 1) * 100).round(2)
+        rows['trend'] = grid.to_numpy().tolist()
+    return rows
+
+# -------------------------
+# Engine
+# -------------------------
+class RankingEngine:
+    """Ranked rows per level plus cached sort orders; update() re-scores only the
+    keys whose monthly figures changed. Engines are shared between sessions, so
+    reads and updates take the engine lock."""
+    def __init__(self, cells: pd.DataFrame):
+        self._lock = threading.Lock()
+        self.cells = cells
+        self._monthly = {level: monthly(cells, level) for level in LEVELS if LEVELS[level][0] in cells.columns}
+        self.rows = {level: rank_rows(m, level) for level, m in self._monthly.items()}
+        self._orders = {}
+        self._rank()
+
+    def _last_month(self):
+        return self.cells['month'].max() if 'month' in self.cells.columns else None
+
+    def _rank(self):
+        for rows in self.rows.values():
+            rows['rank'] = rows['revenue'].rank(ascending=False, method='first').astype(int)
+        self._orders.clear()
+
+    def update(self, cells: pd.DataFrame):
+        """Swap in newer cells, re-scoring only the keys whose months changed."""
+        with self._lock:
+            return self._update(cells)
+
+    def _update(self, cells):
+        new_last = cells['month'].max() if 'month' in cells.columns else None
+        same_month = new_last == self._last_month()
+        self.cells = cells
+        changed = 0
+        for level in list(self._monthly):
+            key = LEVELS[level][0]
+            new = monthly(cells, level)
+            if not same_month:
+                self._monthly[level], self.rows[level] = new, rank_rows(new, level)
+                changed += len(self.rows[level])
+                continue
+            old = self._monthly[level]
+            dims = [key] + (['month'] if 'month' in new.columns else [])
+            both = new.merge(old, on=dims, how='outer', suffixes=('', '_old'), indicator=True)
+            values = [c for c in MEASURES + ['transactions'] if c in new.columns]
+            diff = both['_merge'] != 'both'
+            for c in values:
+                diff |= ~np.isclose(both[c].astype(float), both[f"{c}_old"].astype(float), equal_nan=True)
+            keys = pd.Index(both.loc[diff.to_numpy(), key].unique())
+            if len(keys):
+                fresh = rank_rows(new[new[key].isin(keys)], level, new_last)
+                keep = self.rows[level].drop(index=keys, errors='ignore')
+                self.rows[level] = pd.concat([keep, fresh])  # keys gone from the cells stay dropped
+            self._monthly[level] = new
+            changed += len(keys)
+        self._rank()
+        return changed
+
+    def page(self, level='branch', sort_by='revenue', descending=True, page=0, size=25):
+        """Rows of page `page` (0-based) in `sort_by` order (ties by rank).
+        Returns (frame, total rows)."""
+        with self._lock:
+            rows = self.rows.get(level)
+            if rows is None:
+                return pd.DataFrame(), 0
+            order = self._orders.get((level, sort_by, descending))
+            cache_result("ranking_order", order is not None)
+            if order is None:
+                by_rank = np.argsort(rows['rank'].to_numpy(), kind='stable')
+                key = sort_key(rows[sort_by].iloc[by_rank], descending) if sort_by in rows.columns else None
+                order = by_rank if key is None else by_rank[np.argsort(key, kind='stable')]
+                self._orders[(level, sort_by, descending)] = order
+            view = rows.iloc[order[page * size:(page + 1) * size]]
+            return view.reset_index(), len(rows)
+
+    def slice(self, filters):
+        """Engine over the cells matching the sidebar `filters` (month-aligned dates)."""
+        return RankingEngine(filter_cube(self.cells, filters))
+
+def engine_for(df: pd.DataFrame):
+    cells = branch_cells(df)
+    return None if cells is None else RankingEngine(cells)
+
+# -------------------------
+# Master engine (one per dataset version)
+# -------------------------
+_RANK_LOCK = threading.Lock()
+_ENGINE = {}  # 'version' / 'engine' of the latest build
+
+def master_rankings():
+    """Engine for the full master dataset. A new dataset version updates the
+    previous engine in place; on the partitioned store only the touched months
+    are re-aggregated into cells."""
+    df, p = load_master_dataset(columns=BRANCH_COLUMNS)
+    if not available(df):
+        return None
+    version = dataset_version(p)
+    with _RANK_LOCK:
+        cache_result("rankings", _ENGINE.get('version') == version)
+        if _ENGINE.get('version') == version:
+            return _ENGINE['engine']
+        if p == STORE_MANIFEST:
+            from chunked import load_aggregate
+            cells = load_aggregate('branches', version)
+            if cells is None:
+                cells = pd.concat(per_partition('branches', BRANCH_COLUMNS, branch_cells), ignore_index=True)
+        else:
+            cells = branch_cells(df)
+        engine = _ENGINE.get('engine')
+        if engine is None:
+            engine = RankingEngine(cells)
+        else:
+            engine.update(cells)
+        _ENGINE.update(version=version, engine=engine)
+        return engine
@@ -0,0 +1,84 @@
+# retention.py - Veekstar Retail Intelligence (customer-month presence engine)
+# Repeat rate and cohort retention from one pass over the data: transactions
+# are reduced to deduplicated (customer, month) pairs with integer keys, and
+# every metric below is a vectorized lookup/aggregation over those pairs.
+import numpy as np
+import pandas as pd
+
+# -------------------------
+# Presence pairs
+# -------------------------
+def customer_months(df: pd.DataFrame):
+    """Deduplicated (customer, month) presence pairs.
+    Columns: cust (int code), m (months since epoch), cohort (customer's first m)."""
+    dates = pd.to_datetime(df['date'], errors='coerce')
+    ok = dates.notna().to_numpy() & df['customer_id'].notna().to_numpy()
+    cust, _ = pd.factorize(df['customer_id'][ok])
+    d = dates[ok]
+    m = (d.dt.year.to_numpy() - 1970) * 12 + (d.dt.month.to_numpy() - 1)
+    pairs = pd.DataFrame({'cust': cust.astype(np.int64), 'm': m.astype(np.int64)}).drop_duplicates()
+    pairs['cohort'] = pairs.groupby('cust')['m'].transform('min')
+    return pairs
+
+def month_ts(m):
+    """Months-since-epoch ints -> month-start timestamps."""
+    m = np.asarray(m)
+    return pd.to_datetime(pd.DataFrame({'year': 1970 + m // 12, 'month': m % 12 + 1, 'day': 1}))
+
+# -------------------------
+# Metrics
+# -------------------------
+def monthly_repeat_rate(pairs: pd.DataFrame):
+    """Share of each month's customers who also bought in the previous calendar month.
+    Returns columns month, unique_customers, repeaters, repeat_rate (first month skipped)."""
+    if pairs.empty:
+        return pd.DataFrame(columns=['month', 'unique_customers', 'repeaters', 'repeat_rate'])
+    span = int(pairs['m'].max()) + 2
+    key = pairs['cust'].to_numpy() * span + pairs['m'].to_numpy()
+    # shifted self-join as a sorted-key membership test: was (cust, m-1) present?
+    had_prev = np.isin(key - 1, key, assume_unique=True)
+    out = (pd.DataFrame({'m': pairs['m'].to_numpy(), 'repeat': had_prev})
+           .groupby('m')['repeat'].agg(unique_customers='size', repeaters='sum')
+           .reset_index())
+    out = out[out['m'] > out['m'].min()]
+    out['repeat_rate'] = out['repeaters'] / out['unique_customers']
+    out.insert(0, 'month', month_ts(out['m']).to_numpy())
+    return out.drop(columns='m').reset_index(drop=True)
+
+def cohort_matrix(pairs: pd.DataFrame, horizon=12):
+    """Cohort retention: rows = first-purchase month, columns = months since first
+    purchase (0..horizon), values = share of the cohort active in that month."""
+    if pairs.empty:
+        return pd.DataFrame()
+    age = (pairs['m'] - pairs['cohort']).to_numpy()
+    keep = age <= horizon
+    counts = (pd.DataFrame({'cohort': pairs['cohort'].to_numpy()[keep], 'age': age[keep]})
+              .groupby(['cohort', 'age']).size().unstack('age', fill_value=0))
+    counts = counts.reindex(columns=range(horizon + 1), fill_value=0)
+    sizes = counts[0]
+    retention = counts.div(sizes, axis=0)
+    # cohorts that have not been observed long enough are unknown, not 0
+    last_m = int(pairs['m'].max())
+    observable = last_m - counts.index.to_numpy()[:, None] >= np.arange(horizon + 1)[None, :]
+    retention = retention.where(observable)
+    retention.index = month_ts(retention.index).to_numpy()
+    retention.index.name = 'cohort'
+    retention.columns.name = 'months_since_first'
+    return retention
+
+def retention_curve(matrix: pd.DataFrame, sizes=None):
+    """Average N-month retention across cohorts (cohort-size weighted when sizes given)."""
+    if matrix.empty:
+        return pd.DataFrame(columns=['months_since_first', 'retention'])
+    if sizes is None:
+        curve = matrix.mean(axis=0, skipna=True)
+    else:
+        w = matrix.notna().mul(np.asarray(sizes, dtype=float), axis=0)
+        curve = (matrix.fillna(0) * w).sum(axis=0) / w.sum(axis=0).replace(0, np.nan)
+    return curve.rename('retention').rename_axis('months_since_first').reset_index()
+
+def cohort_sizes(pairs: pd.DataFrame):
+    """Number of new customers per cohort month (aligned with cohort_matrix rows)."""
+    s = pairs.loc[pairs['m'] == pairs['cohort']].groupby('cohort').size()
+    s.index = month_ts(s.index).to_numpy()
+    return s
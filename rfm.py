@@ -0,0 +1,156 @@
+# rfm.py - Veekstar Retail Intelligence (RFM segmentation engine)
+# Per-customer state (last purchase date, distinct purchase days, revenue) is
+# computed with integer-coded group reductions, scored R x F x M on 1-5
+# quintiles and mapped to named segments. The state is persisted next to the
+# dataset and updated incrementally: new transactions only touch the
+# customers that appear in them.
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data_store import DATA_DIR, load_master_dataset, dataset_version, write_parquet, read_parquet_meta
+from instrumentation import cache_result
+
+RFM_STATE_PATH = DATA_DIR / "rfm_state.parquet"
+RFM_COLUMNS = ['customer_id', 'date', 'revenue']
+STATE_META_KEY = "veekstar_rfm_source"
+
+# ordered: the first matching rule names the segment
+SEGMENT_RULES = [
+    ("Champions",           lambda r, f, m: (r >= 4) & (f >= 4)),
+    ("Loyal Customers",     lambda r, f, m: (r >= 3) & (f >= 4)),
+    ("Can't Lose Them",     lambda r, f, m: (r <= 1) & (f >= 4) & (m >= 4)),
+    ("At Risk",             lambda r, f, m: (r <= 2) & (f >= 3)),
+    ("New Customers",       lambda r, f, m: (r == 5) & (f == 1)),
+    ("Promising",           lambda r, f, m: (r == 4) & (f == 1)),
+    ("Potential Loyalists", lambda r, f, m: (r >= 4) & (f <= 3)),
+    ("Need Attention",      lambda r, f, m: (r == 3) & (f == 3)),
+    ("About to Sleep",      lambda r, f, m: (r == 3) & (f <= 2)),
+    ("Lost",                lambda r, f, m: (r == 1) & (f == 1)),
+    ("Hibernating",         lambda r, f, m: r <= 2),
+]
+
+# -------------------------
+# State
+# -------------------------
+def compute_state(df: pd.DataFrame):
+    """Per-customer RFM state: customer_id, last_date, frequency (distinct purchase
+    days), monetary (revenue sum). One factorize + three group reductions."""
+    dates = pd.to_datetime(df['date'], errors='coerce')
+    ok = (dates.notna() & df['customer_id'].notna()).to_numpy()
+    codes, uniques = pd.factorize(df['customer_id'][ok])
+    days = dates[ok].to_numpy(dtype='datetime64[D]')
+    n = len(uniques)
+    last = pd.Series(days).groupby(codes).max().reindex(range(n)).to_numpy()
+    # distinct (customer, day) pairs -> purchase days per customer
+    pair = pd.DataFrame({'c': codes, 'd': days}).drop_duplicates()
+    freq = np.bincount(pair['c'].to_numpy(), minlength=n)
+    rev = pd.to_numeric(df['revenue'][ok], errors='coerce').fillna(0).to_numpy()
+    monetary = np.bincount(codes, weights=rev, minlength=n)
+    return pd.DataFrame({'customer_id': np.asarray(uniques, dtype=object),
+                         'last_date': pd.to_datetime(last),
+                         'frequency': freq.astype(np.int64),
+                         'monetary': monetary})
+
+def update_state(state: pd.DataFrame, new_rows: pd.DataFrame):
+    """Fold new transactions into an existing state, touching only the customers
+    present in `new_rows`. Exact for appended (not back-dated) transactions: the
+    only day that can be double counted is a customer's current last_date."""
+    delta = compute_state(new_rows)
+    if delta.empty:
+        return state
+    if state is None or state.empty:
+        return delta
+    old = state.set_index('customer_id')
+    d = delta.set_index('customer_id')
+    hit = d.index.intersection(old.index)
+    if len(hit):
+        o, n = old.loc[hit], d.loc[hit]
+        # the new batch's purchase days for these customers include the old last day?
+        new_days = pd.DataFrame({'c': new_rows['customer_id'],
+                                 'd': pd.to_datetime(new_rows['date'], errors='coerce').dt.normalize()})
+        new_days = new_days[new_days['c'].isin(hit)].drop_duplicates()
+        overlap = (new_days.merge(o['last_date'].rename('d').reset_index().rename(columns={'customer_id': 'c'}),
+                                  on=['c', 'd'])['c'].value_counts().reindex(hit, fill_value=0))
+        old.loc[hit, 'frequency'] = o['frequency'] + n['frequency'] - overlap.to_numpy()
+        old.loc[hit, 'monetary'] = o['monetary'] + n['monetary']
+        old.loc[hit, 'last_date'] = np.maximum(o['last_date'].to_numpy(), n['last_date'].to_numpy())
+    fresh = d.loc[d.index.difference(old.index)]
+    return pd.concat([old, fresh]).rename_axis('customer_id').reset_index()
+
+def save_state(state: pd.DataFrame, source_version, path: Path = RFM_STATE_PATH):
+    write_parquet(state, path, {STATE_META_KEY: source_version})
+
+def load_state(path: Path = RFM_STATE_PATH):
+    """(state, source_version) from disk, (None, None) when absent/unreadable."""
+    try:
+        return pd.read_parquet(path), read_parquet_meta(path, STATE_META_KEY)
+    except Exception:
+        return None, None
+
+# -------------------------
+# Scoring
+# -------------------------
+def _quintile(values, higher_is_better=True):
+    # quintiles of the distinct values, so equal values always share a score: with
+    # heavy ties (most customers buy on one day) a row-order split would push some
+    # one-time buyers into the top frequency bins
+    dense = pd.Series(values).rank(method='dense').to_numpy()
+    distinct = max(int(np.nanmax(dense)) if len(dense) else 1, 1)
+    score = (np.floor((dense - 1) * 5 / distinct) + 1).clip(1, 5).astype(np.int8)
+    return score if higher_is_better else (6 - score).astype(np.int8)
+
+def score(state: pd.DataFrame, as_of=None):
+    """Add recency (days), r/f/m scores (1-5), rfm code and named segment."""
+    out = state.copy()
+    if out.empty:
+        for c in ['recency', 'r', 'f', 'm', 'rfm', 'segment']:
+            out[c] = pd.Series(dtype=object)
+        return out
+    as_of = pd.Timestamp(as_of) if as_of is not None else out['last_date'].max()
+    out['recency'] = (as_of - out['last_date']).dt.days
+    out['r'] = _quintile(out['recency'].to_numpy(), higher_is_better=False)
+    out['f'] = _quintile(out['frequency'].to_numpy())
+    out['m'] = _quintile(out['monetary'].to_numpy())
+    out['rfm'] = out['r'].astype(str) + out['f'].astype(str) + out['m'].astype(str)
+    r, f, m = out['r'].to_numpy(), out['f'].to_numpy(), out['m'].to_numpy()
+    out['segment'] = np.select([rule(r, f, m) for _, rule in SEGMENT_RULES],
+                               [name for name, _ in SEGMENT_RULES], default="Others")
+    return out
+
+def segment_summary(scored: pd.DataFrame):
+    """Customers, revenue and average recency/frequency per segment."""
+    return (scored.groupby('segment')
+            .agg(customers=('customer_id', 'size'), revenue=('monetary', 'sum'),
+                 avg_recency=('recency', 'mean'), avg_frequency=('frequency', 'mean'))
+            .reset_index().sort_values('revenue', ascending=False))
+
+# -------------------------
+# Master state (persisted, one per dataset version)
+# -------------------------
+_RFM_LOCK = threading.Lock()
+_RFM = {}  # dataset version -> scored frame
+
+def master_rfm():
+    """Scored RFM table for the full master dataset. Reuses the persisted state
+    when it was built from the current dataset version."""
+    df, p = load_master_dataset(columns=RFM_COLUMNS)
+    if df is None or not set(RFM_COLUMNS).issubset(df.columns):
+        return None
+    version = dataset_version(p)
+    with _RFM_LOCK:
+        cache_result("rfm", version in _RFM)
+        if version in _RFM:
+            return _RFM[version]
+        state, source = load_state()
+        if state is None or source != version:
+            state = compute_state(df)
+            try:
+                save_state(state, version)
+            except Exception:
+                pass  # persistence is an optimisation; pyarrow may be missing
+        _RFM.clear()
+        _RFM[version] = score(state)
+        return _RFM[version]
@@ -0,0 +1,113 @@
+# rollups.py - Veekstar Retail Intelligence (pre-aggregated rollup cube)
+# One aggregate cube per dataset version:
+#   month x region x store x product_category x sales_channel
+# with sums / non-null counts of the page measures. Every page chart is a
+# slice of the cube, so renders cost O(cells) instead of O(transactions).
+import threading
+
+import pandas as pd
+
+from data_store import load_master_dataset, dataset_version
+from partition_store import MANIFEST_PATH as STORE_MANIFEST, per_partition
+from instrumentation import cache_result
+
+CUBE_DIMS = ['month', 'region', 'store', 'product_category', 'sales_channel']
+CUBE_MEASURES = ['revenue', 'profit', 'units_sold', 'stock_available', 'unit_price']
+# raw columns the cube is built from ('date' becomes the 'month' dimension)
+CUBE_SOURCE_COLUMNS = ['date'] + CUBE_DIMS[1:] + CUBE_MEASURES
+
+# -------------------------
+# Build
+# -------------------------
+def build_cube(df: pd.DataFrame):
+    """Aggregate transactions into cube cells. For every measure `m` present the
+    cube holds `m` (sum) and `m_n` (non-null count); `transactions` counts rows."""
+    work = pd.DataFrame(index=df.index)
+    if 'date' in df.columns:
+        work['month'] = pd.to_datetime(df['date'], errors='coerce').dt.to_period('M').dt.to_timestamp()
+    for d in CUBE_DIMS[1:]:
+        if d in df.columns:
+            work[d] = df[d]
+    dims = [d for d in CUBE_DIMS if d in work.columns]
+    measures = [m for m in CUBE_MEASURES if m in df.columns]
+    for m in measures:
+        # sum in 64 bits: the compact schema stores e.g. units_sold as int16 / float32
+        v = pd.to_numeric(df[m], errors='coerce')
+        work[m] = v.astype('int64') if pd.api.types.is_integer_dtype(v) else v.astype('float64')
+    work['transactions'] = 1
+    if not dims:
+        work['_all'] = 0
+        dims = ['_all']
+    agg = {m: (m, 'sum') for m in measures}
+    agg.update({f"{m}_n": (m, 'count') for m in measures})
+    agg['transactions'] = ('transactions', 'sum')
+    cube = work.groupby(dims, observed=True, dropna=False).agg(**agg).reset_index()
+    return cube.drop(columns=['_all'], errors='ignore')
+
+# -------------------------
+# Per-version cache
+# -------------------------
+_CUBE_LOCK = threading.Lock()
+_CUBES = {}  # dataset version -> cube
+_MAX_VERSIONS = 2
+
+def master_cube():
+    """Cube for the current master dataset, built once per dataset version."""
+    df, p = load_master_dataset(columns=CUBE_SOURCE_COLUMNS)
+    if df is None:
+        return None
+    version = dataset_version(p)
+    with _CUBE_LOCK:
+        cube = _CUBES.get(version)
+        cache_result("cube", cube is not None)
+        if cube is None:
+            if p == STORE_MANIFEST:
+                from chunked import load_aggregate
+                # folded while the store was built (ingest.py init); otherwise partitions
+                # are whole months, so their cubes are disjoint cell sets: after an
+                # ingest only the touched months are re-aggregated
+                cube = load_aggregate('cube', version)
+                if cube is None:
+                    cube = pd.concat(per_partition('cube', CUBE_SOURCE_COLUMNS, build_cube), ignore_index=True)
+            else:
+                cube = build_cube(df)
+            _CUBES[version] = cube
+            # old versions are only kept around for sessions mid-rerun
+            while len(_CUBES) > _MAX_VERSIONS:
+                _CUBES.pop(next(iter(_CUBES)))
+        return cube
+
+# -------------------------
+# Slicing
+# -------------------------
+def has_dims(cube, *dims):
+    return cube is not None and all(d in cube.columns for d in dims)
+
+def rollup(cube: pd.DataFrame, by=None):
+    """Re-aggregate cube cells to the `by` dimensions (None/[] -> one-row total).
+    Adds `<m>_mean` for every measure so means stay exact (sum / non-null count)."""
+    by = [by] if isinstance(by, str) else list(by or [])
+    value_cols = [c for c in cube.columns if c not in CUBE_DIMS]
+    if by:
+        out = cube.groupby(by, observed=True)[value_cols].sum().reset_index()
+    else:
+        out = cube[value_cols].sum().to_frame().T
+    for m in CUBE_MEASURES:
+        if m in out.columns:
+            out[f"{m}_mean"] = out[m] / out[f"{m}_n"].where(out[f"{m}_n"] > 0)
+    return out
+
+def totals(cube: pd.DataFrame):
+    """Whole-cube totals as a Series (revenue, profit, ..., transactions, <m>_mean)."""
+    return rollup(cube).iloc[0]
+
+def monthly(cube: pd.DataFrame):
+    """Monthly rollup with empty months filled with 0 (same shape as resample('M'))."""
+    out = rollup(cube, ['month'])
+    if out.empty:
+        return out
+    full = pd.date_range(out['month'].min(), out['month'].max(), freq='MS')
+    out = out.set_index('month').reindex(full)
+    sum_cols = [c for c in out.columns if not c.endswith('_mean')]
+    out[sum_cols] = out[sum_cols].fillna(0)
+    return out.rename_axis('month').reset_index()
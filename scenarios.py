@@ -0,0 +1,150 @@
+# scenarios.py - Veekstar Retail Intelligence (what-if scenario simulator)
+# Re-scores the monthly forecast horizon through the revenue and profit models
+# for driver adjustments (campaign spend, discount, loyalty, satisfaction).
+# Many scenarios are scored together: at each forecast step one predict call
+# per model covers every scenario, and the recursive lag features
+# (rev_lag_1, rev_lag_3, rev_roll_3_mean, profit_lag_1, profit_roll_3_mean)
+# are rolled forward as arrays. Results are cached on quantized slider values.
+import hashlib
+import threading
+from collections import OrderedDict
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from model_registry import get_registry, model_feature_names, FEATURES
+
+# driver -> (how the slider value is applied, quantization step, clip range)
+DRIVERS = {
+    'campaign_spend_pct': ('Campaign_Spend', 'pct', 5.0, (0.0, None)),
+    'discount_delta': ('Discount_Applied', 'add', 0.01, (0.0, 1.0)),
+    'loyalty_delta': ('Loyalty_Score', 'add', 1.0, (0.0, 100.0)),
+    'satisfaction_delta': ('Satisfaction_Score', 'add', 0.1, (1.0, 5.0)),
+}
+DEFAULT_HORIZON = 24
+
+def quantize(drivers):
+    """Snap slider values to their step so near-identical drags share a cache entry."""
+    out = []
+    for name, (_, _, step, _) in DRIVERS.items():
+        v = float((drivers or {}).get(name, 0.0))
+        out.append(round(round(v / step) * step, 6))
+    return tuple(out)
+
+def canonical_features(base: pd.DataFrame):
+    """Baseline feature table with model-cased column names (CSV headers may be lower-cased)."""
+    lookup = {c.lower(): c for c in base.columns}
+    keep = {lookup[f.lower()]: f for f in FEATURES if f.lower() in lookup}
+    out = base[list(keep)].rename(columns=keep).apply(pd.to_numeric, errors='coerce').reset_index(drop=True)
+    date_col = lookup.get('ds') or lookup.get('date')
+    if date_col is not None:
+        out['date'] = pd.to_datetime(base[date_col], errors='coerce').to_numpy()
+    return out
+
+def seed_history(first_row):
+    """Last three actual (revenue, profit) values before the horizon, recovered
+    from the first forecast row's lag features: [t-3, t-2, t-1]."""
+    r1, r3, rr = first_row['rev_lag_1'], first_row['rev_lag_3'], first_row['rev_roll_3_mean']
+    p1, pr = first_row['profit_lag_1'], first_row['profit_roll_3_mean']
+    rev = [r3, 3 * rr - r1 - r3, r1]
+    p_rest = (3 * pr - p1) / 2
+    return np.array(rev, dtype=float), np.array([p_rest, p_rest, p1], dtype=float)
+
+# -------------------------
+# Batched recursive scoring
+# -------------------------
+def has_features(base: pd.DataFrame):
+    cols = {c.lower() for c in base.columns}
+    return all(f.lower() in cols for f in FEATURES)
+
+def driver_grid(feats: pd.DataFrame, scenarios):
+    """Static features broadcast to [S, H] arrays with each scenario's driver
+    adjustments applied (lag features are filled in by the recursion)."""
+    S, H = len(scenarios), len(feats)
+    grid = {f: np.broadcast_to(feats[f].to_numpy(dtype=float), (S, H)).copy()
+            for f in FEATURES if f in feats.columns}
+    q = np.asarray(scenarios, dtype=float).reshape(S, len(DRIVERS))
+    for j, (col, mode, _, (lo, hi)) in enumerate(DRIVERS.values()):
+        if col not in grid:
+            continue
+        adj = q[:, j][:, None]
+        grid[col] = grid[col] * (1 + adj / 100.0) if mode == 'pct' else grid[col] + adj
+        grid[col] = np.clip(grid[col], lo, hi)
+    return grid
+
+def simulate_batch(base: pd.DataFrame, scenarios, horizon=DEFAULT_HORIZON, registry=None):
+    """Score `scenarios` (list of quantized driver tuples) over the horizon.
+    Returns (dates, revenue[S, H], profit[S, H])."""
+    registry = registry or get_registry()
+    feats = canonical_features(base).head(horizon)
+    H, S = len(feats), len(scenarios)
+    rev_model, profit_model = registry.get('revenue'), registry.get('profit')
+    rev_names, profit_names = model_feature_names(rev_model), model_feature_names(profit_model)
+
+    grid = driver_grid(feats, scenarios)
+    rev_hist, profit_hist = seed_history(feats.iloc[0])
+    rev_hist = np.tile(rev_hist, (S, 1))        # [S, 3]: t-3, t-2, t-1
+    profit_hist = np.tile(profit_hist, (S, 1))
+    revenue = np.empty((S, H))
+    profit = np.empty((S, H))
+    for t in range(H):
+        step = {f: grid[f][:, t] for f in grid}
+        step['rev_lag_1'] = rev_hist[:, 2]
+        step['rev_lag_3'] = rev_hist[:, 0]
+        step['rev_roll_3_mean'] = rev_hist.mean(axis=1)
+        step['profit_lag_1'] = profit_hist[:, 2]
+        step['profit_roll_3_mean'] = profit_hist.mean(axis=1)
+        revenue[:, t] = rev_model.predict(np.column_stack([step[n] for n in rev_names]))
+        profit[:, t] = profit_model.predict(np.column_stack([step[n] for n in profit_names]))
+        rev_hist = np.column_stack([rev_hist[:, 1:], revenue[:, t]])
+        profit_hist = np.column_stack([profit_hist[:, 1:], profit[:, t]])
+    dates = feats['date'].to_numpy() if 'date' in feats.columns else np.arange(H)
+    return dates, revenue, profit
+
+def neighbours(q):
+    """The scenario itself plus one quantization step either way on every driver -
+    scored in the same batch so the next slider move is already cached."""
+    steps = [s for (_, _, s, _) in DRIVERS.values()]
+    return [tuple(round(v + d * s, 6) for v, d, s in zip(q, deltas, steps))
+            for deltas in product((-1, 0, 1), repeat=len(q))]
+
+# -------------------------
+# Cached simulator
+# -------------------------
+class ScenarioSimulator:
+    def __init__(self, cache_size=2048):
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+
+    def run(self, base: pd.DataFrame, drivers=None, horizon=DEFAULT_HORIZON, prefetch=True):
+        """DataFrame(date, revenue, profit) for one driver setting. Cache misses are
+        scored together with their neighbours (and the zero-adjustment baseline)."""
+        registry = get_registry()
+        registry.get('revenue'), registry.get('profit')  # refresh model versions for the key
+        feats = canonical_features(base).head(horizon)
+        digest = hashlib.sha1(pd.util.hash_pandas_object(feats, index=False).to_numpy().tobytes()).hexdigest()
+        base_key = (digest, horizon, registry.version())
+        q = quantize(drivers)
+        with self._lock:
+            hit = self._cache.get((base_key, q))
+            if hit is not None:
+                self._cache.move_to_end((base_key, q))
+                return hit
+        batch = [q] + ([n for n in neighbours(q) if n != q] if prefetch else [])
+        zero = quantize({})
+        if zero not in batch:
+            batch.append(zero)
+        dates, revenue, profit = simulate_batch(base, batch, horizon, registry)
+        with self._lock:
+            for i, s in enumerate(batch):
+                self._cache[(base_key, s)] = pd.DataFrame({'date': dates, 'revenue': revenue[i], 'profit': profit[i]})
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+            return self._cache[(base_key, q)]
+
+_SIMULATOR = ScenarioSimulator()
+
+def get_simulator():
+    return _SIMULATOR
@@ -0,0 +1,178 @@
+# segment_forecasts.py - Veekstar Retail Intelligence (hierarchical segment forecasts)
+# Bottom-level monthly series (region x store x product_category) are fitted
+# with small per-series ridge autoregressions in a process pool, forecast
+# recursively, reconciled to the company-wide forecast and summed up to the
+# Region / Store / Category / Total levels (bottom-up, so every level adds up).
+#
+# The feature tensor is built once in the parent and placed in shared memory;
+# workers attach to it zero-copy and only return their coefficient blocks.
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+SEGMENT_DIMS = ['region', 'store', 'product_category']
+LEVELS = {
+    'Total': [],
+    'Region': ['region'],
+    'Store': ['store'],
+    'Category': ['product_category'],
+    'Store x Category': ['store', 'product_category'],
+}
+TARGETS = {'revenue': 'Revenue', 'profit': 'Profit'}
+HOLIDAY_MONTHS = (11, 12)
+# intercept, lag 1, lag 3, mean of the last 3 months, holiday-month flag
+N_FEATURES = 5
+RIDGE = 1e-2
+SEGMENTS_FILE = "forecast_segments.csv"
+
+# -------------------------
+# Panel + features
+# -------------------------
+def segment_panel(df: pd.DataFrame):
+    """Bottom-level monthly panel: (keys frame, month index, values[target, series, month])."""
+    dims = [d for d in SEGMENT_DIMS if d in df.columns]
+    month = pd.to_datetime(df['date'], errors='coerce').dt.to_period('M').dt.to_timestamp()
+    ok = month.notna().to_numpy()
+    keys = df.loc[ok, dims].astype(str).reset_index(drop=True)
+    if dims:
+        sid = keys.groupby(dims, sort=True).ngroup().to_numpy()
+        key_frame = keys.drop_duplicates().sort_values(dims).reset_index(drop=True)
+    else:
+        sid = np.zeros(len(keys), dtype=np.int64)
+        key_frame = pd.DataFrame(index=[0])
+    months = pd.date_range(month[ok].min(), month[ok].max(), freq='MS')
+    t = ((month[ok].dt.year - months[0].year) * 12 + (month[ok].dt.month - months[0].month)).to_numpy()
+    values = np.zeros((len(TARGETS), len(key_frame), len(months)))
+    for i, col in enumerate(TARGETS):
+        np.add.at(values[i], (sid, t), pd.to_numeric(df.loc[ok, col], errors='coerce').fillna(0).to_numpy())
+    return key_frame, months, values
+
+def design_tensor(y: np.ndarray, months: pd.DatetimeIndex):
+    """Features [target, series, month, N_FEATURES] for scaled series y[target, series, month].
+    Months without 3 months of history are NaN (excluded from the fit)."""
+    T = y.shape[-1]
+    X = np.full(y.shape + (N_FEATURES,), np.nan)
+    holiday = np.isin(months.month, HOLIDAY_MONTHS).astype(float)
+    for t in range(3, T):
+        X[..., t, 0] = 1.0
+        X[..., t, 1] = y[..., t - 1]
+        X[..., t, 2] = y[..., t - 3]
+        X[..., t, 3] = y[..., t - 3:t].mean(axis=-1)
+        X[..., t, 4] = holiday[t]
+    return X
+
+# -------------------------
+# Parallel fit (shared-memory workers)
+# -------------------------
+_SHARED = {}
+
+def _attach(x_name, x_shape, y_name, y_shape):
+    # per-worker attachment, reused for every chunk the worker receives
+    if 'X' not in _SHARED:
+        _SHARED['shm'] = [shared_memory.SharedMemory(name=x_name), shared_memory.SharedMemory(name=y_name)]
+        _SHARED['X'] = np.ndarray(x_shape, dtype=np.float64, buffer=_SHARED['shm'][0].buf)
+        _SHARED['y'] = np.ndarray(y_shape, dtype=np.float64, buffer=_SHARED['shm'][1].buf)
+    return _SHARED['X'], _SHARED['y']
+
+def fit_block(X: np.ndarray, y: np.ndarray):
+    """Batched ridge fit for X[target, series, month, f] / y[target, series, month].
+    Returns coefficients [target, series, f]."""
+    valid = ~np.isnan(X).any(axis=-1)
+    Xz = np.where(valid[..., None], X, 0.0)
+    yz = np.where(valid, y, 0.0)
+    XtX = np.einsum('...tf,...tg->...fg', Xz, Xz) + RIDGE * np.eye(X.shape[-1])
+    Xty = np.einsum('...tf,...t->...f', Xz, yz)
+    return np.linalg.solve(XtX, Xty[..., None])[..., 0]
+
+def _fit_chunk(x_name, x_shape, y_name, y_shape, start, stop):
+    X, y = _attach(x_name, x_shape, y_name, y_shape)
+    return start, fit_block(X[:, start:stop], y[:, start:stop])
+
+def fit_series(X: np.ndarray, y: np.ndarray, jobs=None, chunk_size=256):
+    """Fit every series; chunks of series are spread over a process pool with the
+    feature tensor shared zero-copy. Small panels are fitted in-process."""
+    S = X.shape[1]
+    if jobs == 1 or S <= chunk_size:
+        return fit_block(X, y)
+    shm_x = shared_memory.SharedMemory(create=True, size=X.nbytes)
+    shm_y = shared_memory.SharedMemory(create=True, size=y.nbytes)
+    try:
+        np.ndarray(X.shape, dtype=np.float64, buffer=shm_x.buf)[:] = X
+        np.ndarray(y.shape, dtype=np.float64, buffer=shm_y.buf)[:] = y
+        coefs = np.empty(X.shape[:2] + (X.shape[-1],))
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(_fit_chunk, shm_x.name, X.shape, shm_y.name, y.shape, s, min(s + chunk_size, S))
+                       for s in range(0, S, chunk_size)]
+            for f in futures:
+                start, block = f.result()
+                coefs[:, start:start + block.shape[1]] = block
+        return coefs
+    finally:
+        for shm in (shm_x, shm_y):
+            shm.close()
+            shm.unlink()
+
+# -------------------------
+# Forecast + reconciliation
+# -------------------------
+def forecast_series(y: np.ndarray, coefs: np.ndarray, months: pd.DatetimeIndex, horizon):
+    """Recursive forecasts for all series at once: [target, series, horizon]."""
+    hist = y[..., -3:].copy()
+    future = pd.date_range(months[-1] + pd.offsets.MonthBegin(1), periods=horizon, freq='MS')
+    holiday = np.isin(future.month, HOLIDAY_MONTHS).astype(float)
+    out = np.empty(y.shape[:2] + (horizon,))
+    for h in range(horizon):
+        x = np.stack([np.ones_like(hist[..., 2]), hist[..., 2], hist[..., 0],
+                      hist.mean(axis=-1), np.full_like(hist[..., 2], holiday[h])], axis=-1)
+        pred = np.clip(np.einsum('...f,...f->...', x, coefs), 0, None)
+        out[..., h] = pred
+        hist = np.concatenate([hist[..., 1:], pred[..., None]], axis=-1)
+    return future, out
+
+def reconcile(bottom: np.ndarray, totals):
+    """Scale bottom-level forecasts so each month sums to the company-wide forecast
+    (totals[target, horizon]); levels summed from them then match the Forecasts page."""
+    if totals is None:
+        return bottom
+    current = bottom.sum(axis=1, keepdims=True)
+    scale = np.divide(np.asarray(totals)[:, None, :], current, out=np.ones_like(current), where=current > 0)
+    return bottom * scale
+
+def level_frames(keys: pd.DataFrame, months, values, kind):
+    """Long frame (level, segment, ds, kind, Revenue, Profit) for every hierarchy level."""
+    n_t = values.shape[-1]
+    rows = []
+    for level, dims in LEVELS.items():
+        dims = [d for d in dims if d in keys.columns]
+        if level != 'Total' and not dims:
+            continue
+        labels = keys[dims].agg(' | '.join, axis=1) if dims else pd.Series(['All'] * len(keys))
+        codes, uniq = pd.factorize(labels)
+        agg = np.zeros((values.shape[0], len(uniq), n_t))
+        for i in range(values.shape[0]):
+            np.add.at(agg[i], codes, values[i])
+        frame = pd.DataFrame({
+            'level': level,
+            'segment': np.repeat(np.asarray(uniq, dtype=object), n_t),
+            'ds': np.tile(np.asarray(months), len(uniq)),
+            'kind': kind,
+        })
+        for i, target in enumerate(TARGETS.values()):
+            frame[target] = agg[i].reshape(-1)
+        rows.append(frame)
+    return pd.concat(rows, ignore_index=True)
+
+def run_segments(df: pd.DataFrame, horizon, jobs=None, totals=None):
+    """Full hierarchy: actuals + reconciled forecasts for every level, long format."""
+    keys, months, values = segment_panel(df)
+    scale = values.mean(axis=-1, keepdims=True)
+    scale = np.where(scale > 0, scale, 1.0)
+    y = values / scale
+    X = design_tensor(y, months)
+    coefs = fit_series(X, y, jobs=jobs)
+    future, pred = forecast_series(y, coefs, months, horizon)
+    pred = reconcile(pred * scale, totals)
+    return pd.concat([level_frames(keys, months, values, 'actual'),
+                      level_frames(keys, future, pred, 'forecast')], ignore_index=True)
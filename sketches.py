@@ -0,0 +1,147 @@
+# sketches.py - Veekstar Retail Intelligence (distinct-customer sketches)
+# Unique customers can't be summed across cube cells, so every cell of the
+# rollup cube (month, region, store, product_category, sales_channel) carries
+# a HyperLogLog sketch of its customer_ids instead. A sketch is 2^12 registers
+# (the max leading-zero rank seen per hash bucket); the union of any set of
+# cells is the register-wise max, so the distinct count of any filter
+# combination is estimated from the selected cells alone (standard error
+# ~1.6%, near-exact for small counts) without touching the transactions.
+# Sketches are kept sparse - one (cell, register, rank) row per non-empty
+# register - so small cells stay small and the size is bounded by
+# cells x 4096 however many transactions arrive. Sketches of any row sets merge
+# (max is idempotent), so the state is folded while the store is built
+# (chunked.py), rebuilt per touched partition, and carried forward by
+# `ingest.py` with just the new rows.
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_store import load_master_dataset, dataset_version
+from partition_store import MANIFEST_PATH as STORE_MANIFEST, per_partition
+from rollups import CUBE_DIMS
+from query_engine import filter_cube
+from instrumentation import cache_result
+
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+MAX_RANK = 64 - PRECISION + 1
+SKETCH_COLUMNS = ['date', 'customer_id'] + CUBE_DIMS[1:]
+ACTIVE_MONTHS = 3  # "active" = bought in the last 3 months of the selected range
+
+# -------------------------
+# HyperLogLog
+# -------------------------
+def _hash(ids: pd.Series):
+    # 64-bit, stable across processes (fixed-key siphash), same id -> same hash in any chunk
+    return pd.util.hash_array(ids.astype(str).to_numpy(dtype=object))
+
+def _rank(h):
+    """1 + leading zeros of the hash bits below the register index."""
+    w = h << np.uint64(PRECISION)
+    zeros = np.zeros(len(w), dtype=np.int64)
+    for s in (32, 16, 8, 4, 2, 1):
+        top = (w >> np.uint64(64 - s)) == 0
+        zeros += np.where(top, s, 0)
+        w = np.where(top, w << np.uint64(s), w)
+    return np.minimum(zeros + 1, MAX_RANK).astype(np.uint8)
+
+def estimate(registers):
+    """Distinct count from dense registers (linear counting while many are empty)."""
+    m = float(REGISTERS)
+    empty = int((registers == 0).sum())
+    raw = 0.7213 / (1 + 1.079 / m) * m * m / np.ldexp(1.0, -registers.astype(np.int64)).sum()
+    if raw <= 2.5 * m and empty:
+        return m * np.log(m / empty)
+    return raw
+
+def union(sketch: pd.DataFrame):
+    """Dense registers of the union of all cells in `sketch`."""
+    registers = np.zeros(REGISTERS, dtype=np.uint8)
+    if len(sketch):
+        np.maximum.at(registers, sketch['register'].to_numpy(dtype=np.int64), sketch['rank'].to_numpy())
+    return registers
+
+# -------------------------
+# Sketch state (mergeable)
+# -------------------------
+def sketch_state(df: pd.DataFrame):
+    """Sparse sketches of `df`: one row per (cube cell, register) with the max rank."""
+    if 'customer_id' not in df.columns:
+        return None
+    df = df[df['customer_id'].notna()]
+    h = _hash(df['customer_id'])
+    work = pd.DataFrame(index=df.index)
+    if 'date' in df.columns:
+        work['month'] = pd.to_datetime(df['date'], errors='coerce').dt.to_period('M').dt.to_timestamp()
+    for d in CUBE_DIMS[1:]:
+        if d in df.columns:
+            work[d] = df[d]
+    work['register'] = (h >> np.uint64(64 - PRECISION)).astype(np.int16)
+    work['rank'] = _rank(h)
+    return _reduce(work)
+
+def _reduce(work):
+    keys = [d for d in CUBE_DIMS if d in work.columns] + ['register']
+    return work.groupby(keys, observed=True, dropna=False)['rank'].max().reset_index()
+
+def _categorical(sketch):
+    # persisted / concatenated states come back with object dims; categories keep
+    # the sparse rows small and let filter_cube match codes instead of strings
+    dims = [d for d in CUBE_DIMS[1:] if d in sketch.columns and sketch[d].dtype == object]
+    return sketch.assign(**{d: sketch[d].astype('category') for d in dims}) if dims else sketch
+
+def merge_sketches(states):
+    """Union of sketch states of any row sets (overlaps are fine)."""
+    states = [s for s in states if s is not None and len(s)]
+    if len(states) <= 1:
+        return states[0] if states else None
+    return _reduce(pd.concat(states, ignore_index=True))
+
+# -------------------------
+# Queries
+# -------------------------
+def customer_counts(sketch: pd.DataFrame, filters=None, active_months=ACTIVE_MONTHS):
+    """Estimated unique customers of the cells matching `filters` (sidebar filters,
+    month-aligned dates), plus the active ones: customers of the last
+    `active_months` months of that selection."""
+    if sketch is None:
+        return None
+    sel = filter_cube(sketch, filters)
+    out = {'unique': int(round(estimate(union(sel))))}
+    if 'month' in sel.columns and sel['month'].notna().any():
+        since = sel['month'].max() - pd.DateOffset(months=active_months - 1)
+        out.update(active=int(round(estimate(union(sel[sel['month'] >= since])))), active_since=since)
+    return out
+
+# -------------------------
+# Master sketches (one per dataset version)
+# -------------------------
+_SKETCH_LOCK = threading.Lock()
+_SKETCHES = {}  # dataset version -> sketch state
+_MAX_VERSIONS = 2
+
+def master_sketches():
+    """Customer sketches of the full master dataset. On the partitioned store the
+    state persisted at init / ingest is used when it matches the version, else
+    each month is sketched once (disjoint cells, so partitions just concatenate)."""
+    df, p = load_master_dataset(columns=SKETCH_COLUMNS)
+    if df is None or 'customer_id' not in df.columns:
+        return None
+    version = dataset_version(p)
+    with _SKETCH_LOCK:
+        sketch = _SKETCHES.get(version)
+        cache_result("sketches", sketch is not None)
+        if sketch is None:
+            if p == STORE_MANIFEST:
+                from chunked import load_aggregate
+                sketch = load_aggregate('sketches', version)
+                if sketch is None:
+                    sketch = pd.concat(per_partition('sketches', SKETCH_COLUMNS, sketch_state), ignore_index=True)
+            else:
+                sketch = sketch_state(df)
+            sketch = _categorical(sketch)
+            _SKETCHES[version] = sketch
+            while len(_SKETCHES) > _MAX_VERSIONS:
+                _SKETCHES.pop(next(iter(_SKETCHES)))
+        return sketch
@@ -0,0 +1,23 @@
+# Cached figures are capped to the point budget once, before they are shared
+# between sessions; later cap_figure() calls (plotly_chart) leave them as cached.
+import numpy as np
+import plotly.graph_objects as go
+
+import chart_data
+
+def _line(n):
+    return go.Figure(go.Scatter(x=np.arange(n), y=np.sin(np.arange(n) / 50), mode='lines'))
+
+def test_cached_figures_are_capped_before_caching():
+    chart_data.clear_cache()
+    fig, data = chart_data.cached_figure(('test', 'capped'), lambda: (_line(50_000), {'n': 50_000}))
+    assert len(fig.data[0].x) <= chart_data.MAX_POINTS_PER_TRACE
+    assert data == {'n': 50_000}
+
+def test_cap_figure_leaves_cached_figures_untouched():
+    chart_data.clear_cache()
+    fig = chart_data.cached_figure(('test', 'untouched'), lambda: _line(50_000))
+    x = fig.data[0].x
+    assert chart_data.cap_figure(fig, max_points=100, max_per_trace=100) is fig
+    assert fig.data[0].x is x
+    assert chart_data.cached_figure(('test', 'untouched'), lambda: None) is fig
@@ -0,0 +1,104 @@
+# Properties of the mergeable / incremental states: merging partial states of
+# chunks gives the single-pass result, and persisted states carried forward
+# with new rows match a rebuild. Data is benchmark.synthetic_dataset, normalized
+# like the master CSV, so nothing under data/ is read or written.
+import pandas as pd
+import pytest
+
+from benchmark import synthetic_dataset
+from data_store import normalize_df_columns, coerce_master_types
+from dataset_schema import optimize_types
+import chunked
+import inventory
+import partition_store
+import rankings
+import rfm
+import sketches
+from rollups import build_cube
+
+@pytest.fixture(scope="module")
+def df():
+    return optimize_types(coerce_master_types(normalize_df_columns(synthetic_dataset(6_000, seed=7))))
+
+def chunks_of(df, rows):
+    return [df.iloc[i:i + rows] for i in range(0, len(df), rows)]
+
+def comparable(frame, keys):
+    """Frame sorted by `keys` with text / categorical columns as plain objects."""
+    out = frame.reset_index(drop=True)
+    for c in out.columns:
+        if not (pd.api.types.is_numeric_dtype(out[c]) or pd.api.types.is_datetime64_any_dtype(out[c])) \
+                or isinstance(out[c].dtype, pd.CategoricalDtype):
+            out[c] = out[c].astype(object).where(out[c].notna(), None)
+    return out.sort_values(keys).reset_index(drop=True)
+
+def assert_same(a, b, keys):
+    pd.testing.assert_frame_equal(comparable(a, keys), comparable(b, keys)[list(a.columns)], check_dtype=False)
+
+# -------------------------
+# HyperLogLog sketches
+# -------------------------
+def test_sketch_merge_is_order_independent(df):
+    parts = [sketches.sketch_state(c) for c in chunks_of(df, 1_700)]
+    forward = sketches.merge_sketches(parts)
+    backward = sketches.merge_sketches([parts[3], sketches.merge_sketches([parts[2], parts[1]]), parts[0]])
+    dims = [c for c in forward.columns if c != 'rank']
+    assert_same(forward, backward, dims)
+    # overlapping inputs are fine: max is idempotent
+    assert_same(forward, sketches.merge_sketches([forward, parts[1]]), dims)
+    assert_same(forward, sketches.sketch_state(df), dims)
+
+def test_sketch_estimates_within_error(df):
+    sketch = sketches.merge_sketches([sketches.sketch_state(c) for c in chunks_of(df, 1_000)])
+    exact = df['customer_id'].nunique()
+    assert abs(sketches.estimate(sketches.union(sketch)) - exact) <= 0.05 * exact  # ~3 standard errors
+    counts = sketches.customer_counts(sketch, {'region': ['South-West']})
+    exact = df.loc[(df['region'] == 'South-West').to_numpy(), 'customer_id'].nunique()
+    assert abs(counts['unique'] - exact) <= 0.05 * exact
+
+# -------------------------
+# Chunked aggregation
+# -------------------------
+def test_chunked_aggregates_equal_single_pass(df):
+    agg = chunked.aggregate_chunks(chunks_of(df, 700))  # 9 chunks: uneven binary-counter merges
+    assert agg.rows == len(df)
+    cube = build_cube(df)
+    assert_same(agg.cube, cube, [c for c in cube.columns if c in chunked.CUBE_DIMS])
+    assert_same(agg.inventory, inventory.compute_state(df), ['product_id', 'branch_id'])
+    cells = rankings.branch_cells(df)
+    assert_same(agg.branches, cells, [c for c in rankings.CELL_DIMS if c in cells.columns])
+    state = sketches.sketch_state(df)
+    assert_same(agg.sketches, state, [c for c in state.columns if c != 'rank'])
+
+# -------------------------
+# Incremental RFM
+# -------------------------
+def test_rfm_update_equals_full_compute(df):
+    ordered = df.sort_values('date', kind='stable').reset_index(drop=True)
+    cut = len(ordered) * 3 // 5
+    # the cut falls inside a day, so a customer's old last_date can reappear in the delta
+    assert ordered['date'].iat[cut - 1].normalize() == ordered['date'].iat[cut].normalize()
+    state = rfm.compute_state(ordered.iloc[:cut])
+    for delta in chunks_of(ordered.iloc[cut:], 800):
+        state = rfm.update_state(state, delta)
+    assert_same(state, rfm.compute_state(ordered), ['customer_id'])
+
+# -------------------------
+# Partition compaction
+# -------------------------
+def test_compact_round_trips_rows(df, tmp_path):
+    manifest = partition_store.new_manifest(df)
+    for batch in chunks_of(df, 2_000):  # every month gets one part per batch
+        partition_store.append_rows(partition_store.conform(batch, manifest), manifest, tmp_path)
+        partition_store.write_manifest(manifest, tmp_path)
+    before = {f for e in manifest['partitions'].values() if len(e['files']) > 1 for f in e['files']}
+    assert before
+    try:
+        assert partition_store.compact(tmp_path)
+        after = partition_store.read_manifest(tmp_path)
+        assert all(len(e['files']) == 1 for e in after['partitions'].values())
+        assert not any((tmp_path / f).exists() for f in before)
+        assert sum(e['rows'] for e in after['partitions'].values()) == len(df)
+        assert_same(partition_store.load_store(root=tmp_path), df, ['transaction_id'])
+    finally:
+        partition_store.clear_cache()
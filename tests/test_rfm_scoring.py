@@ -0,0 +1,26 @@
+# RFM scores must depend on a customer's values only, never on row order.
+import pandas as pd
+
+import rfm
+
+def state(frequency, monetary=None):
+    n = len(frequency)
+    return pd.DataFrame({'customer_id': [f"C{i}" for i in range(n)],
+                         'last_date': pd.Timestamp('2024-12-31') - pd.to_timedelta([i % 7 for i in range(n)], unit='D'),
+                         'frequency': frequency,
+                         'monetary': monetary if monetary is not None else [1000.0] * n})
+
+def test_equal_values_get_equal_scores():
+    # heavy ties like the demo data: most customers bought on a single day
+    scored = rfm.score(state([1] * 400 + [2] * 60 + [3] * 8 + [4]))
+    assert (scored.groupby('frequency')['f'].nunique() == 1).all()
+    assert (scored.groupby('recency')['r'].nunique() == 1).all()
+    assert scored['m'].nunique() == 1
+    assert (scored.loc[scored['frequency'] == 1, 'f'] == 1).all()
+    assert not scored.loc[scored['frequency'] == 1, 'segment'].isin(["Champions", "Loyal Customers"]).any()
+
+def test_scores_ignore_row_order():
+    base = state([1] * 50 + [2] * 20 + [3] * 5 + [5] * 2, monetary=[float(i % 13) for i in range(77)])
+    a = rfm.score(base).set_index('customer_id')
+    b = rfm.score(base.sample(frac=1, random_state=3)).set_index('customer_id').loc[a.index]
+    pd.testing.assert_frame_equal(a[['r', 'f', 'm', 'segment']], b[['r', 'f', 'm', 'segment']])